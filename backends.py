@@ -0,0 +1,179 @@
+# file backends.py
+"""Бэкенды инференса YOLO-моделей: PyTorch, ONNX Runtime и OpenVINO.
+
+Модели экспортируются один раз и кэшируются рядом с .pt-файлом под именем,
+содержащим хэш содержимого .pt, поэтому обновлённые веса экспортируются заново.
+Для всех бэкендов используется обёртка ultralytics.YOLO, так что формат
+результатов (Results.boxes.data) одинаков для всего остального кода.
+
+Сравнение бэкендов на своих кадрах:
+    python backends.py --backend onnx --images photos
+"""
+
+import argparse
+import glob
+import hashlib
+import logging
+import os
+import shutil
+import time
+
+import cv2
+import numpy as np
+
+logging.basicConfig(level=logging.DEBUG, format='%(asctime)s - %(levelname)s - %(message)s')
+
+BACKENDS = ('torch', 'onnx', 'openvino')
+
+
+def file_hash(path, length=12):
+    """Короткий sha256 содержимого файла"""
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(1 << 20), b''):
+            digest.update(chunk)
+    return digest.hexdigest()[:length]
+
+
+def exported_path(pt_path, backend):
+    """Путь к кэшированной экспортированной модели для .pt-файла"""
+    stem = os.path.splitext(pt_path)[0]
+    tag = file_hash(pt_path)
+    if backend == 'onnx':
+        return f"{stem}.{tag}.onnx"
+    if backend == 'openvino':
+        # ultralytics определяет формат OpenVINO по суффиксу каталога
+        return f"{stem}.{tag}_openvino_model"
+    raise ValueError(f"Unknown export backend: {backend}")
+
+
+def export_model(pt_path, backend, imgsz=640):
+    """Экспортирует модель в ONNX / OpenVINO IR, если в кэше ещё нет версии для этих весов"""
+    target = exported_path(pt_path, backend)
+    if os.path.exists(target):
+        return target
+
+    from ultralytics import YOLO
+
+    logging.info(f"Exporting {pt_path} to {backend}...")
+    started = time.time()
+    # dynamic=True - модель должна принимать пакеты кадров и кропы разного размера
+    produced = YOLO(pt_path).export(format=backend, imgsz=imgsz, dynamic=True)
+    if os.path.exists(target):
+        shutil.rmtree(target) if os.path.isdir(target) else os.remove(target)
+    shutil.move(produced, target)
+    logging.info(f"Exported {pt_path} -> {target} in {time.time() - started:.1f}s")
+    return target
+
+
+def load_detector(pt_path, backend='torch', device=None):
+    """Загружает YOLO-модель через выбранный бэкенд"""
+    from ultralytics import YOLO
+
+    if backend == 'torch':
+        model = YOLO(pt_path)
+        return model.to(device) if device else model
+    if backend not in BACKENDS:
+        raise ValueError(f"Unknown inference backend: {backend}")
+    return YOLO(export_model(pt_path, backend), task='detect')
+
+
+def box_iou(boxes_a, boxes_b):
+    """Матрица IoU между двумя наборами боксов [x1, y1, x2, y2, ...]"""
+    if not len(boxes_a) or not len(boxes_b):
+        return np.zeros((len(boxes_a), len(boxes_b)), dtype=np.float32)
+    a = np.asarray(boxes_a, dtype=np.float32)[:, :4]
+    b = np.asarray(boxes_b, dtype=np.float32)[:, :4]
+    w = np.clip(np.minimum(a[:, None, 2], b[None, :, 2]) - np.maximum(a[:, None, 0], b[None, :, 0]), 0, None)
+    h = np.clip(np.minimum(a[:, None, 3], b[None, :, 3]) - np.maximum(a[:, None, 1], b[None, :, 1]), 0, None)
+    inter = w * h
+    area_a = (a[:, 2] - a[:, 0]) * (a[:, 3] - a[:, 1])
+    area_b = (b[:, 2] - b[:, 0]) * (b[:, 3] - b[:, 1])
+    return inter / (area_a[:, None] + area_b[None, :] - inter + 1e-9)
+
+
+def match_detections(reference, candidate, iou_threshold=0.5):
+    """Жадно сопоставляет детекции кандидата с эталоном; возвращает (совпадения, IoU совпадений)"""
+    iou = box_iou(reference, candidate)
+    matched, ious = 0, []
+    while iou.size and iou.max() >= iou_threshold:
+        r, c = np.unravel_index(np.argmax(iou), iou.shape)
+        # Класс тоже должен совпасть
+        if int(reference[r, 5]) == int(candidate[c, 5]):
+            matched += 1
+            ious.append(float(iou[r, c]))
+            iou[r, :] = 0
+            iou[:, c] = 0
+        else:
+            iou[r, c] = 0
+    return matched, ious
+
+
+def load_images(folder):
+    paths = sorted(p for ext in ('*.jpg', '*.jpeg', '*.png', '*.bmp') for p in glob.glob(os.path.join(folder, ext)))
+    images = [(p, cv2.imread(p)) for p in paths]
+    return [(p, img) for p, img in images if img is not None]
+
+
+def run_detector(model, images, imgsz=640, warmup=2):
+    """Прогоняет модель по изображениям; возвращает детекции и задержки в мс"""
+    for _, img in images[:warmup]:
+        model(img, imgsz=imgsz, verbose=False)
+    detections, latencies = [], []
+    for _, img in images:
+        started = time.perf_counter()
+        result = model(img, imgsz=imgsz, verbose=False)[0]
+        latencies.append(1000.0 * (time.perf_counter() - started))
+        detections.append(result.boxes.data.cpu().numpy().reshape(-1, 6))
+    return detections, latencies
+
+
+def compare_backends(pt_path, backend, images, imgsz=640, iou_threshold=0.5):
+    """Сравнивает бэкенд с эталонным PyTorch-инференсом по задержке и совпадению детекций"""
+    reference, ref_latency = run_detector(load_detector(pt_path, 'torch', 'cpu'), images, imgsz)
+    candidate, cand_latency = run_detector(load_detector(pt_path, backend), images, imgsz)
+
+    total_ref = sum(len(d) for d in reference)
+    total_cand = sum(len(d) for d in candidate)
+    matched, ious = 0, []
+    for ref, cand in zip(reference, candidate):
+        m, frame_ious = match_detections(ref, cand, iou_threshold)
+        matched += m
+        ious.extend(frame_ious)
+
+    return {
+        'model': pt_path,
+        'backend': backend,
+        'torch_ms': float(np.median(ref_latency)),
+        'backend_ms': float(np.median(cand_latency)),
+        'speedup': float(np.median(ref_latency) / max(np.median(cand_latency), 1e-6)),
+        'recall': matched / total_ref if total_ref else 1.0,
+        'precision': matched / total_cand if total_cand else 1.0,
+        'mean_iou': float(np.mean(ious)) if ious else 0.0,
+    }
+
+
+def parse_args():
+    """Parse input arguments."""
+    parser = argparse.ArgumentParser(description='Compare YOLO inference backends against PyTorch')
+    parser.add_argument('--backend', choices=BACKENDS[1:], default='onnx')
+    parser.add_argument('--images', default='photos', help='Folder with test frames')
+    parser.add_argument('--models', nargs='+', default=None, help='.pt files to compare [both app models]')
+    parser.add_argument('--imgsz', type=int, default=640)
+    parser.add_argument('--iou_threshold', type=float, default=0.5)
+    return parser.parse_args()
+
+
+if __name__ == '__main__':
+    from models import COCO_MODEL_PATH, LICENSE_PLATE_MODEL_PATH
+
+    args = parse_args()
+    images = load_images(args.images)
+    if not images:
+        raise SystemExit(f"No images found in {args.images}")
+
+    for pt_path in args.models or [COCO_MODEL_PATH, LICENSE_PLATE_MODEL_PATH]:
+        report = compare_backends(pt_path, args.backend, images, args.imgsz, args.iou_threshold)
+        print("%s [%s]: torch %.1f ms, %s %.1f ms (x%.2f), recall %.3f, precision %.3f, mean IoU %.3f" % (
+            report['model'], report['backend'], report['torch_ms'], report['backend'], report['backend_ms'],
+            report['speedup'], report['recall'], report['precision'], report['mean_iou']))
@@ -0,0 +1,137 @@
+# file capture.py
+
+import logging
+import os
+import threading
+import time
+
+import cv2
+
+logging.basicConfig(level=logging.DEBUG, format='%(asctime)s - %(levelname)s - %(message)s')
+
+
+class CameraReader:
+    """Читает кадры из cv2.VideoCapture в отдельном потоке и хранит только самый свежий кадр.
+
+    Интерфейс совместим с cv2.VideoCapture в той части, которую использует VideoApp:
+    read(), isOpened() и release(). read() никогда не блокируется на сети.
+    """
+
+    def __init__(self, source, name=None, reconnect_delay=2.0):
+        self.source = source
+        self.name = name if name is not None else str(source)
+        self.reconnect_delay = reconnect_delay
+        # Видеофайл читаем с его собственной частотой кадров, а не с максимальной скоростью декодирования
+        self.is_file = isinstance(source, str) and os.path.isfile(source)
+
+        self.cap = cv2.VideoCapture(source)
+        self.frame_interval = 0.0
+        if self.is_file and self.cap.isOpened():
+            fps = self.cap.get(cv2.CAP_PROP_FPS)
+            self.frame_interval = 1.0 / fps if fps and fps > 0 else 1.0 / 25
+
+        self._lock = threading.Lock()
+        self._frame = None
+        self._timestamp = 0.0
+        self._seq = 0
+        self._last_read_seq = 0
+
+        self.frames_read = 0
+        self.dropped_frames = 0
+        self.reconnects = 0
+
+        self._stop_event = threading.Event()
+        self._thread = None
+
+    def start(self):
+        """Запускает поток чтения; возвращает self для цепочки вызовов"""
+        if self._thread is None and self.cap.isOpened():
+            self._thread = threading.Thread(target=self._run, name=f"capture-{self.name}", daemon=True)
+            self._thread.start()
+        return self
+
+    def _run(self):
+        try:
+            self._read_loop()
+        finally:
+            self.cap.release()
+
+    def _read_loop(self):
+        while not self._stop_event.is_set():
+            started = time.time()
+            ret, frame = self.cap.read()
+
+            if not ret or frame is None:
+                if self.is_file:
+                    logging.info(f"End of video file: {self.source}")
+                    break
+                logging.warning(f"Camera {self.name} stopped delivering frames, reconnecting")
+                self._reconnect()
+                continue
+
+            with self._lock:
+                # Предыдущий кадр так и не был забран обработкой - считаем его потерянным
+                if self._seq > self._last_read_seq:
+                    self.dropped_frames += 1
+                self._frame = frame
+                self._timestamp = started
+                self._seq += 1
+                self.frames_read += 1
+
+            if self.frame_interval:
+                remaining = self.frame_interval - (time.time() - started)
+                if remaining > 0:
+                    self._stop_event.wait(remaining)
+
+    def _reconnect(self):
+        self.reconnects += 1
+        self.cap.release()
+        if self._stop_event.wait(self.reconnect_delay):
+            return
+        self.cap = cv2.VideoCapture(self.source)
+        if not self.cap.isOpened():
+            logging.error(f"Error reopening video stream for camera: {self.name}")
+
+    def read(self):
+        """Возвращает (True, кадр), если с прошлого вызова пришёл новый кадр, иначе (False, None)"""
+        ret, frame, _ = self.read_timestamped()
+        return ret, frame
+
+    def read_timestamped(self):
+        """Как read(), но дополнительно возвращает время захвата кадра"""
+        with self._lock:
+            if self._frame is None or self._seq == self._last_read_seq:
+                return False, None, 0.0
+            self._last_read_seq = self._seq
+            return True, self._frame, self._timestamp
+
+    def latest(self):
+        """Возвращает (кадр, время захвата, номер кадра) без отметки о прочтении"""
+        with self._lock:
+            return self._frame, self._timestamp, self._seq
+
+    def stats(self):
+        """Счётчики прочитанных и потерянных кадров и переподключений"""
+        with self._lock:
+            return {'frames_read': self.frames_read, 'dropped_frames': self.dropped_frames,
+                    'reconnects': self.reconnects}
+
+    def isOpened(self):
+        return self._thread is not None and self._thread.is_alive()
+
+    def release(self):
+        self._stop_event.set()
+        if self._thread is None:
+            self.cap.release()
+        elif self._thread is not threading.current_thread():
+            # VideoCapture освобождает сам поток чтения, чтобы не закрыть его посреди cap.read()
+            self._thread.join(timeout=2.0)
+
+
+def open_camera(source, name=None):
+    """Создаёт и запускает CameraReader; возвращает None, если источник не открылся"""
+    reader = CameraReader(source, name=name)
+    if not reader.cap.isOpened():
+        reader.cap.release()
+        return None
+    return reader.start()
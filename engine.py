@@ -0,0 +1,217 @@
+# file engine.py
+
+import logging
+import threading
+import time
+
+import cv2
+import numpy as np
+from PIL import ImageFont, ImageDraw, Image
+from PyQt5.QtCore import QThread, pyqtSignal
+
+from pipeline import RecognitionPipeline
+
+logging.basicConfig(level=logging.DEBUG, format='%(asctime)s - %(levelname)s - %(message)s')
+
+
+class ModelLoader(QThread):
+    """Загрузка моделей в фоне, чтобы окно показывалось сразу, не дожидаясь загрузки весов"""
+
+    models_loaded = pyqtSignal(object, object, object)  # детектор ТС, детектор номеров, время загрузки моделей
+    loading_failed = pyqtSignal(str)
+
+    def __init__(self, model_options=None, parent=None):
+        super().__init__(parent)
+        self.model_options = model_options or {}
+
+    def run(self):
+        from models import load_models
+
+        timings = {}
+        try:
+            coco_model, license_plate_detector = load_models(timings=timings, **self.model_options)
+        except Exception as e:
+            logging.error(f"Error loading models: {e}")
+            self.loading_failed.emit(str(e))
+            return
+        self.models_loaded.emit(coco_model, license_plate_detector, timings)
+
+
+class ProcessingEngine(QThread):
+    """Поток обработки кадров: RecognitionPipeline и отрисовка результата вне GUI-потока.
+
+    GUI передаёт кадры через submit_frame(), а готовые кадры и распознанные номера
+    получает обратно через сигналы frame_processed и plate_recognized. Модели
+    могут быть переданы позже через set_models(); до этого кадры не принимаются.
+    """
+
+    frame_processed = pyqtSignal(int, object)  # индекс камеры, обработанный кадр (BGR)
+    plate_recognized = pyqtSignal(object, str, float)  # camera_id, номер, уверенность
+    processing_failed = pyqtSignal(str)
+
+    def __init__(self, coco_model, license_plate_detector, trackers, vehicles, read_license_plate,
+                 insert_car_data, pipeline_options=None, parent=None):
+        super().__init__(parent)
+        self.pipeline = RecognitionPipeline(coco_model, license_plate_detector, trackers, vehicles,
+                                            read_license_plate=read_license_plate,
+                                            insert_car_data=insert_car_data,
+                                            **(pipeline_options or {}))
+
+        # Настройки, которые меняет GUI
+        self.show_fps = True
+
+        # Для каждой камеры храним только последний отправленный кадр
+        self._pending = {}
+        self._released = []  # камеры, состояние которых надо освободить в потоке обработки
+        self._condition = threading.Condition()
+        self._running = False
+        self.dropped_frames = 0
+
+        try:
+            self.font = ImageFont.truetype("DejaVuSans.ttf", 24)
+            self.font_small = ImageFont.truetype("DejaVuSans.ttf", 18)
+        except:
+            self.font = ImageFont.load_default()
+            self.font_small = ImageFont.load_default()
+            logging.warning("DejaVuSans.ttf not found, using default font")
+
+    @property
+    def models_ready(self):
+        return self.pipeline.coco_model is not None and self.pipeline.license_plate_detector is not None
+
+    def set_models(self, coco_model, license_plate_detector):
+        """Подключает загруженные в фоне модели"""
+        with self._condition:
+            self.pipeline.coco_model = coco_model
+            self.pipeline.license_plate_detector = license_plate_detector
+
+    def submit_frame(self, idx, frame, camera_id, camera_name):
+        """Ставит кадр камеры в обработку, заменяя ещё не обработанный кадр этой же камеры"""
+        with self._condition:
+            if not self.models_ready:
+                return
+            if idx in self._pending:
+                self.dropped_frames += 1
+            self._pending[idx] = (frame, camera_id, camera_name)
+            self._condition.notify()
+
+    def clear_pending(self):
+        """Отбрасывает кадры, ожидающие обработки (например, при отключении камер)"""
+        with self._condition:
+            self._pending.clear()
+
+    def release_cameras(self, camera_ids=None):
+        """Освобождает трекеры и состояние номеров отключённых камер (None - всех камер)"""
+        with self._condition:
+            self._released.append(camera_ids)
+            self._condition.notify()
+
+    def apply_releases(self, releases):
+        for camera_ids in releases:
+            for camera_id in (self.pipeline.trackers.camera_ids() if camera_ids is None else camera_ids):
+                self.pipeline.release_camera(camera_id)
+
+    def stop(self):
+        with self._condition:
+            self._running = False
+            self._condition.notify()
+        self.wait()
+        self.pipeline.close()
+
+    def run(self):
+        with self._condition:
+            self._running = True
+
+        while True:
+            with self._condition:
+                while self._running and not self._pending and not self._released:
+                    self._condition.wait()
+                if not self._running:
+                    break
+                jobs, self._pending = self._pending, {}
+                releases, self._released = self._released, []
+
+            try:
+                self.apply_releases(releases)
+                if jobs:
+                    self.process_jobs(jobs)
+            except RuntimeError as e:
+                if "CUDA out of memory" in str(e):
+                    logging.error("CUDA memory error - trying to recover")
+                    import torch
+                    torch.cuda.empty_cache()
+                else:
+                    logging.error(f"Runtime error in processing engine: {e}")
+            except Exception as e:
+                logging.error(f"Unexpected error in processing engine: {e}")
+                self.processing_failed.emit(str(e))
+
+    def process_jobs(self, jobs):
+        """Обрабатывает свежие кадры всех камер одним пакетом и отправляет результат в GUI"""
+        start_time = time.time()
+        indices = list(jobs)
+        results = self.pipeline.process_batch([(jobs[idx][1], jobs[idx][0]) for idx in indices])
+
+        for idx, result in zip(indices, results):
+            frame, camera_id, camera_name = jobs[idx]
+            for track_id, plate_text, plate_score in result['plates']:
+                self.plate_recognized.emit(camera_id, plate_text, plate_score)
+
+            processed_frame = self.render_frame(frame, result, camera_name, start_time)
+            self.frame_processed.emit(idx, processed_frame)
+
+    def render_frame(self, frame, result, camera_name, start_time):
+        """Рисует рамки ТС, номера треков, FPS и название камеры"""
+        font = self.font
+        font_small = self.font_small
+
+        # Конвертируем в PIL изображение для работы со шрифтами
+        pil_img = Image.fromarray(cv2.cvtColor(frame, cv2.COLOR_BGR2RGB))
+        draw = ImageDraw.Draw(pil_img)
+
+        # Рисуем bounding box автомобилей; на кадрах без детекции - предсказанные боксы треков
+        boxes = result['vehicle_boxes'] if result['detected'] else result['tracks']
+        for x1, y1, x2, y2, _ in boxes:
+            draw.rectangle([x1, y1, x2, y2], outline=(0, 255, 0), width=2)
+
+        # Визуализация номеров на автомобилях
+        for track in result['tracks']:
+            x1, y1, x2, y2, track_id = track
+            plate_info = self.pipeline.tracked_plates.get(track_id)
+
+            if plate_info:
+                text = f"{plate_info['plate_text']} ({plate_info['plate_score']:.2f})"
+                text_bbox = draw.textbbox((0, 0), text, font=font)
+
+                # Рисуем подложку
+                draw.rectangle(
+                    [x1, y1 - (text_bbox[3] - text_bbox[1]) - 10,
+                     x1 + (text_bbox[2] - text_bbox[0]) + 10, y1],
+                    fill=(0, 0, 255))
+
+                # Рисуем текст номера
+                draw.text(
+                    (x1 + 5, y1 - (text_bbox[3] - text_bbox[1]) - 5),
+                    text,
+                    font=font,
+                    fill=(255, 255, 255))
+
+        # Отображение FPS
+        if self.show_fps:
+            fps = 1.0 / (time.time() - start_time)
+            fps_text = f"FPS: {fps:.2f}"
+            fps_bbox = draw.textbbox((0, 0), fps_text, font=font_small)
+            draw.rectangle(
+                [10, 10, 10 + (fps_bbox[2] - fps_bbox[0]) + 10, 10 + (fps_bbox[3] - fps_bbox[1]) + 10],
+                fill=(0, 0, 0, 128))
+            draw.text((15, 15), fps_text, font=font_small, fill=(0, 255, 0))
+
+        # Отображение названия камеры
+        name_bbox = draw.textbbox((0, 0), camera_name, font=font_small)
+        draw.rectangle(
+            [10, 40, 10 + (name_bbox[2] - name_bbox[0]) + 10, 40 + (name_bbox[3] - name_bbox[1]) + 10],
+            fill=(0, 0, 0, 128))
+        draw.text((15, 45), camera_name, font=font_small, fill=(255, 255, 255))
+
+        # Конвертируем обратно в OpenCV формат
+        return cv2.cvtColor(np.array(pil_img), cv2.COLOR_RGB2BGR)
@@ -0,0 +1,320 @@
+# file headless.py
+"""Распознавание номеров с нескольких камер без GUI и без отрисовки кадров.
+
+Примеры запуска:
+    python main.py --headless rtsp://192.168.1.10/stream 3=http://192.168.1.106:4747/video
+    python headless.py --config cameras.json
+
+Формат конфига (JSON):
+    {
+        "cameras": [{"id": 3, "name": "Въезд", "url": "rtsp://...", "tracker": {"max_age": 5, "association": "auto", "solver": "greedy"}}, "http://..."],
+        "pipeline": {"recognition_threshold": 0.85, "ocr_mode": "recognize", "ocr_processes": 2},
+        "tracker": {"max_age": 1, "min_hits": 3, "iou_threshold": 0.3},
+        "workers": {"enabled": true, "cameras_per_process": 1},
+        "backend": "onnx",
+        "int8_plates": true, "calibration_images": "photos", "plate_eval_images": "photos_eval",
+        "min_plate_recall": 0.95,
+        "ocr_backend": "crnn", "ocr_model": "models/plate_crnn.onnx", "preprocess": ["deskew", "resize"],
+        "log_interval": 10
+    }
+"""
+
+import argparse
+import json
+import logging
+import signal
+import time
+
+from capture import open_camera
+from models import load_models, prepare_models
+from pipeline import RecognitionPipeline
+from tracking import TrackerRegistry
+from util import insert_car_data
+from workers import WorkerPool
+
+logging.basicConfig(level=logging.DEBUG, format='%(asctime)s - %(levelname)s - %(message)s')
+
+
+def parse_camera(spec):
+    """Разбирает описание камеры: строку "URL", "ID=URL" или словарь из конфига"""
+    if isinstance(spec, dict):
+        camera = dict(spec)
+    elif '=' in spec.split('://', 1)[0]:
+        camera_id, url = spec.split('=', 1)
+        camera = {'id': int(camera_id) if camera_id.isdigit() else camera_id, 'url': url}
+    else:
+        camera = {'url': spec}
+
+    url = camera['url']
+    # USB-камеры задаются индексом
+    if isinstance(url, str) and url.isdigit():
+        camera['url'] = int(url)
+    camera.setdefault('name', str(camera.get('id', url)))
+    camera.setdefault('id', camera['name'])
+    return camera
+
+
+def load_config(path):
+    """Читает JSON-конфиг headless-режима"""
+    with open(path, encoding='utf-8') as f:
+        return json.load(f)
+
+
+class CameraStats:
+    """Счётчики пропускной способности одной камеры за интервал логирования"""
+
+    def __init__(self):
+        self.frames = 0
+        self.plates = 0
+        self.busy_time = 0.0
+        self.last_dropped = 0
+        self.last_read = 0
+        self.reconnects = 0
+
+    def report(self, name, reader, interval):
+        capture = reader.stats()
+        captured = capture['frames_read'] - self.last_read
+        dropped = capture['dropped_frames'] - self.last_dropped
+        avg_ms = 1000.0 * self.busy_time / self.frames if self.frames else 0.0
+        logging.info(
+            f"[{name}] processed {self.frames / interval:.2f} fps, captured {captured / interval:.2f} fps, "
+            f"dropped {dropped}, plates {self.plates}, {avg_ms:.1f} ms/frame")
+        self.frames = 0
+        self.plates = 0
+        self.busy_time = 0.0
+        self.last_read = capture['frames_read']
+        self.last_dropped = capture['dropped_frames']
+
+
+def open_readers(cameras):
+    readers = []
+    for camera in cameras:
+        reader = open_camera(camera['url'], name=camera['name'])
+        if reader is None:
+            logging.error(f"Error opening video stream for camera: {camera['url']}")
+            continue
+        readers.append((camera, reader, CameraStats()))
+    return readers
+
+
+def install_stop_handlers():
+    stop = []
+    signal.signal(signal.SIGINT, lambda *_: stop.append(True))
+    signal.signal(signal.SIGTERM, lambda *_: stop.append(True))
+    return stop
+
+
+def tracker_options_for(cameras, config):
+    """Настройки TrackerRegistry: общие из ключа tracker конфига и свои у камер с ключом tracker"""
+    options = dict(config.get('tracker', {}))
+    camera_options = {camera['id']: camera['tracker'] for camera in cameras if camera.get('tracker')}
+    if camera_options:
+        options['camera_options'] = camera_options
+    return options
+
+
+def run(cameras, pipeline_options=None, log_interval=10.0, save_to_db=True, model_options=None,
+        tracker_options=None):
+    """Основной цикл: берёт самый свежий кадр каждой камеры и прогоняет его через конвейер"""
+    readers = open_readers(cameras)
+    if not readers:
+        logging.error("No cameras could be opened")
+        return 1
+
+    model_options = model_options or {}
+    # С пулом OCR распознавание идёт в его процессах, бэкенд OCR здесь не нужен
+    load_ocr = not (pipeline_options or {}).get('ocr_processes')
+    coco_model, license_plate_detector = load_models(load_ocr=load_ocr, **model_options)
+    logging.info(f"Models loaded successfully ({model_options.get('backend', 'torch')} backend).")
+
+    pipeline = RecognitionPipeline(
+        coco_model, license_plate_detector, TrackerRegistry(**(tracker_options or {})),
+        insert_car_data=insert_car_data if save_to_db else None,
+        **(pipeline_options or {}))
+
+    stop = install_stop_handlers()
+
+    logging.info(f"Headless recognition started for {len(readers)} camera(s)")
+    last_report = time.time()
+    try:
+        while not stop:
+            # Собираем самые свежие кадры всех камер и обрабатываем их одним пакетом
+            batch = []
+            for camera, reader, stats in readers:
+                if reader.reconnects != stats.reconnects:
+                    # После обрыва потока старые треки камеры уже не совпадут с новыми кадрами
+                    stats.reconnects = reader.reconnects
+                    pipeline.release_camera(camera['id'])
+                ret, frame = reader.read()
+                if ret:
+                    batch.append((camera, stats, frame))
+
+            if batch:
+                started = time.time()
+                try:
+                    results = pipeline.process_batch([(camera['id'], frame) for camera, _, frame in batch])
+                except Exception as e:
+                    logging.error(f"Error processing batch of {len(batch)} frame(s): {e}")
+                    results = []
+                elapsed = time.time() - started
+                for (camera, stats, _), result in zip(batch, results):
+                    # Время пакета делится поровну между камерами, попавшими в него
+                    stats.busy_time += elapsed / len(batch)
+                    stats.frames += 1
+                    stats.plates += len(result['plates'])
+                    for _, plate_text, plate_score in result['plates']:
+                        logging.info(f"[{camera['name']}] plate {plate_text} ({plate_score:.2f})")
+
+            now = time.time()
+            if now - last_report >= log_interval:
+                for camera, reader, stats in readers:
+                    stats.report(camera['name'], reader, now - last_report)
+                if pipeline.ocr_cache is not None:
+                    cache = pipeline.ocr_cache.stats()
+                    logging.info(f"OCR cache: hit rate {cache['hit_rate']:.1%}, hits {cache['hits']}, "
+                                 f"misses {cache['misses']}, expired {cache['expired']}, "
+                                 f"collisions {cache['collisions']}, size {cache['size']}")
+                if pipeline.min_plate_quality is not None:
+                    logging.info(f"Plate quality gate: {pipeline.quality_rejected} crop(s) skipped OCR")
+                if pipeline.ocr_pool is not None:
+                    logging.info(f"OCR pool: {len(pipeline.ocr_pool.pending)} request(s) in flight, "
+                                 f"{pipeline.ocr_pool_dropped} crop(s) dropped while busy, "
+                                 f"{pipeline.ocr_pool.expired} request(s) expired, "
+                                 f"{pipeline.ocr_pool.restarts} worker restart(s)")
+                assignment = pipeline.trackers.assignment_stats()
+                if assignment:
+                    logging.info(f"Tracker assignment paths: {dict(assignment)}")
+                last_report = now
+
+            if not batch:
+                # Новых кадров нет ни у одной камеры - не крутим цикл вхолостую
+                time.sleep(0.005)
+    finally:
+        pipeline.close()
+        for _, reader, _ in readers:
+            reader.release()
+        logging.info("Headless recognition stopped")
+    return 0
+
+
+def run_multiprocess(cameras, pipeline_options=None, log_interval=10.0, save_to_db=True, model_options=None,
+                     cameras_per_process=1, tracker_options=None):
+    """Как run(), но инференс идёт в отдельных процессах; кадры передаются через разделяемую память"""
+    readers = open_readers(cameras)
+    if not readers:
+        logging.error("No cameras could be opened")
+        return 1
+
+    by_id = {camera['id']: (camera, reader, stats) for camera, reader, stats in readers}
+    prepare_models(**(model_options or {}))
+    pool = WorkerPool(by_id.keys(), cameras_per_process=cameras_per_process, pipeline_options=pipeline_options,
+                      save_to_db=save_to_db, model_options=model_options,
+                      tracker_options=tracker_options).start()
+    stop = install_stop_handlers()
+
+    logging.info(f"Headless recognition started for {len(readers)} camera(s) in worker processes")
+    last_report = time.time()
+    try:
+        while not stop:
+            if not pool.is_alive():
+                logging.error("All worker processes exited")
+                return 1
+
+            # Передаём воркерам самые свежие кадры; отстающий воркер просто пропустит промежуточные
+            for camera, reader, stats in readers:
+                if reader.reconnects != stats.reconnects:
+                    # Трекер и голоса за номера камеры живут в процессе-воркере
+                    stats.reconnects = reader.reconnects
+                    pool.release_camera(camera['id'])
+                ret, frame, timestamp = reader.read_timestamped()
+                if ret:
+                    pool.submit(camera['id'], frame, timestamp)
+
+            for record in pool.poll(timeout=0.005):
+                camera, _, stats = by_id[record['camera_id']]
+                # В этом режиме ms/frame - полная задержка от захвата кадра до результата
+                stats.busy_time += time.time() - record['timestamp']
+                stats.frames += 1
+                stats.plates += len(record['plates'])
+                for _, plate_text, plate_score in record['plates']:
+                    logging.info(f"[{camera['name']}] plate {plate_text} ({plate_score:.2f})")
+
+            now = time.time()
+            if now - last_report >= log_interval:
+                for camera, reader, stats in readers:
+                    stats.report(camera['name'], reader, now - last_report)
+                last_report = now
+    finally:
+        pool.stop()
+        for _, reader, _ in readers:
+            reader.release()
+        logging.info("Headless recognition stopped")
+    return 0
+
+
+def parse_args(argv=None):
+    """Parse input arguments."""
+    parser = argparse.ArgumentParser(description='Headless license plate recognition')
+    parser.add_argument('cameras', nargs='*', help='Camera URLs or USB indexes, optionally as ID=URL')
+    parser.add_argument('--config', help='JSON config with cameras and pipeline options')
+    parser.add_argument('--log_interval', type=float, default=None,
+                        help='Seconds between per-camera throughput reports [10]')
+    parser.add_argument('--no_db', dest='save_to_db', action='store_false',
+                        help='Do not write recognized plates to the database')
+    parser.add_argument('--backend', choices=['torch', 'onnx', 'openvino'], default=None,
+                        help='Inference backend for both YOLO models [torch]')
+    parser.add_argument('--int8_plates', action='store_true', default=None,
+                        help='Use the INT8-quantized plate detector if it passes the recall check')
+    parser.add_argument('--calibration_images', default=None,
+                        help='Frames for INT8 calibration [photos]')
+    parser.add_argument('--plate_eval_images', default=None,
+                        help='Frames for the INT8 recall check [held-out part of --calibration_images]')
+    parser.add_argument('--min_plate_recall', type=float, default=None,
+                        help='Minimum INT8 plate detector recall vs FP32 [0.95]')
+    parser.add_argument('--ocr_backend', choices=['easyocr', 'crnn'], default=None,
+                        help='Plate OCR backend [easyocr]')
+    parser.add_argument('--ocr_model', default=None, help='ONNX model for the crnn OCR backend')
+    parser.add_argument('--preprocess', nargs='*', default=None, choices=['deskew', 'resize', 'contrast'],
+                        help='Plate crop preprocessing steps before OCR [resize]')
+    parser.add_argument('--processes', action='store_true',
+                        help='Run inference in worker processes fed through shared memory')
+    parser.add_argument('--cameras_per_process', type=int, default=None,
+                        help='Cameras handled by one worker process in --processes mode [1]')
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    config = load_config(args.config) if args.config else {}
+
+    cameras = [parse_camera(spec) for spec in config.get('cameras', []) + args.cameras]
+    if not cameras:
+        logging.error("No cameras given: pass URLs on the command line or use --config")
+        return 2
+
+    log_interval = args.log_interval if args.log_interval is not None else config.get('log_interval', 10.0)
+
+    model_options = {
+        'backend': args.backend or config.get('backend', 'torch'),
+        'int8_plates': args.int8_plates or config.get('int8_plates', False),
+        'calibration_folder': args.calibration_images or config.get('calibration_images', 'photos'),
+        'plate_eval_folder': args.plate_eval_images or config.get('plate_eval_images'),
+        'min_plate_recall': (args.min_plate_recall if args.min_plate_recall is not None
+                             else config.get('min_plate_recall')),
+        'ocr_backend': args.ocr_backend or config.get('ocr_backend', 'easyocr'),
+        'ocr_model': args.ocr_model or config.get('ocr_model'),
+        'preprocess_steps': args.preprocess if args.preprocess is not None else config.get('preprocess'),
+    }
+
+    tracker_options = tracker_options_for(cameras, config)
+
+    workers = config.get('workers', {})
+    if args.processes or workers.get('enabled'):
+        cameras_per_process = args.cameras_per_process or workers.get('cameras_per_process', 1)
+        return run_multiprocess(cameras, config.get('pipeline'), log_interval, args.save_to_db, model_options,
+                                cameras_per_process, tracker_options)
+    return run(cameras, config.get('pipeline'), log_interval, args.save_to_db, model_options, tracker_options)
+
+
+if __name__ == '__main__':
+    raise SystemExit(main())
@@ -1,35 +1,76 @@
 import sys
+import argparse
 import logging
 
-import torch
-from PyQt5.QtWidgets import QApplication
-from sort.sort import Sort
-from ultralytics import YOLO
-from ui import VideoApp
+from pipeline import VEHICLE_CLASSES
 from util import read_license_plate, get_car, insert_car_data
 
 # Configure logging
 logging.basicConfig(level=logging.DEBUG, format='%(asctime)s - %(levelname)s - %(message)s')
 
 def main():
-    try:
-        # Load models
-        coco_model = YOLO('models/yolo11n.pt').to('cuda' if torch.cuda.is_available() else 'cpu')
-        license_plate_detector = YOLO('models/license_plate_detector.pt').to('cuda' if torch.cuda.is_available() else 'cpu')
-        logging.info("Models loaded successfully.")
-    except Exception as e:
-        logging.error(f"Error loading models: {e}")
-        sys.exit(1)
-
-    mot_tracker = Sort()
-    vehicles = [2, 3, 5, 7]  # IDs of vehicles in COCO
-
-    app = QApplication(sys.argv)
-    window = VideoApp(coco_model, license_plate_detector, mot_tracker,
-                     vehicles, get_car, read_license_plate, insert_car_data)
+    # Qt импортируется только для GUI, чтобы headless-режим работал на серверах без X
+    from PyQt5.QtWidgets import QApplication
+    from engine import ModelLoader
+    from models import configure_ocr
+    from tracking import TrackerRegistry
+    from ui import VideoApp
+
+    parser = argparse.ArgumentParser(description='Vehicle & License Plate Recognition')
+    parser.add_argument('--backend', choices=['torch', 'onnx', 'openvino'], default='torch',
+                        help='Inference backend for both YOLO models [torch]')
+    parser.add_argument('--int8_plates', action='store_true',
+                        help='Use the INT8-quantized plate detector if it passes the recall check')
+    parser.add_argument('--calibration_images', default='photos',
+                        help='Frames for INT8 calibration [photos]')
+    parser.add_argument('--plate_eval_images', default=None,
+                        help='Frames for the INT8 recall check [held-out part of --calibration_images]')
+    parser.add_argument('--min_plate_recall', type=float, default=0.95,
+                        help='Minimum INT8 plate detector recall vs FP32 [0.95]')
+    parser.add_argument('--ocr_backend', choices=['easyocr', 'crnn'], default='easyocr',
+                        help='Plate OCR backend [easyocr]')
+    parser.add_argument('--ocr_model', default=None, help='ONNX model for the crnn OCR backend')
+    parser.add_argument('--preprocess', nargs='*', default=None, choices=['deskew', 'resize', 'contrast'],
+                        help='Plate crop preprocessing steps before OCR [resize]')
+    parser.add_argument('--ocr_processes', type=int, default=0,
+                        help='Run OCR asynchronously in this many worker processes [0 - inline]')
+    args, qt_args = parser.parse_known_args()
+
+    model_options = {
+        'backend': args.backend,
+        'int8_plates': args.int8_plates,
+        'calibration_folder': args.calibration_images,
+        'plate_eval_folder': args.plate_eval_images,
+        'min_plate_recall': args.min_plate_recall,
+        'ocr_backend': args.ocr_backend,
+        'ocr_model': args.ocr_model,
+        'preprocess_steps': args.preprocess,
+        # С пулом OCR распознавание идёт в его процессах, бэкенд OCR в GUI не загружается
+        'load_ocr': not args.ocr_processes,
+    }
+    # Бэкенд OCR выбирается до создания конвейера: процессы пула OCR повторяют его настройки
+    configure_ocr(args.ocr_backend, args.ocr_model, args.preprocess)
+
+    trackers = TrackerRegistry()  # отдельный SORT для каждой камеры
+    vehicles = VEHICLE_CLASSES  # IDs of vehicles in COCO
+
+    app = QApplication(sys.argv[:1] + qt_args)
+    # Окно показывается сразу, модели загружаются параллельно в фоне
+    window = VideoApp(None, None, trackers,
+                     vehicles, get_car, read_license_plate, insert_car_data,
+                     pipeline_options={'ocr_processes': args.ocr_processes},
+                     model_loader=ModelLoader(model_options))
     window.show()
     logging.info("Application started.")
     sys.exit(app.exec_())
 
+def main_headless(argv=None):
+    """Запуск распознавания без GUI: python main.py --headless URL [URL ...] | --config cameras.json"""
+    import headless
+    sys.exit(headless.main(argv))
+
 if __name__ == "__main__":
-    main()
+    if "--headless" in sys.argv[1:]:
+        main_headless([arg for arg in sys.argv[1:] if arg != "--headless"])
+    else:
+        main()
@@ -0,0 +1,118 @@
+# file models.py
+
+import logging
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+import ocr
+import plate_preprocess
+from backends import load_detector, export_model
+
+logging.basicConfig(level=logging.DEBUG, format='%(asctime)s - %(levelname)s - %(message)s')
+
+COCO_MODEL_PATH = 'models/yolo11n.pt'
+LICENSE_PLATE_MODEL_PATH = 'models/license_plate_detector.pt'
+WARMUP_FRAME_SHAPE = (640, 640, 3)
+
+
+def get_device():
+    """Устройство для инференса: CUDA, если доступна, иначе CPU"""
+    import torch  # torch импортируется долго, поэтому только при загрузке моделей
+    return 'cuda' if torch.cuda.is_available() else 'cpu'
+
+
+def warmup_detector(model):
+    """Прогон на пустом кадре: инициализация ядер и выделение памяти до прихода первых кадров"""
+    model(np.zeros(WARMUP_FRAME_SHAPE, dtype=np.uint8), verbose=False)
+
+
+def warmup_ocr(backend):
+    backend.read_batch([np.zeros((ocr.OCR_HEIGHT, 4 * ocr.OCR_HEIGHT), dtype=np.uint8)])
+
+
+def configure_ocr(ocr_backend='easyocr', ocr_model=None, preprocess_steps=None):
+    """Выбирает бэкенд OCR и шаги предобработки без загрузки моделей"""
+    ocr.configure(ocr_backend, model_path=ocr_model if ocr_backend == 'crnn' else None)
+    if preprocess_steps is not None:
+        plate_preprocess.set_preprocess_steps(preprocess_steps)
+
+
+def _load_timed(name, load, warmup, timings):
+    """Загружает модель и прогревает её; время загрузки и прогрева пишется в timings[name]"""
+    started = time.perf_counter()
+    model = load()
+    loaded = time.perf_counter()
+    if warmup is not None:
+        warmup(model)
+    finished = time.perf_counter()
+    timings[name] = {'load_s': loaded - started, 'warmup_s': finished - loaded}
+    logging.info(f"Loaded {name} in {loaded - started:.2f}s, warm-up {finished - loaded:.2f}s")
+    return model
+
+
+def load_models(coco_path=COCO_MODEL_PATH, license_plate_path=LICENSE_PLATE_MODEL_PATH, backend='torch',
+                int8_plates=False, calibration_folder='photos', min_plate_recall=None,
+                ocr_backend='easyocr', ocr_model=None, preprocess_steps=None, warmup=True, timings=None,
+                load_ocr=True, plate_eval_folder=None):
+    """Загружает детектор транспортных средств, детектор номерных знаков и бэкенд OCR.
+
+    Все три модели загружаются параллельно в отдельных потоках: загрузка весов
+    и инициализация torch/ONNX Runtime в основном отпускают GIL.
+
+    backend: 'torch' (по умолчанию), 'onnx' или 'openvino' - см. backends.py
+    int8_plates: INT8-детектор номеров (quantize.py), если его recall не ниже min_plate_recall
+      (None - quantize.DEFAULT_MIN_RECALL) на кадрах plate_eval_folder (None - отложенная часть calibration_folder)
+    ocr_backend: 'easyocr' или 'crnn' (ONNX-модель ocr_model) - см. ocr.py
+    preprocess_steps: шаги предобработки кропов перед OCR (plate_preprocess.py), None - по умолчанию
+    warmup: прогнать каждую модель на пустом кадре, чтобы первый настоящий кадр не ждал инициализации
+    timings: словарь, в который пишется время загрузки и прогрева каждой модели
+    load_ocr: False - OCR работает только в пуле процессов, бэкенд OCR в этом процессе не загружается
+      (при отказе пула он создаётся при первом распознавании)
+    """
+    configure_ocr(ocr_backend, ocr_model, preprocess_steps)
+    timings = {} if timings is None else timings
+    started = time.perf_counter()
+    # torch импортируется здесь, а не параллельно из нескольких потоков загрузки
+    device = get_device()
+
+    def load_plate_detector():
+        detector = None
+        if int8_plates:
+            # onnxruntime.quantization нужен только для INT8
+            from quantize import load_quantized_detector
+            detector = load_quantized_detector(license_plate_path, calibration_folder, min_plate_recall,
+                                               eval_folder=plate_eval_folder)
+        if detector is None:
+            detector = load_detector(license_plate_path, backend, device)
+        return detector
+
+    detector_warmup = warmup_detector if warmup else None
+    with ThreadPoolExecutor(max_workers=3, thread_name_prefix='model-loader') as executor:
+        coco_future = executor.submit(_load_timed, 'vehicle detector',
+                                      lambda: load_detector(coco_path, backend, device), detector_warmup, timings)
+        plate_future = executor.submit(_load_timed, 'plate detector', load_plate_detector, detector_warmup, timings)
+        ocr_future = None
+        if load_ocr:
+            ocr_future = executor.submit(_load_timed, 'OCR backend', ocr.get_backend,
+                                         warmup_ocr if warmup else None, timings)
+        coco_model = coco_future.result()
+        license_plate_detector = plate_future.result()
+        if ocr_future is not None:
+            ocr_future.result()
+    timings['total_s'] = time.perf_counter() - started
+    logging.info(f"Models ready in {timings['total_s']:.2f}s")
+    return coco_model, license_plate_detector
+
+
+def prepare_models(coco_path=COCO_MODEL_PATH, license_plate_path=LICENSE_PLATE_MODEL_PATH, backend='torch',
+                   int8_plates=False, calibration_folder='photos', min_plate_recall=None,
+                   ocr_backend='easyocr', ocr_model=None, preprocess_steps=None, plate_eval_folder=None):
+    """Заранее экспортирует модели, чтобы процессы-воркеры не экспортировали их одновременно"""
+    if backend != 'torch':
+        export_model(coco_path, backend)
+        export_model(license_plate_path, backend)
+    if int8_plates:
+        from quantize import prepare_quantized
+        prepare_quantized(license_plate_path, calibration_folder, min_plate_recall, eval_folder=plate_eval_folder)
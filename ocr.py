@@ -0,0 +1,331 @@
+# file ocr.py
+"""Бэкенды OCR для кропов номеров.
+
+Бэкенд получает кропы номеров и возвращает для каждого список кандидатов
+[(text, score), ...]; выбор номера по грамматике формата делает util.
+    easyocr - EasyOCR (распознаватель без детектора текста или полный readtext),
+    crnn - компактная CRNN для номеров в ONNX, ONNX Runtime на CPU.
+
+Сравнение бэкендов по точности и задержке на своих кадрах:
+    python ocr.py --images photos --backends easyocr crnn --crnn_model models/plate_crnn.onnx
+"""
+
+import argparse
+import logging
+import math
+import os
+import time
+
+import cv2
+import numpy as np
+
+from plate_grammar import PLATE_LETTERS
+
+logging.basicConfig(level=logging.DEBUG, format='%(asctime)s - %(levelname)s - %(message)s')
+
+OCR_HEIGHT = 64  # Высота входа распознавателя EasyOCR (imgH)
+DEFAULT_CRNN_ALPHABET = '0123456789' + PLATE_LETTERS
+
+_easyocr_reader = None
+
+
+def get_easyocr_reader():
+    """Общий для процесса easyocr.Reader"""
+    global _easyocr_reader
+    if _easyocr_reader is None:
+        import easyocr
+        _easyocr_reader = easyocr.Reader(['ru'], gpu=False)
+    return _easyocr_reader
+
+
+def prepare_ocr_crop(license_plate_crop, height=OCR_HEIGHT):
+    """Переводит кроп номера в оттенки серого и масштабирует до высоты входа распознавателя"""
+    grey = cv2.cvtColor(license_plate_crop, cv2.COLOR_BGR2GRAY) if license_plate_crop.ndim == 3 else license_plate_crop
+    crop_height, crop_width = grey.shape[:2]
+    if crop_height != height:
+        scale = height / crop_height
+        interpolation = cv2.INTER_CUBIC if scale > 1 else cv2.INTER_AREA
+        grey = cv2.resize(grey, (max(1, int(round(crop_width * scale))), height), interpolation=interpolation)
+    return grey
+
+
+class OCRBackend:
+    """Интерфейс бэкенда OCR"""
+
+    name = None
+
+    def read_batch(self, crops, mode=None):
+        """Кандидаты текста для каждого кропа: [[(text, score), ...], ...] в порядке crops"""
+        raise NotImplementedError
+
+
+class EasyOCRBackend(OCRBackend):
+    """EasyOCR: 'recognize' - только распознаватель на всём кропе, 'readtext' - с детектором текста CRAFT"""
+
+    name = 'easyocr'
+
+    def __init__(self, reader=None, batch_size=16):
+        self._reader = reader
+        self.batch_size = batch_size
+
+    @property
+    def reader(self):
+        if self._reader is None:
+            self._reader = get_easyocr_reader()
+        return self._reader
+
+    def read_batch(self, crops, mode=None):
+        if mode == 'readtext':
+            return [self.readtext(crop) for crop in crops]
+        return self.recognize(crops)
+
+    def readtext(self, crop):
+        detections = self.reader.readtext(
+            crop,
+            decoder='greedy',
+            batch_size=1,
+            detail=1,
+            paragraph=False
+        )
+        return [(text, score) for _, text, score in detections]
+
+    def recognize(self, crops):
+        """Все кропы проходят через распознаватель пакетами по batch_size.
+
+        reader.recognize на CPU обрабатывает боксы строго по одному, поэтому
+        get_text вызывается напрямую.
+        """
+        from easyocr.recognition import get_text
+
+        results = [[] for _ in crops]
+        image_list = []  # [(бокс в координатах кропа, серый кроп высотой OCR_HEIGHT), ...]
+        indices = []
+        for i, crop in enumerate(crops):
+            grey = prepare_ocr_crop(crop)
+            height, width = grey.shape[:2]
+            image_list.append(([[0, 0], [width, 0], [width, height], [0, height]], grey))
+            indices.append(i)
+        if not image_list:
+            return results
+
+        reader = self.reader
+        # Все кропы дополняются до ширины самого вытянутого, как в EasyOCR
+        max_ratio = max(max(1.0, img.shape[1] / img.shape[0]) for _, img in image_list)
+        detections = get_text(
+            reader.character, OCR_HEIGHT, int(math.ceil(max_ratio) * OCR_HEIGHT),
+            reader.recognizer, reader.converter, image_list,
+            ignore_char=''.join(set(reader.character) - set(reader.lang_char)),
+            decoder='greedy', batch_size=self.batch_size, workers=0, device=reader.device)
+        for i, (_, text, score) in zip(indices, detections):
+            results[i] = [(text, score)]
+        return results
+
+
+class CRNNBackend(OCRBackend):
+    """Компактная CRNN для номеров (ONNX, CTC).
+
+    Вход модели - [N, C, H, W] в диапазоне [-1, 1], выход - логиты или
+    вероятности [N, T, классы] (или [T, N, классы]), класс blank - 0.
+    Алфавит берётся из аргумента, из метаданных модели ('alphabet') или по умолчанию.
+    session - готовая сессия с интерфейсом onnxruntime.InferenceSession вместо model_path.
+    """
+
+    name = 'crnn'
+
+    def __init__(self, model_path=None, alphabet=None, blank=0, batch_size=32, threads=None, session=None):
+        if session is None:
+            import onnxruntime as ort
+
+            options = ort.SessionOptions()
+            if threads:
+                options.intra_op_num_threads = threads
+            session = ort.InferenceSession(model_path, options, providers=['CPUExecutionProvider'])
+        self.session = session
+        model_input = self.session.get_inputs()[0]
+        self.input_name = model_input.name
+        _, channels, height, width = model_input.shape
+        self.channels = channels if isinstance(channels, int) else 1
+        self.input_size = (width if isinstance(width, int) else 128, height if isinstance(height, int) else 32)
+        meta = self.session.get_modelmeta().custom_metadata_map
+        self.alphabet = alphabet or meta.get('alphabet') or DEFAULT_CRNN_ALPHABET
+        self.blank = blank
+        self.batch_size = batch_size
+
+    def preprocess(self, crops):
+        batch = np.empty((len(crops), self.channels) + self.input_size[::-1], dtype=np.float32)
+        for i, crop in enumerate(crops):
+            if self.channels == 1:
+                image = cv2.cvtColor(crop, cv2.COLOR_BGR2GRAY) if crop.ndim == 3 else crop
+                image = cv2.resize(image, self.input_size, interpolation=cv2.INTER_AREA)[None]
+            else:
+                image = crop if crop.ndim == 3 else cv2.cvtColor(crop, cv2.COLOR_GRAY2BGR)
+                image = cv2.resize(image, self.input_size, interpolation=cv2.INTER_AREA).transpose(2, 0, 1)
+            batch[i] = image
+        return batch / 127.5 - 1.0
+
+    def decode(self, probs):
+        """Жадное CTC-декодирование: (text, score), score - среднее геометрическое вероятностей символов"""
+        best = probs.argmax(axis=1)
+        best_probs = probs[np.arange(len(best)), best]
+        keep = (best != self.blank) & np.concatenate(([True], best[1:] != best[:-1]))
+        chars = best[keep] - (1 if self.blank == 0 else 0)
+        text = ''.join(self.alphabet[c] for c in chars if 0 <= c < len(self.alphabet))
+        score = float(np.exp(np.log(np.maximum(best_probs[keep], 1e-9)).mean())) if keep.any() else 0.0
+        return text, score
+
+    def read_batch(self, crops, mode=None):
+        results = []
+        for start in range(0, len(crops), self.batch_size):
+            chunk = crops[start:start + self.batch_size]
+            output = self.session.run(None, {self.input_name: self.preprocess(chunk)})[0]
+            if output.shape[0] != len(chunk) and output.shape[1] == len(chunk):
+                output = output.transpose(1, 0, 2)  # [T, N, C] -> [N, T, C]
+            if output.min() < 0 or not np.allclose(output.sum(axis=-1), 1.0, atol=1e-3):
+                output = np.exp(output - output.max(axis=-1, keepdims=True))
+                output /= output.sum(axis=-1, keepdims=True)
+            results.extend([self.decode(sample)] for sample in output)
+        return results
+
+
+OCR_BACKENDS = {'easyocr': EasyOCRBackend, 'crnn': CRNNBackend}
+
+_backend = None
+_backend_spec = {'name': 'easyocr'}
+
+
+def configure(name='easyocr', **options):
+    """Выбирает бэкенд OCR процесса; создаётся при первом использовании.
+
+    Без файла модели CRNN выбирается EasyOCR: обученная CRNN с репозиторием не поставляется.
+    """
+    global _backend, _backend_spec
+    if name not in OCR_BACKENDS:
+        raise ValueError(f"Unknown OCR backend: {name}")
+    if name == 'crnn':
+        model_path = options.get('model_path')
+        if not model_path or not os.path.isfile(model_path):
+            logging.error(f"CRNN OCR model not found: {model_path!r}, falling back to EasyOCR "
+                          f"(pass --ocr_model with a trained ONNX model to use the crnn backend)")
+            name, options = 'easyocr', {}
+    _backend_spec = {'name': name, **{key: value for key, value in options.items() if value is not None}}
+    _backend = None
+
+
+def backend_spec():
+    """Настройки текущего бэкенда, чтобы воспроизвести его в другом процессе"""
+    return dict(_backend_spec)
+
+
+def create_backend(name='easyocr', **options):
+    return OCR_BACKENDS[name](**options)
+
+
+def get_backend():
+    global _backend
+    if _backend is None:
+        _backend = create_backend(**_backend_spec)
+    return _backend
+
+
+def load_labels(path):
+    """Эталонные номера: CSV 'имя файла,номер' по строке на кадр"""
+    from plate_grammar import normalize
+
+    labels = {}
+    with open(path, encoding='utf-8') as f:
+        for line in f:
+            if ',' in line:
+                filename, plate = line.strip().split(',', 1)
+                labels[filename] = normalize(plate)
+    return labels
+
+
+def detect_plate_crops(detector, images):
+    """Кропы номеров, найденные детектором на кадрах: [(имя файла, [кроп, ...]), ...]"""
+    import os
+
+    crops_by_image = []
+    for path, image in images:
+        boxes = detector(image, verbose=False)[0].boxes.data.tolist()
+        crops = [image[max(0, int(y1)):int(y2), max(0, int(x1)):int(x2)] for x1, y1, x2, y2, _, _ in boxes]
+        crops_by_image.append((os.path.basename(path), [crop for crop in crops if crop.size]))
+    return crops_by_image
+
+
+def benchmark_backend(backend, crops_by_image, labels=None, mode=None, warmup=2):
+    """Задержка (поштучно и пакетом) и точность бэкенда на кропах номеров"""
+    from plate_grammar import best_plate
+
+    crops = [crop for _, image_crops in crops_by_image for crop in image_crops]
+    for crop in crops[:warmup]:
+        backend.read_batch([crop], mode)
+
+    started = time.perf_counter()
+    for crop in crops:
+        backend.read_batch([crop], mode)
+    single_ms = 1000.0 * (time.perf_counter() - started) / max(1, len(crops))
+
+    started = time.perf_counter()
+    candidates = backend.read_batch(crops, mode)
+    batch_ms = 1000.0 * (time.perf_counter() - started) / max(1, len(crops))
+
+    plates = [best_plate(crop_candidates)[0] for crop_candidates in candidates]
+    predictions = {}
+    offset = 0
+    for filename, image_crops in crops_by_image:
+        predictions[filename] = [plate for plate in plates[offset:offset + len(image_crops)] if plate]
+        offset += len(image_crops)
+
+    report = {
+        'backend': backend.name,
+        'crops': len(crops),
+        'single_ms': single_ms,
+        'batch_ms': batch_ms,
+        'valid_rate': sum(1 for plate in plates if plate) / len(plates) if plates else 0.0,
+        'predictions': predictions,
+    }
+    if labels:
+        labelled = [filename for filename, _ in crops_by_image if filename in labels]
+        correct = sum(1 for filename in labelled if labels[filename] in predictions[filename])
+        report['accuracy'] = correct / len(labelled) if labelled else 0.0
+    return report
+
+
+def parse_args():
+    """Parse input arguments."""
+    parser = argparse.ArgumentParser(description='Compare plate OCR backends on detected plate crops')
+    parser.add_argument('--images', default='photos', help='Folder with test frames')
+    parser.add_argument('--labels', default=None, help="CSV with 'filename,plate' ground truth")
+    parser.add_argument('--backends', nargs='+', default=['easyocr'], choices=sorted(OCR_BACKENDS))
+    parser.add_argument('--crnn_model', default='models/plate_crnn.onnx')
+    parser.add_argument('--easyocr_mode', default='recognize', choices=['recognize', 'readtext'])
+    return parser.parse_args()
+
+
+if __name__ == '__main__':
+    from backends import load_detector, load_images
+    from models import LICENSE_PLATE_MODEL_PATH
+
+    args = parse_args()
+    images = load_images(args.images)
+    if not images:
+        raise SystemExit(f"No images found in {args.images}")
+    labels = load_labels(args.labels) if args.labels else None
+
+    crops_by_image = detect_plate_crops(load_detector(LICENSE_PLATE_MODEL_PATH), images)
+
+    reference = None
+    for name in args.backends:
+        backend = create_backend(name, model_path=args.crnn_model) if name == 'crnn' else create_backend(name)
+        report = benchmark_backend(backend, crops_by_image, labels, args.easyocr_mode if name == 'easyocr' else None)
+        line = "%s: %d crop(s), %.1f ms/crop single, %.1f ms/crop batched, valid %.1f%%" % (
+            report['backend'], report['crops'], report['single_ms'], report['batch_ms'], 100 * report['valid_rate'])
+        if 'accuracy' in report:
+            line += ", accuracy %.1f%%" % (100 * report['accuracy'])
+        if reference is None:
+            reference = report
+        else:
+            agree = sum(1 for filename, plates in report['predictions'].items()
+                        if plates == reference['predictions'].get(filename))
+            line += ", agrees with %s on %d/%d image(s)" % (reference['backend'], agree, len(crops_by_image))
+        print(line)
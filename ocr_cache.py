@@ -0,0 +1,137 @@
+# file ocr_cache.py
+"""Кэш результатов OCR по перцептивному хэшу кропа номера.
+
+Стоящие и медленно движущиеся машины дают почти одинаковые кропы номера кадр
+за кадром. Ключ кэша - DCT-хэш (pHash) нормализованного по контрасту кропа,
+вписанного с сохранением пропорций в сетку 2:1, и корзина его размера,
+поэтому шум сенсора и небольшие сдвиги кропа не меняют ключ, а тот же номер
+крупным и мелким планом не смешивается. Вместе с результатом хранится маленькая
+миниатюра кропа: совпадение хэшей разных номеров отсекается сравнением пикселей.
+"""
+
+import logging
+import math
+import threading
+import time
+from collections import OrderedDict
+
+import cv2
+import numpy as np
+
+logging.basicConfig(level=logging.DEBUG, format='%(asctime)s - %(levelname)s - %(message)s')
+
+
+THUMBNAIL_SIZE = (48, 12)  # (ширина, высота) миниатюры для проверки совпадения
+THUMBNAIL_TOLERANCE = 12.0  # допустимое среднее отличие миниатюр в уровнях яркости 0..255
+
+
+def _grey(crop):
+    return cv2.cvtColor(crop, cv2.COLOR_BGR2GRAY) if crop.ndim == 3 else crop
+
+
+def perceptual_hash(crop, hash_shape=(8, 8), highfreq_factor=4):
+    """64-битный pHash: знаки низкочастотных DCT-коэффициентов относительно медианы.
+
+    Кроп вписывается с сохранением пропорций в сетку 2:1 (hash_shape * highfreq_factor по высоте,
+    вдвое больше по ширине), поля заполняются средней яркостью кропа. Длиннее хэш не делается:
+    каждый лишний бит - ещё один шанс, что шум сенсора сменит ключ, а разные номера с одинаковым
+    хэшем всё равно отсекает сравнение миниатюр.
+    """
+    grey = _grey(crop)
+    rows, cols = hash_shape
+    height, width = rows * highfreq_factor, 2 * cols * highfreq_factor
+    crop_height, crop_width = grey.shape[:2]
+    scale = min(width / max(crop_width, 1), height / max(crop_height, 1))
+    new_width = min(width, max(1, int(round(crop_width * scale))))
+    new_height = min(height, max(1, int(round(crop_height * scale))))
+    canvas = np.full((height, width), float(grey.mean()), dtype=np.float32)
+    top, left = (height - new_height) // 2, (width - new_width) // 2
+    canvas[top:top + new_height, left:left + new_width] = cv2.resize(
+        grey, (new_width, new_height), interpolation=cv2.INTER_AREA)
+    canvas = cv2.normalize(canvas, None, 0.0, 1.0, cv2.NORM_MINMAX)
+    low = cv2.dct(canvas)[:rows, :cols].reshape(-1)
+    bits = low[1:] > np.median(low[1:])  # DC-коэффициент (средняя яркость) не учитывается
+    return int(np.packbits(bits).tobytes().hex(), 16)
+
+
+def thumbnail(crop):
+    """Миниатюра кропа, нормализованная по контрасту, для проверки попадания в кэш"""
+    grey = cv2.resize(_grey(crop), THUMBNAIL_SIZE, interpolation=cv2.INTER_AREA)
+    return cv2.normalize(grey, None, 0, 255, cv2.NORM_MINMAX)
+
+
+def thumbnails_match(first, second, tolerance=THUMBNAIL_TOLERANCE):
+    return float(cv2.absdiff(first, second).mean()) <= tolerance
+
+
+def size_bucket(crop, steps_per_octave=4):
+    """Корзина размера кропа в логарифмическом масштабе"""
+    height, width = crop.shape[:2]
+    return (int(math.log2(max(width, 1)) * steps_per_octave),
+            int(math.log2(max(height, 1)) * steps_per_octave))
+
+
+class OCRCache:
+    """LRU-кэш (plate_text, plate_score) с ограниченным размером и временем жизни записей.
+
+    Ключ из key() - пара (хэш-ключ, миниатюра): запись ищется по хэшу, а используется,
+    только если миниатюра похожа на сохранённую.
+    """
+
+    def __init__(self, max_size=256, ttl=10.0):
+        self.max_size = max_size
+        self.ttl = ttl
+        self._entries = OrderedDict()  # {хэш-ключ: (время записи, результат, миниатюра)}
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.expired = 0
+        self.collisions = 0
+
+    @staticmethod
+    def key(crop, mode=None):
+        return (mode, size_bucket(crop), perceptual_hash(crop)), thumbnail(crop)
+
+    def get(self, key):
+        """Результат OCR по ключу или None; устаревшие записи удаляются"""
+        hash_key, thumb = key
+        with self._lock:
+            entry = self._entries.get(hash_key)
+            if entry is not None:
+                stored_at, result, stored_thumb = entry
+                if time.time() - stored_at > self.ttl:
+                    del self._entries[hash_key]
+                    self.expired += 1
+                elif thumbnails_match(thumb, stored_thumb):
+                    self._entries.move_to_end(hash_key)
+                    self.hits += 1
+                    return result
+                else:
+                    self.collisions += 1  # тот же хэш у другого номера
+            self.misses += 1
+            return None
+
+    def put(self, key, result):
+        hash_key, thumb = key
+        with self._lock:
+            self._entries[hash_key] = (time.time(), result, thumb)
+            self._entries.move_to_end(hash_key)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self):
+        """Счётчики кэша: hits, misses, expired, collisions, size, hit_rate"""
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'hits': self.hits,
+                'misses': self.misses,
+                'expired': self.expired,
+                'collisions': self.collisions,
+                'size': len(self._entries),
+                'hit_rate': self.hits / lookups if lookups else 0.0,
+            }
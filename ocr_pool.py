@@ -0,0 +1,205 @@
+# file ocr_pool.py
+"""Асинхронный OCR в пуле процессов.
+
+Каждый процесс держит свой бэкенд OCR (например, свой easyocr.Reader), так
+что детекция и трекинг не ждут распознавания: кропы отправляются в пул, а
+результаты забираются на следующих кадрах и привязываются к треку, для
+которого они запрашивались.
+"""
+
+import itertools
+import logging
+import multiprocessing as mp
+import os
+import queue
+import time
+
+import ocr
+import plate_grammar
+import plate_preprocess
+
+logging.basicConfig(level=logging.DEBUG, format='%(asctime)s - %(levelname)s - %(message)s')
+
+# Сообщения процессов OCR в очереди результатов
+RESULT_READY = 'ready'
+RESULT_STARTED = 'started'
+RESULT_DONE = 'done'
+
+
+def ocr_worker(task_queue, result_queue, torch_threads, backend_spec):
+    """Точка входа процесса OCR: загружает бэкенд и обслуживает запросы (см. serve_requests)"""
+    if backend_spec.get('name', 'easyocr') == 'easyocr':
+        import torch
+        torch.set_num_threads(torch_threads)
+    ocr.configure(**backend_spec)
+    ocr.get_backend()  # модель OCR загружается до первого запроса
+    from util import read_license_plates
+
+    serve_requests(task_queue, result_queue, read_license_plates)
+
+
+def serve_requests(task_queue, result_queue, read_plates):
+    """Цикл процесса OCR: (request_id, кропы, режим, шаблоны, шаги предобработки) ->
+    (RESULT_DONE, request_id, [(plate_text, plate_score), ...]).
+
+    Перед циклом отправляет (RESULT_READY, pid), а взяв запрос - (RESULT_STARTED, request_id):
+    по ним пул отсчитывает таймаут запроса от начала работы над ним, а не от submit().
+    """
+    result_queue.put((RESULT_READY, os.getpid()))
+    logging.info(f"OCR worker {os.getpid()} ready")
+    while True:
+        task = task_queue.get()
+        if task is None:
+            break
+        request_id, crops, mode, templates_enabled, preprocess_steps = task
+        result_queue.put((RESULT_STARTED, request_id))
+        # Настройки GUI "Шаблоны номеров" и предобработки живут в родительском процессе
+        plate_grammar.set_templates_enabled(templates_enabled)
+        plate_preprocess.set_preprocess_steps(preprocess_steps)
+        try:
+            results = read_plates(crops, mode)
+        except Exception as e:
+            logging.error(f"OCR worker {os.getpid()} failed on request {request_id}: {e}")
+            results = [(None, 0.0)] * len(crops)
+        result_queue.put((RESULT_DONE, request_id, results))
+
+
+class OCRPool:
+    """Пул процессов OCR с ограничением числа запросов в работе.
+
+    Упавший процесс перезапускается (не больше max_restarts раз), запросы без ответа дольше
+    request_timeout секунд снимаются; когда живых процессов не осталось, failed = True.
+    Таймаут считается с момента, когда процесс взял запрос, а для ещё не взятых запросов -
+    не раньше, чем хотя бы один процесс загрузил модель: медленный старт (импорт torch,
+    загрузка EasyOCR) не снимает запросы, поставленные в очередь до готовности пула.
+    """
+
+    def __init__(self, processes=2, max_pending=None, backend_spec=None, request_timeout=30.0, max_restarts=3,
+                 worker=ocr_worker):
+        self.processes_count = max(1, processes)
+        # Процессы повторяют бэкенд OCR родителя
+        self.backend_spec = backend_spec or ocr.backend_spec()
+        # Запросы сверх max_pending не ставятся в очередь: на медленном OCR очередь не растёт бесконечно
+        self.max_pending = max_pending or 2 * self.processes_count
+        self._ctx = mp.get_context('spawn')  # fork небезопасен после инициализации torch
+        self._ids = itertools.count()
+        self.pending = {}  # {request_id: [контекст запроса, время отправки, время начала работы или None]}
+        self.worker = worker
+        self.ready_workers = set()  # pid процессов, загрузивших модель
+        self.ready_since = None  # с какого момента в пуле есть готовый процесс
+        self.request_timeout = request_timeout
+        self.max_restarts = max_restarts
+        self.restarts = 0
+        self.expired = 0
+        self.failed = False
+        self.tasks = None
+        self.results = None
+        self.processes = []
+        self._torch_threads = 1
+
+    def start(self):
+        self.tasks = self._ctx.Queue()
+        self.results = self._ctx.Queue()
+        self._torch_threads = max(1, (os.cpu_count() or 1) // (2 * self.processes_count))
+        self.processes = [self._spawn() for _ in range(self.processes_count)]
+        logging.info(f"Started {len(self.processes)} OCR worker process(es)")
+        return self
+
+    def _spawn(self):
+        process = self._ctx.Process(target=self.worker,
+                                    args=(self.tasks, self.results, self._torch_threads, self.backend_spec),
+                                    daemon=True)
+        process.start()
+        return process
+
+    def check_workers(self):
+        """Перезапускает упавшие процессы; без живых процессов и перезапусков помечает пул failed"""
+        alive = []
+        for process in self.processes:
+            if process.is_alive():
+                alive.append(process)
+                continue
+            logging.error(f"OCR worker {process.pid} died with exit code {process.exitcode}")
+            self.ready_workers.discard(process.pid)
+            if self.restarts < self.max_restarts:
+                self.restarts += 1
+                alive.append(self._spawn())
+                logging.info(f"Restarted OCR worker ({self.restarts}/{self.max_restarts} restarts)")
+        self.processes = alive
+        if not self.ready_workers:
+            self.ready_since = None  # запросы в очереди ждут, пока перезапущенный процесс загрузит модель
+        if not alive and not self.failed:
+            self.failed = True
+            logging.error("No OCR worker processes left")
+
+    def is_full(self):
+        return len(self.pending) >= self.max_pending
+
+    def submit(self, crops, context, mode=None, preprocess_steps=None):
+        """Отправляет кропы на распознавание; context вернётся вместе с результатами. False - пул занят.
+
+        preprocess_steps - шаги предобработки в процессе OCR, None - текущие PREPROCESS_STEPS,
+        () - кропы уже подготовлены вызывающим.
+        """
+        if self.is_full():
+            return False
+        if preprocess_steps is None:
+            preprocess_steps = plate_preprocess.PREPROCESS_STEPS
+        request_id = next(self._ids)
+        self.pending[request_id] = [context, time.time(), None]
+        self.tasks.put((request_id, crops, mode, plate_grammar.TEMPLATES_ENABLED, tuple(preprocess_steps)))
+        return True
+
+    def poll(self):
+        """Готовые результаты: [(context, [(plate_text, plate_score), ...]), ...].
+
+        Для снятых по таймауту запросов (упал процесс, OCR завис) вместо результатов - None.
+        """
+        ready = []
+        try:
+            while True:
+                message = self.results.get_nowait()
+                if message[0] == RESULT_READY:
+                    self.ready_workers.add(message[1])
+                    if self.ready_since is None:
+                        self.ready_since = time.time()
+                elif message[0] == RESULT_STARTED:
+                    entry = self.pending.get(message[1])
+                    if entry is not None:
+                        entry[2] = time.time()
+                else:
+                    entry = self.pending.pop(message[1], None)
+                    if entry is not None:
+                        ready.append((entry[0], message[2]))
+        except queue.Empty:
+            pass
+        self.check_workers()
+        deadline = time.time() - self.request_timeout
+        expired = [request_id for request_id, entry in self.pending.items()
+                   if self.failed or self._waiting_since(entry) < deadline]
+        if expired:
+            logging.warning(f"OCR pool: {len(expired)} request(s) expired without a result")
+            self.expired += len(expired)
+            ready.extend((self.pending.pop(request_id)[0], None) for request_id in expired)
+        return ready
+
+    def _waiting_since(self, entry):
+        """С какого момента отсчитывается таймаут запроса; inf - пока ни один процесс не готов"""
+        _, submitted, started = entry
+        if started is not None:
+            return started
+        if self.ready_since is None:
+            return float('inf')
+        return max(submitted, self.ready_since)
+
+    def stop(self):
+        for _ in self.processes:
+            self.tasks.put(None)
+        for process in self.processes:
+            process.join(timeout=5.0)
+            if process.is_alive():
+                process.terminate()
+        self.processes = []
+        self.pending.clear()
+        self.ready_workers.clear()
+        self.ready_since = None
@@ -0,0 +1,495 @@
+# file pipeline.py
+
+import logging
+import time
+from datetime import datetime
+
+import cv2
+
+from ocr_cache import OCRCache
+from ocr_pool import OCRPool
+from plate_preprocess import preprocess_images
+from plate_quality import score_plate_crops
+from tracking import TrackerRegistry
+from util import read_license_plate, read_license_plates, associate_plates_to_vehicles, detect_plates_in_vehicles
+
+logging.basicConfig(level=logging.DEBUG, format='%(asctime)s - %(levelname)s - %(message)s')
+
+VEHICLE_CLASSES = [2, 3, 5, 7]  # IDs of vehicles in COCO
+
+
+def crop_plate(frame, license_plate):
+    """Кроп номера из кадра по детекции [x1, y1, x2, y2, score, class_id]"""
+    x1, y1, x2, y2 = (max(0, int(v)) for v in license_plate[:4])
+    return frame[y1:y2, x1:x2]
+
+
+class PlateVotes:
+    """Посимвольное голосование за текст номера одного трека по нескольким кадрам.
+
+    Голоса копятся отдельно для каждой длины текста с весом, равным уверенности
+    OCR. Согласие (confidence) - доля веса выбранной длины, умноженная на
+    наименьшую долю победившего символа среди позиций.
+    """
+
+    def __init__(self):
+        self.reads = 0
+        self.length_reads = {}  # {длина: число чтений}
+        self.length_weight = {}  # {длина: сумма уверенностей OCR}
+        self.positions = {}  # {длина: [{символ: вес}, ...]}
+
+    def add(self, plate_text, plate_score):
+        length = len(plate_text)
+        self.reads += 1
+        self.length_reads[length] = self.length_reads.get(length, 0) + 1
+        self.length_weight[length] = self.length_weight.get(length, 0.0) + plate_score
+        positions = self.positions.setdefault(length, [{} for _ in range(length)])
+        for votes, char in zip(positions, plate_text):
+            votes[char] = votes.get(char, 0.0) + plate_score
+
+    def consensus(self):
+        """Возвращает (plate_text, plate_score, confidence) по накопленным голосам"""
+        if not self.reads:
+            return None, 0.0, 0.0
+        length = max(self.length_weight, key=self.length_weight.get)
+        length_share = self.length_weight[length] / sum(self.length_weight.values())
+
+        chars = []
+        agreement = 1.0
+        for votes in self.positions[length]:
+            char = max(votes, key=votes.get)
+            chars.append(char)
+            agreement = min(agreement, votes[char] / sum(votes.values()))
+
+        confidence = length_share * agreement
+        # Средняя уверенность OCR чтений выбранной длины, пониженная на степень несогласия
+        mean_score = self.length_weight[length] / self.length_reads[length]
+        return ''.join(chars), mean_score * confidence, confidence
+
+
+class RecognitionPipeline:
+    """Конвейер распознавания без отрисовки и без Qt.
+
+    Детекция ТС -> SORT -> детекция номеров -> read_license_plates -> insert_car_data.
+    Используется как потоком ProcessingEngine в GUI, так и headless-режимом.
+    У каждой камеры свой трекер SORT (trackers - TrackerRegistry, None - с настройками по умолчанию).
+    """
+
+    def __init__(self, coco_model, license_plate_detector, trackers=None, vehicles=None,
+                 read_license_plate=read_license_plate, insert_car_data=None, read_license_plates=read_license_plates,
+                 recognition_threshold=0.85, track_ttl=5.0, max_batch_size=8,
+                 plate_detection='full', cascade_imgsz=320, cascade_padding=0.1,
+                 detect_every=1, max_track_uncertainty=None, ocr_mode=None,
+                 consensus_confidence=0.9, consensus_min_reads=3, ocr_cache_size=256, ocr_cache_ttl=10.0,
+                 min_plate_quality=0.2, ocr_processes=0):
+        self.coco_model = coco_model
+        self.license_plate_detector = license_plate_detector
+        self.trackers = trackers if trackers is not None else TrackerRegistry()
+        self.vehicles = vehicles if vehicles is not None else VEHICLE_CLASSES
+        self.read_license_plate = read_license_plate
+        # Пакетный OCR; None - кропы распознаются по одному через read_license_plate
+        self.read_license_plates = read_license_plates
+        self.ocr_mode = ocr_mode  # None - режим util.OCR_MODE, иначе 'recognize' или 'readtext'
+        # Кэш OCR по перцептивному хэшу кропа; ocr_cache_size=0 - без кэша
+        self.ocr_cache = OCRCache(ocr_cache_size, ocr_cache_ttl) if ocr_cache_size else None
+        # Кропы с качеством ниже min_plate_quality (plate_quality.py) не распознаются; None - без проверки
+        self.min_plate_quality = min_plate_quality
+        self.quality_rejected = 0
+        # Лучший по качеству кроп трека без уверенного чтения; когда трек уходит, этот кроп
+        # распознаётся последний раз (все его кропы могли не пройти проверку качества)
+        self.best_plate_crops = {}  # {track_id: {'quality': float, 'crop': ndarray, 'last_seen': float, 'camera_id': ...}}
+        # ocr_processes > 0 - OCR в отдельных процессах: детекция не ждёт распознавания,
+        # результаты привязываются к треку, для которого запрашивались, на следующих кадрах
+        self.ocr_pool = OCRPool(ocr_processes).start() if ocr_processes else None
+        self.inflight_tracks = set()
+        self.pending_recognized = {}  # {camera_id: [(track_id, plate_text, plate_score), ...]}
+        self.ocr_pool_dropped = 0
+        self.insert_car_data = insert_car_data  # None - не сохранять номера в БД
+        self.recognition_threshold = recognition_threshold
+        self.track_ttl = track_ttl
+        self.max_batch_size = max_batch_size
+        # 'full' - детектор номеров на весь кадр, 'cascade' - только на кропах ТС
+        self.plate_detection = plate_detection
+        self.cascade_imgsz = cascade_imgsz
+        self.cascade_padding = cascade_padding
+        # Полная детекция раз в detect_every кадров; между ними боксы берутся из предсказаний SORT.
+        # max_track_uncertainty включает внеочередную детекцию, когда фильтр Калмана "поплыл"
+        self.detect_every = max(1, detect_every)
+        self.max_track_uncertainty = max_track_uncertainty
+        self.frames_since_detection = {}  # {camera_id: int}
+
+        # Трек перестаёт отправляться в OCR, когда согласие чтений его номера достигло
+        # consensus_confidence минимум по consensus_min_reads кадрам
+        self.consensus_confidence = consensus_confidence
+        self.consensus_min_reads = consensus_min_reads
+
+        # {track_id: {'plate_text': str, 'plate_score': float, 'last_seen': float,
+        #             'votes': PlateVotes, 'finalized': bool, 'saved_text': str}}
+        self.tracked_plates = {}
+        self.last_saved_plates = {}  # {camera_id: plate_text}
+
+    def process_frame(self, frame, camera_id):
+        """Обрабатывает кадр камеры.
+
+        Возвращает словарь:
+            vehicle_boxes - [[x1, y1, x2, y2, score], ...] детекции ТС на кадре,
+            tracks - [[x1, y1, x2, y2, track_id], ...] результат SORT,
+            plates - [(track_id, plate_text, plate_score), ...] номера, распознанные на этом кадре,
+            detected - False, если детекторы на этом кадре пропущены и треки только предсказаны.
+        """
+        return self.process_batch([(camera_id, frame)])[0]
+
+    def process_batch(self, frames):
+        """Обрабатывает текущие кадры нескольких камер: [(camera_id, frame), ...].
+
+        Обе YOLO-модели вызываются один раз на весь пакет, номера всех камер
+        распознаются одним пакетным вызовом OCR, затем результаты раздаются по
+        камерам. Возвращает список результатов в порядке frames.
+        """
+        # Результаты асинхронного OCR, пришедшие с прошлых кадров
+        self.collect_ocr()
+
+        results = [None] * len(frames)
+        to_detect = []
+        for i, (camera_id, frame) in enumerate(frames):
+            if self.needs_detection(camera_id):
+                to_detect.append(i)
+            else:
+                results[i] = self.process_predicted(camera_id)
+
+        detected = []  # [(индекс кадра, детекции ТС, детекции номеров), ...]
+        for start in range(0, len(to_detect), self.max_batch_size):
+            chunk = to_detect[start:start + self.max_batch_size]
+            images = [frames[i][1] for i in chunk]
+            vehicle_boxes = [self.filter_vehicles(result) for result in self.coco_model(images)]
+            license_plates = self.detect_plates(images, vehicle_boxes)
+            detected.extend(zip(chunk, vehicle_boxes, license_plates))
+
+        # Трекинг и привязка номеров к трекам; номера вне треков и номера треков
+        # с устоявшимся текстом не распознаются
+        tracked = []  # [(индекс кадра, детекции ТС, треки, трек каждого номера), ...]
+        candidates = []  # [(позиция в tracked, индекс номера, track_id, кроп), ...]
+        frame_tracks = self.trackers.update_many([(frames[i][0], frame_vehicles) for i, frame_vehicles, _ in detected])
+        for (i, frame_vehicles, frame_plates), track_ids in zip(detected, frame_tracks):
+            camera_id, frame = frames[i]
+            self.frames_since_detection[camera_id] = 0
+            plate_tracks = [track_id if self.wants_ocr(track_id) else None
+                            for track_id in self.match_plates(frame_plates, track_ids)]
+            for k, (lp, track_id) in enumerate(zip(frame_plates, plate_tracks)):
+                if track_id is not None:
+                    candidates.append((len(tracked), k, track_id, crop_plate(frame, lp)))
+            tracked.append((i, frame_vehicles, track_ids, plate_tracks))
+
+        # Кропы всех камер проходят проверку качества, оставшиеся - OCR одним пакетом,
+        # каждый номер - ровно один раз. С пулом OCR промахи кэша распознаются асинхронно
+        candidates = self.gate_crops(candidates, [frames[tracked[t][0]][0] for t, _, _, _ in candidates])
+        crops = [crop for _, _, _, crop in candidates]
+        if self.ocr_pool is None:
+            plate_reads = self.ocr_batch(crops)
+        else:
+            plate_reads, keys = self.lookup_cache(crops)
+            self.submit_ocr([(*frames[tracked[t][0]], track_id, crop, key)
+                             for (t, _, track_id, crop), read, key in zip(candidates, plate_reads, keys)
+                             if read is None])
+        reads_by_plate = {(t, k): read for (t, k, _, _), read in zip(candidates, plate_reads) if read is not None}
+        for t, (i, frame_vehicles, track_ids, plate_tracks) in enumerate(tracked):
+            camera_id, frame = frames[i]
+            frame_reads = [reads_by_plate.get((t, k), (None, 0.0)) for k in range(len(plate_tracks))]
+            results[i] = self.process_detections(frame, camera_id, frame_vehicles, track_ids, plate_tracks,
+                                                 frame_reads)
+        return results
+
+    def needs_detection(self, camera_id):
+        """Решает, запускать ли детекторы на очередном кадре камеры"""
+        frames_since = self.frames_since_detection.get(camera_id)
+        if frames_since is None or frames_since + 1 >= self.detect_every:
+            return True
+        return (self.max_track_uncertainty is not None and
+                self.trackers.max_position_uncertainty(camera_id) > self.max_track_uncertainty)
+
+    def process_predicted(self, camera_id):
+        """Кадр без детекции: боксы треков берутся из предсказания фильтра Калмана"""
+        self.frames_since_detection[camera_id] += 1
+        track_ids = self.trackers.predict(camera_id)
+        self.touch_tracks(track_ids, time.time())
+        return {
+            'vehicle_boxes': [],
+            'tracks': track_ids,
+            'plates': self.pending_recognized.pop(camera_id, []),
+            'detected': False,
+        }
+
+    def touch_tracks(self, track_ids, current_time):
+        """Треки кадра живы: их номера и лучшие кропы не считаются устаревшими"""
+        for track in track_ids:
+            for states in (self.tracked_plates, self.best_plate_crops):
+                state = states.get(track[4])
+                if state is not None:
+                    state['last_seen'] = current_time
+
+    def filter_vehicles(self, vehicle_detections):
+        """Оставляет только детекции транспортных средств: [[x1, y1, x2, y2, score], ...]"""
+        vehicle_boxes = []
+        for detection in vehicle_detections.boxes.data.tolist():
+            x1, y1, x2, y2, score, class_id = detection
+            if int(class_id) in self.vehicles:  # Только автомобили
+                vehicle_boxes.append([x1, y1, x2, y2, score])
+        return vehicle_boxes
+
+    def detect_plates(self, images, vehicle_boxes):
+        """Детекция номеров для пакета кадров: [[x1, y1, x2, y2, score, class_id], ...] на кадр"""
+        if self.plate_detection == 'cascade':
+            return detect_plates_in_vehicles(self.license_plate_detector, images, vehicle_boxes,
+                                             imgsz=self.cascade_imgsz, padding=self.cascade_padding)
+        return [result.boxes.data.tolist() for result in self.license_plate_detector(images)]
+
+    def match_plates(self, license_plates, track_ids):
+        """Для каждого номера - трек, внутри которого он лежит (оптимальное назначение один к одному), или None"""
+        matches = associate_plates_to_vehicles(license_plates, track_ids)
+        return [track_ids[j][4] if j >= 0 else None for j in matches]
+
+    def wants_ocr(self, track_id):
+        """Нужно ли ещё распознавать номер трека: False для треков без ТС и с итоговым текстом"""
+        if track_id is None:
+            return False
+        state = self.tracked_plates.get(track_id)
+        return state is None or not state['finalized']
+
+    def gate_crops(self, candidates, camera_ids=None):
+        """Отбрасывает кропы низкого качества и запоминает лучший кроп каждого трека без уверенного чтения.
+
+        candidates - [(..., track_id, кроп), ...], camera_ids - камера каждого кандидата;
+        возвращает прошедшие проверку.
+        """
+        if self.min_plate_quality is None or not candidates:
+            return candidates
+        qualities = score_plate_crops([candidate[-1] for candidate in candidates])
+        current_time = time.time()
+        camera_ids = camera_ids or [None] * len(candidates)
+        passed = []
+        for candidate, quality, camera_id in zip(candidates, qualities, camera_ids):
+            track_id, crop = candidate[-2:]
+            best = self.best_plate_crops.get(track_id)
+            if best is None and self.has_confident_read(track_id):
+                pass  # номер трека уже прочитан, последняя попытка ему не нужна
+            elif best is None or quality > best['quality']:
+                self.best_plate_crops[track_id] = {'quality': float(quality), 'crop': crop.copy(),
+                                                   'last_seen': current_time, 'camera_id': camera_id}
+            else:
+                best['last_seen'] = current_time
+            if quality >= self.min_plate_quality:
+                passed.append(candidate)
+            else:
+                self.quality_rejected += 1
+        return passed
+
+    def has_confident_read(self, track_id):
+        state = self.tracked_plates.get(track_id)
+        return state is not None and state['saved_text'] is not None
+
+    def read_best_crops(self, expired, current_time):
+        """Последняя попытка для ушедших треков без уверенного чтения: OCR их лучшего кропа.
+
+        expired - [(track_id, запись best_plate_crops), ...]
+        """
+        expired = [(track_id, best) for track_id, best in expired
+                   if best['camera_id'] is not None and not self.has_confident_read(track_id)]
+        if not expired:
+            return
+        if self.ocr_pool is not None:
+            # Кроп заменяет кадр: сам кадр для трека не хранится
+            self.submit_ocr([(best['camera_id'], best['crop'], track_id, best['crop'], None)
+                             for track_id, best in expired])
+            return
+        reads = self.ocr_batch([best['crop'] for _, best in expired])
+        for (track_id, best), read in zip(expired, reads):
+            plate_text, plate_score = read
+            if plate_text and plate_score >= self.recognition_threshold:
+                self.pending_recognized.setdefault(best['camera_id'], []).extend(
+                    self.apply_reads(best['camera_id'], best['crop'], {track_id: [read]}, current_time))
+
+    def process_detections(self, frame, camera_id, vehicle_boxes, track_ids, plate_tracks, plate_reads):
+        """Обновление треков, новые номера и сохранение в БД по результатам OCR одного кадра.
+
+        plate_tracks и plate_reads выровнены по детекциям номеров: трек номера
+        (или None) и его единственное чтение (plate_text, plate_score). Чтения
+        добавляются в голосование трека, текст трека - консенсус по всем кадрам.
+        """
+        current_time = time.time()
+
+        # Чтения кадра по трекам
+        track_reads = {}
+        for track_id, (plate_text, plate_score) in zip(plate_tracks, plate_reads):
+            if track_id is None or not plate_text or plate_score < self.recognition_threshold:
+                continue
+            track_reads.setdefault(track_id, []).append((plate_text, plate_score))
+
+        # Номера, распознанные пулом OCR с прошлых кадров, отдаются вместе с этим кадром
+        recognized = self.pending_recognized.pop(camera_id, [])
+        recognized += self.apply_reads(camera_id, frame, track_reads, current_time)
+        self.touch_tracks(track_ids, current_time)
+
+        # Очистка старых треков (>track_ttl секунд без обновления)
+        self.clean_old_tracks(current_time)
+
+        return {
+            'vehicle_boxes': vehicle_boxes,
+            'tracks': track_ids,
+            'plates': recognized,
+            'detected': True,
+        }
+
+    def apply_reads(self, camera_id, frame, track_reads, current_time):
+        """Добавляет чтения {track_id: [(plate_text, plate_score), ...]} в голосование треков.
+
+        Возвращает [(track_id, plate_text, plate_score), ...] для новых и исправленных номеров.
+        """
+        recognized = []
+        for track_id, reads in track_reads.items():
+            state = self.tracked_plates.get(track_id)
+            if state is None:
+                state = self.tracked_plates[track_id] = {
+                    'votes': PlateVotes(), 'finalized': False, 'saved_text': None}
+            for plate_text, plate_score in reads:
+                state['votes'].add(plate_text, plate_score)
+            self.best_plate_crops.pop(track_id, None)  # номер прочитан, последняя попытка не нужна
+
+            plate_text, plate_score, confidence = state['votes'].consensus()
+            state['plate_text'] = plate_text
+            state['plate_score'] = plate_score
+            state['last_seen'] = current_time
+            state['finalized'] = (state['votes'].reads >= self.consensus_min_reads and
+                                  confidence >= self.consensus_confidence)
+            # Номер сохраняется при первом чтении и ещё раз, если итоговый текст отличается
+            if state['saved_text'] is None or (state['finalized'] and plate_text != state['saved_text']):
+                state['saved_text'] = plate_text
+                recognized.append((track_id, plate_text, plate_score))
+                # Сохранение в базу данных
+                self.save_plate(plate_text, frame, camera_id)
+        return recognized
+
+    def lookup_cache(self, plate_crops):
+        """Результаты OCR из кэша (None - промах) и ключи кэша для кропов"""
+        results = [None] * len(plate_crops)
+        keys = [None] * len(plate_crops)
+        if self.ocr_cache is not None:
+            for i, crop in enumerate(plate_crops):
+                if crop.size:
+                    keys[i] = self.ocr_cache.key(crop, self.ocr_mode)
+                    results[i] = self.ocr_cache.get(keys[i])
+        return results, keys
+
+    def submit_ocr(self, requests):
+        """Отправляет кропы [(camera_id, frame, track_id, кроп, ключ кэша), ...] в пул OCR.
+
+        На трек - не больше одного запроса в работе; если пул занят, кропы пропускаются.
+        """
+        requests = [request for request in requests if request[2] not in self.inflight_tracks]
+        if not requests:
+            return
+        if self.ocr_pool.is_full():
+            self.ocr_pool_dropped += len(requests)
+            return
+        contexts = [(camera_id, frame, track_id, key) for camera_id, frame, track_id, _, key in requests]
+        # Кропы уменьшаются (и выравниваются) до отправки: в процессы OCR уходит меньше данных
+        crops = preprocess_images([request[3] for request in requests])
+        if self.ocr_pool.submit(crops, contexts, self.ocr_mode, preprocess_steps=()):
+            self.inflight_tracks.update(request[2] for request in requests)
+        else:
+            self.ocr_pool_dropped += len(requests)
+
+    def collect_ocr(self):
+        """Применяет готовые результаты пула OCR к трекам, для которых они запрашивались"""
+        if self.ocr_pool is None:
+            return
+        current_time = time.time()
+        for contexts, reads in self.ocr_pool.poll():
+            if reads is None:
+                # Запрос снят по таймауту: треки можно снова отправлять на распознавание
+                self.inflight_tracks.difference_update(context[2] for context in contexts)
+                continue
+            for (camera_id, frame, track_id, key), read in zip(contexts, reads):
+                self.inflight_tracks.discard(track_id)
+                if key is not None:
+                    self.ocr_cache.put(key, read)
+                if camera_id not in self.trackers:
+                    continue  # камера отключилась, пока номер распознавался
+                plate_text, plate_score = read
+                if plate_text and plate_score >= self.recognition_threshold:
+                    self.pending_recognized.setdefault(camera_id, []).extend(
+                        self.apply_reads(camera_id, frame, {track_id: [read]}, current_time))
+        if self.ocr_pool.failed:
+            logging.error("OCR pool failed, falling back to in-process OCR")
+            self.ocr_pool.stop()
+            self.ocr_pool = None
+            self.inflight_tracks.clear()
+
+    def release_camera(self, camera_id):
+        """Освобождает состояние отключённой камеры: её трекер, номера её треков и счётчики"""
+        tracker = self.trackers.release(camera_id)
+        if tracker is not None:
+            for track_id in tracker.ids + 1:  # Sort выдаёт id + 1
+                self.tracked_plates.pop(float(track_id), None)
+                self.best_plate_crops.pop(float(track_id), None)
+        self.frames_since_detection.pop(camera_id, None)
+        self.last_saved_plates.pop(camera_id, None)
+        self.pending_recognized.pop(camera_id, None)
+
+    def close(self):
+        """Останавливает пул OCR"""
+        if self.ocr_pool is not None:
+            self.ocr_pool.stop()
+            self.ocr_pool = None
+        self.trackers.close()
+
+    def ocr_batch(self, plate_crops):
+        """Распознаёт текст на кропах номеров в выбранном режиме OCR: [(plate_text, plate_score), ...].
+
+        Кропы, почти совпадающие с недавно распознанными, берутся из кэша.
+        """
+        if not plate_crops:
+            return []
+        results, keys = self.lookup_cache(plate_crops)
+
+        missing = [i for i, result in enumerate(results) if result is None]
+        if missing:
+            crops = [plate_crops[i] for i in missing]
+            kwargs = {} if self.ocr_mode is None else {'mode': self.ocr_mode}
+            if self.read_license_plates is None:
+                reads = [self.read_license_plate(crop, **kwargs) for crop in crops]
+            else:
+                reads = self.read_license_plates(crops, **kwargs)
+            for i, read in zip(missing, reads):
+                results[i] = read
+                if keys[i] is not None:
+                    self.ocr_cache.put(keys[i], read)
+        return results
+
+    def save_plate(self, plate_text, frame, camera_id):
+        """Сохраняет номер в БД, если он отличается от последнего сохранённого для этой камеры"""
+        if self.insert_car_data is None or plate_text == self.last_saved_plates.get(camera_id):
+            return
+        try:
+            _, buffer = cv2.imencode('.jpg', frame)
+            self.insert_car_data(
+                plate_text,
+                buffer.tobytes(),
+                "Car",
+                datetime.now().strftime('%Y-%m-%d %H:%M:%S'),
+                camera_id
+            )
+            self.last_saved_plates[camera_id] = plate_text
+        except Exception as e:
+            logging.error(f"Ошибка сохранения в БД: {e}")
+
+    def clean_old_tracks(self, current_time=None):
+        """Очищает треки, которые не обновлялись дольше track_ttl секунд"""
+        current_time = current_time or time.time()
+        # Лучшие кропы ушедших треков распознаются до удаления состояния их номеров
+        to_delete = [tid for tid, best in self.best_plate_crops.items()
+                     if current_time - best['last_seen'] > self.track_ttl]
+        self.read_best_crops([(tid, self.best_plate_crops.pop(tid)) for tid in to_delete], current_time)
+        to_delete = [tid for tid, plate in self.tracked_plates.items()
+                     if current_time - plate['last_seen'] > self.track_ttl]
+        for tid in to_delete:
+            del self.tracked_plates[tid]
@@ -0,0 +1,132 @@
+# file plate_grammar.py
+"""Грамматика российских номеров: проверка формата и исправление OCR-кандидатов.
+
+Форматы легковых и прицепных номеров компилируются в одно регулярное
+выражение. Для исправления кандидатов используются таблицы str.translate:
+буквы-двойники кириллицы приводятся к латинице, а типичные путаницы OCR
+(O/0, B/8, З/3 и т.п.) исправляются с учётом того, буква или цифра стоит на
+позиции по формату. Из кандидатов выбирается наиболее вероятный допустимый
+номер, а не только точно совпавший с форматом.
+
+Модуль не зависит от Qt и работает и в headless-режиме.
+"""
+
+import re
+
+# Буквы, допустимые на российских номерах (латинские двойники кириллицы)
+PLATE_LETTERS = 'ABEKMHOPCTYX'
+_CYRILLIC_LETTERS = 'АВЕКМНОРСТУХ'
+
+# Шаблоны: L - буква, D - цифра
+PATTERNS = (
+    'LDDDLLDD',  # легковой, регион из 2 цифр
+    'LDDDLLDDD',  # легковой, регион из 3 цифр
+    'LLDDDDDD',  # прицеп, регион из 2 цифр
+    'LLDDDDDDD',  # прицеп, регион из 3 цифр
+)
+PATTERNS_BY_LENGTH = {}
+for _pattern in PATTERNS:
+    PATTERNS_BY_LENGTH.setdefault(len(_pattern), []).append(_pattern)
+PLATE_LENGTHS = sorted(PATTERNS_BY_LENGTH)
+
+
+def _pattern_regex(pattern):
+    return ''.join(f'[{PLATE_LETTERS}]' if cls == 'L' else '[0-9]' for cls in pattern)
+
+
+PLATE_RE = re.compile('(?:%s)' % '|'.join(_pattern_regex(p) for p in PATTERNS))
+_NON_ALNUM = re.compile(r'[\W_]+')
+
+# Кириллица и строчные латинские буквы -> канонический вид
+NORMALIZE = str.maketrans({
+    **dict(zip(_CYRILLIC_LETTERS, PLATE_LETTERS)),
+    **dict(zip(_CYRILLIC_LETTERS.lower(), PLATE_LETTERS)),
+    **dict(zip(PLATE_LETTERS.lower(), PLATE_LETTERS)),
+})
+# Путаницы OCR на буквенных позициях
+TO_LETTER = str.maketrans({
+    '0': 'O', '8': 'B', 'Ы': 'M', 'Ч': 'Y', 'И': 'H', 'П': 'H', 'Ш': 'H', 'Л': 'E',
+})
+# Путаницы OCR на цифровых позициях
+TO_DIGIT = str.maketrans({
+    'O': '0', 'D': '0', 'Q': '0', 'Д': '0', 'I': '1', 'L': '1', 'Z': '2', 'З': '3',
+    'Ч': '9', 'Я': '9', 'Ц': '7', 'T': '7', 'B': '8', 'S': '5', 'G': '6', 'Б': '6',
+})
+_LETTER_SET = frozenset(PLATE_LETTERS)
+_DIGIT_SET = frozenset('0123456789')
+
+CONFUSION_PENALTY = 0.05  # за каждый исправленный символ
+TRIM_PENALTY = 0.02  # за каждый отброшенный лишний символ (флаг, "RUS", рамка)
+MAX_CORRECTIONS = 2
+MAX_TRIM = 3
+MIN_TEXT_LENGTH = 5
+
+# Проверка формата включена по умолчанию; в GUI переключается пунктом меню "Шаблоны номеров"
+TEMPLATES_ENABLED = True
+
+
+def set_templates_enabled(enabled):
+    global TEMPLATES_ENABLED
+    TEMPLATES_ENABLED = bool(enabled)
+
+
+def normalize(text):
+    """Верхний регистр, только буквы и цифры, кириллические двойники заменены латиницей"""
+    return _NON_ALNUM.sub('', text.upper()).translate(NORMALIZE)
+
+
+def is_valid_plate(text):
+    """Соответствует ли нормализованный текст одному из форматов номеров"""
+    if not TEMPLATES_ENABLED:
+        return True
+    return PLATE_RE.fullmatch(text) is not None
+
+
+def correct_plate(text):
+    """Ближайший допустимый номер для текста OCR: (номер, штраф) или (None, None)"""
+    cleaned = normalize(text)
+    if PLATE_RE.fullmatch(cleaned):
+        return cleaned, 0.0
+
+    as_letter = cleaned.translate(TO_LETTER)
+    as_digit = cleaned.translate(TO_DIGIT)
+    best_plate, best_penalty = None, None
+    for length in PLATE_LENGTHS:
+        trimmed = len(cleaned) - length
+        if trimmed < 0 or trimmed > MAX_TRIM:
+            continue
+        for start in range(trimmed + 1):
+            for pattern in PATTERNS_BY_LENGTH[length]:
+                chars = []
+                corrections = 0
+                for pos, cls in enumerate(pattern, start):
+                    char = as_letter[pos] if cls == 'L' else as_digit[pos]
+                    if char not in (_LETTER_SET if cls == 'L' else _DIGIT_SET):
+                        break
+                    corrections += char != cleaned[pos]
+                    chars.append(char)
+                else:
+                    if corrections > MAX_CORRECTIONS:
+                        continue
+                    penalty = corrections * CONFUSION_PENALTY + trimmed * TRIM_PENALTY
+                    if best_penalty is None or penalty < best_penalty:
+                        best_plate, best_penalty = ''.join(chars), penalty
+    return best_plate, best_penalty
+
+
+def best_plate(candidates):
+    """Выбирает наиболее вероятный допустимый номер из [(text, score), ...]: (номер, score) или (None, 0.0)"""
+    best_text, best_score = None, 0.0
+    for text, score in candidates:
+        if TEMPLATES_ENABLED:
+            plate, penalty = correct_plate(text)
+            if plate is None:
+                continue
+            score = score * (1.0 - penalty)
+        else:
+            plate = normalize(text)
+            if len(plate) < MIN_TEXT_LENGTH:
+                continue
+        if score > best_score:
+            best_text, best_score = plate, score
+    return (best_text, best_score) if best_text else (None, 0.0)
@@ -0,0 +1,63 @@
+# file plate_quality.py
+"""Оценка качества кропов номеров перед OCR.
+
+Мелкие, размытые, неконтрастные и неправильной формы кропы почти никогда не
+дают текст, проходящий license_complies_format, поэтому их не стоит отправлять
+в EasyOCR. Все кропы пакета приводятся к одному размеру и оцениваются одним
+вызовом Laplacian и векторными операциями numpy.
+"""
+
+import logging
+
+import cv2
+import numpy as np
+
+logging.basicConfig(level=logging.DEBUG, format='%(asctime)s - %(levelname)s - %(message)s')
+
+SCORE_SIZE = (128, 32)  # (ширина, высота), к которой приводятся кропы для оценки резкости и контраста
+
+# Значения признаков, начиная с которых кроп считается хорошим по этому признаку
+GOOD_HEIGHT = 24  # пикселей
+MIN_HEIGHT = 8
+GOOD_SHARPNESS = 150.0  # дисперсия лапласиана на кропе SCORE_SIZE
+GOOD_CONTRAST = 0.35  # размах яркости между 5 и 95 перцентилями, доля от 255
+ASPECT_RANGE = (2.0, 6.5)  # ширина / высота; у российского номера 520x112 около 4.6
+
+
+def plate_features(crops):
+    """Сырые признаки кропов: массивы height, aspect, sharpness, contrast длины len(crops)"""
+    count = len(crops)
+    heights = np.zeros(count, dtype=np.float32)
+    widths = np.zeros(count, dtype=np.float32)
+    width, height = SCORE_SIZE
+    # Кропы одного размера, уложенные друг под другом: один вызов Laplacian на весь пакет
+    stack = np.zeros((count, height, width), dtype=np.uint8)
+    for i, crop in enumerate(crops):
+        if crop is None or not crop.size:
+            continue
+        heights[i], widths[i] = crop.shape[:2]
+        grey = cv2.cvtColor(crop, cv2.COLOR_BGR2GRAY) if crop.ndim == 3 else crop
+        stack[i] = cv2.resize(grey, SCORE_SIZE, interpolation=cv2.INTER_AREA)
+
+    laplacian = cv2.Laplacian(stack.reshape(count * height, width), cv2.CV_32F).reshape(count, height, width)
+    # Краевые строки каждого кропа видят соседний кроп в стопке и не учитываются
+    sharpness = laplacian[:, 1:-1, 1:-1].reshape(count, -1).var(axis=1)
+    low, high = np.percentile(stack.reshape(count, -1), [5, 95], axis=1)
+    contrast = (high - low) / 255.0
+    aspect = widths / np.maximum(heights, 1.0)
+    return {'height': heights, 'aspect': aspect, 'sharpness': sharpness, 'contrast': contrast}
+
+
+def score_plate_crops(crops):
+    """Качество кропов номеров в [0, 1]: произведение оценок размера, резкости, контраста и формы"""
+    if not len(crops):
+        return np.zeros(0, dtype=np.float32)
+    features = plate_features(crops)
+    size_score = np.clip((features['height'] - MIN_HEIGHT) / (GOOD_HEIGHT - MIN_HEIGHT), 0.0, 1.0)
+    sharpness_score = np.clip(features['sharpness'] / GOOD_SHARPNESS, 0.0, 1.0)
+    contrast_score = np.clip(features['contrast'] / GOOD_CONTRAST, 0.0, 1.0)
+    # Внутри допустимого диапазона пропорций - 1, за его пределами линейно падает до 0 за половину границы
+    aspect = features['aspect']
+    low, high = ASPECT_RANGE
+    aspect_score = np.clip(np.minimum((aspect - low / 2) / (low / 2), (1.5 * high - aspect) / (high / 2)), 0.0, 1.0)
+    return (size_score * sharpness_score * contrast_score * aspect_score).astype(np.float32)
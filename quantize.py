@@ -0,0 +1,302 @@
+# file quantize.py
+"""Статическая INT8-квантизация детектора номеров (ONNX Runtime, CPU).
+
+Модель калибруется на папке своих кадров (например, photos/). Квантованная
+модель кэшируется рядом с .pt-файлом вместе с отчётом о точности относительно
+FP32-модели. Recall проверяется на кадрах, которых не было в калибровке:
+на отдельной папке или на каждом EVAL_HOLDOUT_EVERY-м кадре калибровочной
+папки. Если recall квантованной модели ниже порога, приложение продолжает
+работать на FP32.
+
+Бенчмарк дрейфа точности:
+    python quantize.py --images photos --eval_images photos_eval --min_recall 0.95
+"""
+
+import argparse
+import json
+import logging
+import os
+import re
+import shutil
+import tempfile
+import time
+
+import cv2
+import numpy as np
+
+from backends import export_model, file_hash, load_detector, load_images, run_detector, box_iou, \
+    match_detections
+
+try:
+    from onnxruntime.quantization import quantize_static, QuantFormat, QuantType, CalibrationMethod
+except ImportError:
+    quantize_static = None
+
+logging.basicConfig(level=logging.DEBUG, format='%(asctime)s - %(levelname)s - %(message)s')
+
+DEFAULT_MIN_RECALL = 0.95
+EVAL_HOLDOUT_EVERY = 4  # без отдельной папки проверки каждый 4-й кадр не участвует в калибровке
+
+
+def quantized_path(pt_path):
+    """Путь к кэшированной INT8-модели для .pt-файла"""
+    return f"{os.path.splitext(pt_path)[0]}.{file_hash(pt_path)}.int8.onnx"
+
+
+def report_path(pt_path):
+    """Путь к кэшированному отчёту о точности INT8-модели"""
+    return quantized_path(pt_path) + '.json'
+
+
+def eval_set_name(calibration_folder, eval_folder=None):
+    """Описание набора кадров проверки recall для логов и отчёта"""
+    if eval_folder:
+        return eval_folder
+    return f"{calibration_folder} (every {EVAL_HOLDOUT_EVERY}th frame, held out from calibration)"
+
+
+def split_images(calibration_folder, eval_folder=None):
+    """Кадры калибровки и кадры проверки recall.
+
+    Без eval_folder каждый EVAL_HOLDOUT_EVERY-й кадр калибровочной папки откладывается для проверки.
+    """
+    images = load_images(calibration_folder)
+    if eval_folder:
+        return images, load_images(eval_folder)
+    held_out = [i % EVAL_HOLDOUT_EVERY == EVAL_HOLDOUT_EVERY - 1 for i in range(len(images))]
+    return ([image for image, hold in zip(images, held_out) if not hold],
+            [image for image, hold in zip(images, held_out) if hold])
+
+
+def letterbox(image, imgsz=640, color=(114, 114, 114)):
+    """Масштабирует кадр с сохранением пропорций и дополняет до imgsz x imgsz, как ultralytics"""
+    height, width = image.shape[:2]
+    scale = min(imgsz / height, imgsz / width)
+    new_w, new_h = int(round(width * scale)), int(round(height * scale))
+    resized = cv2.resize(image, (new_w, new_h), interpolation=cv2.INTER_LINEAR)
+    top, left = (imgsz - new_h) // 2, (imgsz - new_w) // 2
+    canvas = np.full((imgsz, imgsz, 3), color, dtype=np.uint8)
+    canvas[top:top + new_h, left:left + new_w] = resized
+    return canvas
+
+
+class CalibrationReader:
+    """Поставщик калибровочных тензоров для quantize_static (интерфейс CalibrationDataReader)"""
+
+    def __init__(self, input_name, images, imgsz=640):
+        self.input_name = input_name
+        self.images = images
+        self.imgsz = imgsz
+        self._iter = iter(images)
+
+    def get_next(self):
+        item = next(self._iter, None)
+        if item is None:
+            return None
+        _, image = item
+        tensor = cv2.cvtColor(letterbox(image, self.imgsz), cv2.COLOR_BGR2RGB)
+        tensor = tensor.transpose(2, 0, 1)[None].astype(np.float32) / 255.0
+        return {self.input_name: np.ascontiguousarray(tensor)}
+
+    def rewind(self):
+        self._iter = iter(self.images)
+
+
+def head_nodes_to_exclude(model):
+    """Узлы DFL-декодера детекционной головы: их квантизация сильнее всего сдвигает боксы"""
+    indices = [int(m.group(1)) for m in (re.match(r'/model\.(\d+)/', node.name) for node in model.graph.node) if m]
+    if not indices:
+        return []
+    head = f'/model.{max(indices)}/dfl/'
+    return [node.name for node in model.graph.node if node.name.startswith(head)]
+
+
+def quantize_detector(pt_path, calibration_folder, imgsz=640, max_images=200, eval_folder=None):
+    """Квантует модель в INT8 (QDQ, веса поканально), если в кэше ещё нет версии для этих весов.
+
+    Кадры проверки recall (см. split_images) в калибровку не попадают.
+    """
+    target = quantized_path(pt_path)
+    if os.path.exists(target):
+        return target
+    if quantize_static is None:
+        raise RuntimeError("onnxruntime is required for INT8 quantization")
+
+    import onnx
+
+    images = split_images(calibration_folder, eval_folder)[0][:max_images]
+    if not images:
+        raise RuntimeError(f"No calibration images found in {calibration_folder}")
+
+    fp32_path = export_model(pt_path, 'onnx', imgsz)
+    fp32_model = onnx.load(fp32_path)
+
+    logging.info(f"Quantizing {pt_path} to INT8 on {len(images)} calibration image(s)...")
+    started = time.time()
+    with tempfile.TemporaryDirectory() as tmp:
+        tmp_output = os.path.join(tmp, 'model.int8.onnx')
+        quantize_static(
+            fp32_path, tmp_output,
+            CalibrationReader(fp32_model.graph.input[0].name, images, imgsz),
+            quant_format=QuantFormat.QDQ,
+            per_channel=True,
+            activation_type=QuantType.QUInt8,
+            weight_type=QuantType.QInt8,
+            calibrate_method=CalibrationMethod.MinMax,
+            nodes_to_exclude=head_nodes_to_exclude(fp32_model))
+
+        # Метаданные ultralytics (stride, imgsz, names) нужны YOLO() для загрузки ONNX-модели
+        quantized = onnx.load(tmp_output)
+        del quantized.metadata_props[:]
+        quantized.metadata_props.extend(fp32_model.metadata_props)
+        onnx.save(quantized, tmp_output)
+        shutil.move(tmp_output, target)
+    logging.info(f"Quantized {pt_path} -> {target} in {time.time() - started:.1f}s")
+    return target
+
+
+def average_precision(reference, candidate, iou_threshold=0.5):
+    """AP кандидата при детекциях эталона в роли разметки (площадь под PR-кривой)"""
+    total = sum(len(ref) for ref in reference)
+    if not total:
+        return 1.0
+
+    scored = []  # (score, true positive)
+    for ref, cand in zip(reference, candidate):
+        if not len(cand):
+            continue
+        order = np.argsort(-cand[:, 4])
+        iou = box_iou(cand[order], ref)
+        used = np.zeros(len(ref), dtype=bool)
+        for row, idx in enumerate(order):
+            hit = False
+            if iou.shape[1]:
+                ious = np.where(used | (ref[:, 5] != cand[idx, 5]), 0.0, iou[row])
+                best = int(np.argmax(ious))
+                if ious[best] >= iou_threshold:
+                    used[best] = True
+                    hit = True
+            scored.append((float(cand[idx, 4]), hit))
+    if not scored:
+        return 0.0
+
+    scored.sort(key=lambda item: -item[0])
+    hits = np.array([hit for _, hit in scored], dtype=np.float64)
+    tp = np.cumsum(hits)
+    recall = tp / total
+    precision = tp / np.arange(1, len(hits) + 1)
+    # Огибающая точности справа налево, интегрирование по всем точкам
+    precision = np.maximum.accumulate(precision[::-1])[::-1]
+    recall = np.concatenate(([0.0], recall))
+    return float(np.sum((recall[1:] - recall[:-1]) * precision))
+
+
+def evaluate_quantized(pt_path, images, imgsz=640, iou_threshold=0.5):
+    """Сравнивает INT8-модель с FP32 (PyTorch, CPU): recall, precision, mAP50 и задержку"""
+    reference, fp32_latency = run_detector(load_detector(pt_path, 'torch', 'cpu'), images, imgsz)
+    from ultralytics import YOLO
+    candidate, int8_latency = run_detector(YOLO(quantized_path(pt_path), task='detect'), images, imgsz)
+
+    total_ref = sum(len(d) for d in reference)
+    total_cand = sum(len(d) for d in candidate)
+    matched = sum(match_detections(ref, cand, iou_threshold)[0] for ref, cand in zip(reference, candidate))
+    return {
+        'model': pt_path,
+        'images': len(images),
+        'fp32_ms': float(np.median(fp32_latency)),
+        'int8_ms': float(np.median(int8_latency)),
+        'speedup': float(np.median(fp32_latency) / max(np.median(int8_latency), 1e-6)),
+        'recall': matched / total_ref if total_ref else 1.0,
+        'precision': matched / total_cand if total_cand else 1.0,
+        'map50': average_precision(reference, candidate, iou_threshold),
+    }
+
+
+def prepare_quantized(pt_path, calibration_folder='photos', min_recall=None, imgsz=640, eval_folder=None):
+    """Квантует модель и проверяет её точность; возвращает путь к INT8-модели или None.
+
+    min_recall - минимальный recall относительно FP32, None - DEFAULT_MIN_RECALL.
+    eval_folder - кадры проверки recall, None - отложенная часть calibration_folder.
+    Отчёт о точности кэшируется вместе с моделью, поэтому проверка выполняется
+    один раз на версию весов и набор кадров проверки.
+    """
+    try:
+        eval_set = eval_set_name(calibration_folder, eval_folder)
+        report_file = report_path(pt_path)
+        report = None
+        if os.path.exists(report_file):
+            with open(report_file, encoding='utf-8') as f:
+                report = json.load(f)
+        if report is not None and report.get('eval_set') != eval_set:
+            # Модель из кэша могла калиброваться на кадрах, по которым теперь проверяется
+            logging.info(f"INT8 cache of {pt_path} was checked on another image set, re-quantizing")
+            for path in (quantized_path(pt_path), report_file):
+                if os.path.exists(path):
+                    os.remove(path)
+            report = None
+
+        target = quantize_detector(pt_path, calibration_folder, imgsz, eval_folder=eval_folder)
+        if report is None:
+            eval_images = split_images(calibration_folder, eval_folder)[1]
+            if not eval_images:
+                raise RuntimeError(f"No evaluation images in {eval_set}")
+            logging.info(f"Checking INT8 {pt_path} recall on {len(eval_images)} image(s) from {eval_set}")
+            report = evaluate_quantized(pt_path, eval_images, imgsz)
+            report['eval_set'] = eval_set
+            with open(report_file, 'w', encoding='utf-8') as f:
+                json.dump(report, f, indent=2)
+    except Exception as e:
+        logging.error(f"INT8 quantization of {pt_path} failed, using FP32: {e}")
+        return None
+
+    min_recall = DEFAULT_MIN_RECALL if min_recall is None else min_recall
+    if report['recall'] < min_recall:
+        logging.error(
+            f"INT8 {pt_path} rejected: recall {report['recall']:.3f} < {min_recall:.3f} "
+            f"(mAP50 {report['map50']:.3f}) on {report['images']} image(s) from {report['eval_set']}, using FP32")
+        return None
+    logging.info(
+        f"INT8 {pt_path} enabled: recall {report['recall']:.3f}, mAP50 {report['map50']:.3f}, "
+        f"x{report['speedup']:.2f} vs FP32 on {report['images']} image(s) from {report['eval_set']}")
+    return target
+
+
+def load_quantized_detector(pt_path, calibration_folder='photos', min_recall=None, imgsz=640, eval_folder=None):
+    """INT8-детектор, прошедший проверку точности, или None"""
+    target = prepare_quantized(pt_path, calibration_folder, min_recall, imgsz, eval_folder)
+    if target is None:
+        return None
+    from ultralytics import YOLO
+    return YOLO(target, task='detect')
+
+
+def parse_args():
+    """Parse input arguments."""
+    parser = argparse.ArgumentParser(description='INT8 quantization of the license plate detector')
+    parser.add_argument('--images', default='photos', help='Folder with calibration frames')
+    parser.add_argument('--eval_images', default=None,
+                        help='Folder with evaluation frames [every %dth frame of --images]' % EVAL_HOLDOUT_EVERY)
+    parser.add_argument('--model', default=None, help='.pt file to quantize [license plate detector]')
+    parser.add_argument('--imgsz', type=int, default=640)
+    parser.add_argument('--min_recall', type=float, default=DEFAULT_MIN_RECALL)
+    return parser.parse_args()
+
+
+if __name__ == '__main__':
+    from models import LICENSE_PLATE_MODEL_PATH
+
+    args = parse_args()
+    pt_path = args.model or LICENSE_PLATE_MODEL_PATH
+    quantize_detector(pt_path, args.images, args.imgsz, eval_folder=args.eval_images)
+
+    eval_set = eval_set_name(args.images, args.eval_images)
+    images = split_images(args.images, args.eval_images)[1]
+    if not images:
+        raise SystemExit(f"No evaluation images in {eval_set}")
+    report = evaluate_quantized(pt_path, images, args.imgsz)
+    print("evaluation set: %s" % eval_set)
+    print("%s [int8] on %d image(s): fp32 %.1f ms, int8 %.1f ms (x%.2f), recall %.3f, precision %.3f, mAP50 %.3f" % (
+        report['model'], report['images'], report['fp32_ms'], report['int8_ms'], report['speedup'],
+        report['recall'], report['precision'], report['map50']))
+    verdict = 'OK' if report['recall'] >= args.min_recall else 'REJECTED'
+    print(f"recall threshold {args.min_recall:.3f}: {verdict}")
@@ -19,29 +19,103 @@ from __future__ import print_function
 
 import os
 import numpy as np
-import matplotlib
-matplotlib.use('TkAgg')
-import matplotlib.pyplot as plt
-import matplotlib.patches as patches
-from skimage import io
 
 import glob
 import time
 import argparse
-from filterpy.kalman import KalmanFilter
+import threading
+from collections import Counter
 
 np.random.seed(0)
 
-
-def linear_assignment(cost_matrix):
+# the assignment solver is resolved once: lap if installed, otherwise scipy
+try:
+  import lap
+  ASSIGNMENT_SOLVER = 'lap'
+except ImportError:
+  lap = None
   try:
-    import lap
-    _, x, y = lap.lapjv(cost_matrix, extend_cost=True)
-    return np.array([[y[i],i] for i in x if i >= 0]) #
-  except ImportError:
     from scipy.optimize import linear_sum_assignment
-    x, y = linear_sum_assignment(cost_matrix)
-    return np.array(list(zip(x, y)))
+    ASSIGNMENT_SOLVER = 'scipy'
+  except ImportError:
+    linear_sum_assignment = None
+    ASSIGNMENT_SOLVER = None
+
+
+def exact_assignment(cost_matrix):
+  """
+  Minimum cost assignment with the solver resolved at import. Returns [K,2] (row, col) pairs.
+  """
+  if lap is not None:
+    _, x, y = lap.lapjv(cost_matrix, extend_cost=True)
+    return np.array([[y[i],i] for i in x if i >= 0], dtype=int).reshape(-1, 2)
+  if linear_sum_assignment is None:
+    raise ImportError("linear assignment needs the lap or scipy package")
+  x, y = linear_sum_assignment(cost_matrix)
+  return np.stack([x, y], axis=1)
+
+
+def greedy_assignment(cost_matrix):
+  """
+  Greedy assignment: repeatedly takes the cheapest entry whose row and column are still free.
+  """
+  n_rows, n_cols = cost_matrix.shape
+  needed = min(n_rows, n_cols)
+  rows, cols = np.unravel_index(np.argsort(cost_matrix, axis=None, kind='stable'), cost_matrix.shape)
+  used_rows = np.zeros(n_rows, dtype=bool)
+  used_cols = np.zeros(n_cols, dtype=bool)
+  pairs = []
+  for r, c in zip(rows.tolist(), cols.tolist()):
+    if used_rows[r] or used_cols[c]:
+      continue
+    used_rows[r] = used_cols[c] = True
+    pairs.append((r, c))
+    if len(pairs) == needed:
+      break
+  return np.array(pairs, dtype=int).reshape(-1, 2)
+
+
+def is_optimal_assignment(cost_matrix, pairs):
+  """
+  Sufficient optimality check: every row (or every column, when there are more rows) got its
+  cheapest entry, so the assignment reaches the lower bound of the sum of row (column) minima.
+  """
+  n_rows, n_cols = cost_matrix.shape
+  if len(pairs) != min(n_rows, n_cols):
+    return False
+  chosen = cost_matrix[pairs[:, 0], pairs[:, 1]]
+  if n_rows <= n_cols:
+    return bool(np.all(chosen <= cost_matrix[pairs[:, 0]].min(axis=1)))
+  return bool(np.all(chosen <= cost_matrix[:, pairs[:, 1]].min(axis=0)))
+
+
+def solve_assignment(cost_matrix, solver='exact'):
+  """
+  Minimum cost assignment through the cheapest sufficient path. Returns ([K,2] (row, col) pairs, path):
+    'empty' - nothing to assign, 'closed_form' - a single row or column or a 2x2 matrix,
+    'greedy' - solver='greedy' and the greedy assignment passed is_optimal_assignment,
+    'lap' / 'scipy' - the exact solver.
+  """
+  n_rows, n_cols = cost_matrix.shape
+  if n_rows == 0 or n_cols == 0:
+    return np.empty((0,2),dtype=int), 'empty'
+  if n_rows == 1:
+    return np.array([[0, np.argmin(cost_matrix[0])]]), 'closed_form'
+  if n_cols == 1:
+    return np.array([[np.argmin(cost_matrix[:, 0]), 0]]), 'closed_form'
+  if n_rows == 2 and n_cols == 2:
+    if cost_matrix[0, 0] + cost_matrix[1, 1] <= cost_matrix[0, 1] + cost_matrix[1, 0]:
+      return np.array([[0, 0], [1, 1]]), 'closed_form'
+    return np.array([[0, 1], [1, 0]]), 'closed_form'
+  if solver == 'greedy':
+    pairs = greedy_assignment(cost_matrix)
+    if is_optimal_assignment(cost_matrix, pairs):
+      return pairs, 'greedy'
+  return exact_assignment(cost_matrix), ASSIGNMENT_SOLVER
+
+
+def linear_assignment(cost_matrix):
+  return solve_assignment(cost_matrix)[0]
 
 
 def iou_batch(bb_test, bb_gt):
@@ -78,6 +152,15 @@ def convert_bbox_to_z(bbox):
   return np.array([x, y, s, r]).reshape((4, 1))
 
 
+def convert_bboxes_to_z(bboxes):
+  """
+  Vectorised convert_bbox_to_z: [N,4+] boxes [x1,y1,x2,y2] -> [N,4] measurements [x,y,s,r]
+  """
+  w = bboxes[:, 2] - bboxes[:, 0]
+  h = bboxes[:, 3] - bboxes[:, 1]
+  return np.stack([bboxes[:, 0] + w/2., bboxes[:, 1] + h/2., w * h, w / h], axis=1)
+
+
 def convert_x_to_bbox(x,score=None):
   """
   Takes a bounding box in the centre form [x,y,s,r] and returns it in the form
@@ -91,6 +174,30 @@ def convert_x_to_bbox(x,score=None):
     return np.array([x[0]-w/2.,x[1]-h/2.,x[0]+w/2.,x[1]+h/2.,score]).reshape((1,5))
 
 
+def convert_x_to_bboxes(x):
+  """
+  Vectorised convert_x_to_bbox: [N,7+] states -> [N,4] boxes [x1,y1,x2,y2]
+  """
+  with np.errstate(invalid='ignore', divide='ignore'):
+    w = np.sqrt(x[:, 2] * x[:, 3])
+    h = x[:, 2] / w
+  return np.stack([x[:, 0]-w/2., x[:, 1]-h/2., x[:, 0]+w/2., x[:, 1]+h/2.], axis=1)
+
+
+_id_lock = threading.Lock()
+
+
+def allocate_ids(count):
+  """
+  Reserves count consecutive track ids from KalmanBoxTracker.count.
+  The lock keeps ids unique when trackers of several cameras are updated from different threads.
+  """
+  with _id_lock:
+    first = KalmanBoxTracker.count
+    KalmanBoxTracker.count += count
+  return first + np.arange(count)
+
+
 class KalmanBoxTracker(object):
   """
   This class represents the internal state of individual tracked objects observed as bbox.
@@ -100,6 +207,7 @@ class KalmanBoxTracker(object):
     """
     Initialises a tracker using initial bounding box.
     """
+    from filterpy.kalman import KalmanFilter  # Sort itself uses BatchKalmanBoxFilter and does not need filterpy
     #define constant velocity model
     self.kf = KalmanFilter(dim_x=7, dim_z=4) 
     self.kf.F = np.array([[1,0,0,0,1,0,0],[0,1,0,0,0,1,0],[0,0,1,0,0,0,1],[0,0,0,1,0,0,0],  [0,0,0,0,1,0,0],[0,0,0,0,0,1,0],[0,0,0,0,0,0,1]])
@@ -113,8 +221,7 @@ class KalmanBoxTracker(object):
 
     self.kf.x[:4] = convert_bbox_to_z(bbox)
     self.time_since_update = 0
-    self.id = KalmanBoxTracker.count
-    KalmanBoxTracker.count += 1
+    self.id = allocate_ids(1)[0]
     self.history = []
     self.hits = 0
     self.hit_streak = 0
@@ -144,20 +251,113 @@ class KalmanBoxTracker(object):
     self.history.append(convert_x_to_bbox(self.kf.x))
     return self.history[-1]
 
+  def coast(self):
+    """
+    Advances the state vector by one frame without an observation and without touching the
+    hit/miss bookkeeping. Used on frames where the detector was skipped.
+    """
+    if((self.kf.x[6]+self.kf.x[2])<=0):
+      self.kf.x[6] *= 0.0
+    self.kf.predict()
+    return self.get_state()
+
   def get_state(self):
     """
     Returns the current bounding box estimate.
     """
     return convert_x_to_bbox(self.kf.x)
 
+  def position_uncertainty(self):
+    """
+    Returns the std of the predicted centre position relative to the box size.
+    """
+    std = np.sqrt(max(self.kf.P[0,0], self.kf.P[1,1]))
+    scale = np.sqrt(max(float(self.kf.x[2,0]), 1.))
+    return std / scale
+
+
+class BatchKalmanBoxFilter(object):
+  """
+  Constant velocity Kalman filters of all tracks of one Sort instance, stored as stacked arrays:
+    x - [N,7] states [x,y,s,r,vx,vy,vs], P - [N,7,7] covariances.
+  predict() and update() run as single vectorised operations over all tracks and match
+  KalmanBoxTracker (filterpy) step for step.
+  """
+  F = np.array([[1,0,0,0,1,0,0],[0,1,0,0,0,1,0],[0,0,1,0,0,0,1],[0,0,0,1,0,0,0],  [0,0,0,0,1,0,0],[0,0,0,0,0,1,0],[0,0,0,0,0,0,1]], dtype=float)
+  R = np.diag([1., 1., 10., 10.])
+  Q = np.diag([1., 1., 1., 1., 0.01, 0.01, 0.0001])
+  P0 = np.diag([10., 10., 10., 10., 10000., 10000., 10000.]) #high uncertainty for the unobservable initial velocities
+
+  def __init__(self):
+    self.x = np.zeros((0, 7))
+    self.P = np.zeros((0, 7, 7))
+
+  def __len__(self):
+    return len(self.x)
 
-def associate_detections_to_trackers(detections,trackers,iou_threshold = 0.3):
+  def add(self, z):
+    """
+    Starts filters for [M,4] measurements z.
+    """
+    x = np.zeros((len(z), 7))
+    x[:, :4] = z
+    self.x = np.concatenate([self.x, x])
+    self.P = np.concatenate([self.P, np.broadcast_to(self.P0, (len(z), 7, 7))])
+
+  def keep(self, mask):
+    """
+    Drops the filters where mask is False.
+    """
+    self.x = self.x[mask]
+    self.P = self.P[mask]
+
+  def predict(self):
+    # the area must not become negative
+    self.x[(self.x[:, 6] + self.x[:, 2]) <= 0, 6] = 0.
+    self.x = self.x @ self.F.T
+    self.P = self.F @ self.P @ self.F.T + self.Q
+
+  def update(self, indices, z):
+    """
+    Corrects the filters at indices with [M,4] measurements z. H selects the first 4 state components.
+    """
+    if not len(indices):
+      return
+    x = self.x[indices]
+    P = self.P[indices]
+    y = z - x[:, :4]
+    S = P[:, :4, :4] + self.R
+    # K = P H' S^-1; S is symmetric, so K' = S^-1 H P
+    K = np.linalg.solve(S, P[:, :4, :]).transpose(0, 2, 1)
+    self.x[indices] = x + (K @ y[:, :, None])[:, :, 0]
+    I_KH = np.eye(7) - np.concatenate([K, np.zeros((len(indices), 7, 3))], axis=2)
+    # Joseph form, as in filterpy
+    self.P[indices] = I_KH @ P @ I_KH.transpose(0, 2, 1) + K @ self.R @ K.transpose(0, 2, 1)
+
+  def boxes(self):
+    """
+    Current box estimates [N,4] in the form [x1,y1,x2,y2].
+    """
+    return convert_x_to_bboxes(self.x)
+
+  def position_uncertainty(self):
+    """
+    Std of the centre position relative to the box size for every filter, as KalmanBoxTracker.position_uncertainty.
+    """
+    std = np.sqrt(np.maximum(self.P[:, 0, 0], self.P[:, 1, 1]))
+    return std / np.sqrt(np.maximum(self.x[:, 2], 1.))
+
+
+def associate_detections_to_trackers(detections,trackers,iou_threshold = 0.3,solver='exact',paths=None):
   """
   Assigns detections to tracked object (both represented as bounding boxes)
+  solver - 'exact' or 'greedy' (see solve_assignment); the assignment path taken is appended to paths
 
   Returns 3 lists of matches, unmatched_detections and unmatched_trackers
   """
   if(len(trackers)==0):
+    if paths is not None:
+      paths.append('empty')
     return np.empty((0,2),dtype=int), np.arange(len(detections)), np.empty((0,5),dtype=int)
 
   iou_matrix = iou_batch(detections, trackers)
@@ -166,10 +366,14 @@ def associate_detections_to_trackers(detections,trackers,iou_threshold = 0.3):
     a = (iou_matrix > iou_threshold).astype(np.int32)
     if a.sum(1).max() == 1 and a.sum(0).max() == 1:
         matched_indices = np.stack(np.where(a), axis=1)
+        path = 'unique'
     else:
-      matched_indices = linear_assignment(-iou_matrix)
+      matched_indices, path = solve_assignment(-iou_matrix, solver)
   else:
     matched_indices = np.empty(shape=(0,2))
+    path = 'empty'
+  if paths is not None:
+    paths.append(path)
 
   unmatched_detections = []
   for d, det in enumerate(detections):
@@ -196,16 +400,173 @@ def associate_detections_to_trackers(detections,trackers,iou_threshold = 0.3):
   return matches, np.array(unmatched_detections), np.array(unmatched_trackers)
 
 
+def iou_pairs(bb_a, bb_b):
+  """
+  IOU of row-aligned pairs of bboxes [x1,y1,x2,y2]: iou_pairs(a, b)[k] = IOU(a[k], b[k])
+  """
+  w = np.maximum(0., np.minimum(bb_a[:, 2], bb_b[:, 2]) - np.maximum(bb_a[:, 0], bb_b[:, 0]))
+  h = np.maximum(0., np.minimum(bb_a[:, 3], bb_b[:, 3]) - np.maximum(bb_a[:, 1], bb_b[:, 1]))
+  wh = w * h
+  return wh / ((bb_a[:, 2] - bb_a[:, 0]) * (bb_a[:, 3] - bb_a[:, 1])
+    + (bb_b[:, 2] - bb_b[:, 0]) * (bb_b[:, 3] - bb_b[:, 1]) - wh)
+
+
+def overlapping_pairs(bb_a, bb_b):
+  """
+  Sort-and-sweep search for intersecting boxes. Returns index arrays (i, j) of all pairs
+  where bb_a[i] and bb_b[j] overlap.
+
+  bb_b is sorted by x1; a box of bb_a can only overlap the sorted run of boxes whose x1 lies in
+  [a.x1 - widest bb_b box, a.x2), so IOU is never evaluated for far apart pairs.
+  """
+  if len(bb_a) == 0 or len(bb_b) == 0:
+    return np.empty(0, dtype=int), np.empty(0, dtype=int)
+  order = np.argsort(bb_b[:, 0], kind='stable')
+  x1_sorted = bb_b[order, 0]
+  max_width = np.max(bb_b[:, 2] - bb_b[:, 0])
+  start = np.searchsorted(x1_sorted, bb_a[:, 0] - max_width, side='left')
+  counts = np.maximum(np.searchsorted(x1_sorted, bb_a[:, 2], side='left') - start, 0)
+  a_idx = np.repeat(np.arange(len(bb_a)), counts)
+  offsets = np.arange(counts.sum()) - np.repeat(np.cumsum(counts) - counts, counts)
+  b_idx = order[np.repeat(start, counts) + offsets]
+  a = bb_a[a_idx]
+  b = bb_b[b_idx]
+  overlap = ((np.minimum(a[:, 2], b[:, 2]) > np.maximum(a[:, 0], b[:, 0])) &
+             (np.minimum(a[:, 3], b[:, 3]) > np.maximum(a[:, 1], b[:, 1])))
+  return a_idx[overlap], b_idx[overlap]
+
+
+def connected_components(n_a, n_b, a_idx, b_idx):
+  """
+  Labels the edges (a_idx[k], b_idx[k]) of a bipartite graph by connected component (union-find).
+  """
+  parent = list(range(n_a + n_b))
+  def find(i):
+    while parent[i] != i:
+      parent[i] = parent[parent[i]]
+      i = parent[i]
+    return i
+  for i, j in zip(a_idx.tolist(), (b_idx + n_a).tolist()):
+    ri, rj = find(i), find(j)
+    if ri != rj:
+      parent[ri] = rj
+  return np.array([find(i) for i in a_idx.tolist()], dtype=int)
+
+
+def associate_detections_to_trackers_sparse(detections,trackers,iou_threshold = 0.3,solver='exact',paths=None):
+  """
+  Same contract as associate_detections_to_trackers for large numbers of boxes.
+
+  IOU is computed only for the overlapping pairs found by overlapping_pairs, pairs below
+  iou_threshold are dropped before the assignment (the dense version rejects them after it),
+  and the assignment is solved separately for every connected component of the remaining pairs.
+  """
+  if(len(trackers)==0):
+    if paths is not None:
+      paths.append('empty')
+    return np.empty((0,2),dtype=int), np.arange(len(detections)), np.empty((0,5),dtype=int)
+
+  d_idx, t_idx = overlapping_pairs(detections, trackers)
+  iou = iou_pairs(detections[d_idx], trackers[t_idx])
+  gated = iou >= iou_threshold
+  d_idx, t_idx, iou = d_idx[gated], t_idx[gated], iou[gated]
+
+  matches = []
+  if len(d_idx):
+    labels = connected_components(len(detections), len(trackers), d_idx, t_idx)
+    _, label_pos, label_counts = np.unique(labels, return_inverse=True, return_counts=True)
+    # a component with a single pair is a match as is
+    single = label_counts[label_pos] == 1
+    matches.extend(zip(d_idx[single].tolist(), t_idx[single].tolist()))
+    if paths is not None and single.any():
+      paths.append('unique')
+    shared = np.flatnonzero(~single)
+    order = shared[np.argsort(labels[shared], kind='stable')]
+    for edges in np.split(order, np.flatnonzero(np.diff(labels[order])) + 1) if len(order) else []:
+      rows, row_pos = np.unique(d_idx[edges], return_inverse=True)
+      cols, col_pos = np.unique(t_idx[edges], return_inverse=True)
+      cost = np.zeros((len(rows), len(cols)))
+      cost[row_pos, col_pos] = -iou[edges]
+      pairs, path = solve_assignment(cost, solver)
+      if paths is not None:
+        paths.append(path)
+      for r, c in pairs:
+        if cost[r, c] < 0: # pairs outside the component graph are not matches
+          matches.append((rows[r], cols[c]))
+
+  elif paths is not None:
+    paths.append('empty')
+
+  matches = np.array(matches, dtype=int).reshape(-1, 2)
+  det_matched = np.zeros(len(detections), dtype=bool)
+  det_matched[matches[:, 0]] = True
+  trk_matched = np.zeros(len(trackers), dtype=bool)
+  trk_matched[matches[:, 1]] = True
+  return matches, np.flatnonzero(~det_matched), np.flatnonzero(~trk_matched)
+
+
+# association='auto' switches to the sparse association from this many detection-tracker pairs
+SPARSE_ASSOCIATION_MIN_PAIRS = 1024
+
+
 class Sort(object):
-  def __init__(self, max_age=1, min_hits=3, iou_threshold=0.3):
+  def __init__(self, max_age=1, min_hits=3, iou_threshold=0.3, association='dense', solver='exact'):
     """
     Sets key parameters for SORT
+    association - 'dense' (IOU of all detection-tracker pairs), 'sparse' (associate_detections_to_trackers_sparse)
+      or 'auto' (sparse from SPARSE_ASSOCIATION_MIN_PAIRS pairs)
+    solver - 'exact' or 'greedy' (greedy assignment verified against the row/column minima bound)
     """
+    if association not in ('dense', 'sparse', 'auto'):
+      raise ValueError("association must be 'dense', 'sparse' or 'auto'")
+    if solver not in ('exact', 'greedy'):
+      raise ValueError("solver must be 'exact' or 'greedy'")
+    self.solver = solver
+    # assignment paths taken (see solve_assignment): on the last update() and in total
+    self.last_assignment_paths = []
+    self.assignment_paths = Counter()
     self.max_age = max_age
     self.min_hits = min_hits
     self.iou_threshold = iou_threshold
-    self.trackers = []
+    self.association = association
     self.frame_count = 0
+    # per-track state, index-aligned with the filters
+    self.kf = BatchKalmanBoxFilter()
+    self.ids = np.zeros(0, dtype=int)
+    self.time_since_update = np.zeros(0, dtype=int)
+    self.hits = np.zeros(0, dtype=int)
+    self.hit_streak = np.zeros(0, dtype=int)
+    self.age = np.zeros(0, dtype=int)
+
+  def __len__(self):
+    return len(self.ids)
+
+  def _keep(self, mask):
+    self.kf.keep(mask)
+    self.ids = self.ids[mask]
+    self.time_since_update = self.time_since_update[mask]
+    self.hits = self.hits[mask]
+    self.hit_streak = self.hit_streak[mask]
+    self.age = self.age[mask]
+
+  def _add(self, dets):
+    count = len(dets)
+    self.kf.add(convert_bboxes_to_z(dets))
+    # ids stay unique across Sort instances, as with KalmanBoxTracker
+    self.ids = np.concatenate([self.ids, allocate_ids(count)])
+    zeros = np.zeros(count, dtype=int)
+    self.time_since_update = np.concatenate([self.time_since_update, zeros])
+    self.hits = np.concatenate([self.hits, zeros])
+    self.hit_streak = np.concatenate([self.hit_streak, zeros])
+    self.age = np.concatenate([self.age, zeros])
+
+  def _reported(self, boxes):
+    """
+    Tracks updated on the last update() that are confirmed, as [[x1,y1,x2,y2,ID],...].
+    """
+    mask = (self.time_since_update < 1) & ((self.hit_streak >= self.min_hits) | (self.frame_count <= self.min_hits))
+    mask &= ~np.isnan(boxes).any(axis=1)
+    return np.concatenate((boxes[mask], self.ids[mask, None] + 1), axis=1) # +1 as MOT benchmark requires positive
 
   def update(self, dets=np.empty((0, 5))):
     """
@@ -218,39 +579,59 @@ class Sort(object):
     """
     self.frame_count += 1
     # get predicted locations from existing trackers.
-    trks = np.zeros((len(self.trackers), 5))
-    to_del = []
-    ret = []
-    for t, trk in enumerate(trks):
-      pos = self.trackers[t].predict()[0]
-      trk[:] = [pos[0], pos[1], pos[2], pos[3], 0]
-      if np.any(np.isnan(pos)):
-        to_del.append(t)
-    trks = np.ma.compress_rows(np.ma.masked_invalid(trks))
-    for t in reversed(to_del):
-      self.trackers.pop(t)
-    matched, unmatched_dets, unmatched_trks = associate_detections_to_trackers(dets,trks, self.iou_threshold)
+    self.kf.predict()
+    self.age += 1
+    self.hit_streak[self.time_since_update > 0] = 0
+    self.time_since_update += 1
+    trks = self.kf.boxes()
+    valid = ~np.isnan(trks).any(axis=1)
+    if not valid.all():
+      self._keep(valid)
+      trks = trks[valid]
+    sparse = self.association == 'sparse' or (
+      self.association == 'auto' and len(dets) * len(trks) >= SPARSE_ASSOCIATION_MIN_PAIRS)
+    associate = associate_detections_to_trackers_sparse if sparse else associate_detections_to_trackers
+    self.last_assignment_paths = []
+    matched, unmatched_dets, unmatched_trks = associate(dets, trks, self.iou_threshold, self.solver,
+                                                        self.last_assignment_paths)
+    self.assignment_paths.update(self.last_assignment_paths)
 
     # update matched trackers with assigned detections
-    for m in matched:
-      self.trackers[m[1]].update(dets[m[0], :])
+    if len(matched):
+      trk_indices = matched[:, 1]
+      self.kf.update(trk_indices, convert_bboxes_to_z(dets[matched[:, 0]]))
+      self.time_since_update[trk_indices] = 0
+      self.hits[trk_indices] += 1
+      self.hit_streak[trk_indices] += 1
 
     # create and initialise new trackers for unmatched detections
-    for i in unmatched_dets:
-        trk = KalmanBoxTracker(dets[i,:])
-        self.trackers.append(trk)
-    i = len(self.trackers)
-    for trk in reversed(self.trackers):
-        d = trk.get_state()[0]
-        if (trk.time_since_update < 1) and (trk.hit_streak >= self.min_hits or self.frame_count <= self.min_hits):
-          ret.append(np.concatenate((d,[trk.id+1])).reshape(1,-1)) # +1 as MOT benchmark requires positive
-        i -= 1
-        # remove dead tracklet
-        if(trk.time_since_update > self.max_age):
-          self.trackers.pop(i)
-    if(len(ret)>0):
-      return np.concatenate(ret)
-    return np.empty((0,5))
+    if len(unmatched_dets):
+      self._add(dets[unmatched_dets.astype(int)])
+
+    ret = self._reported(self.kf.boxes())
+    # remove dead tracklets
+    alive = self.time_since_update <= self.max_age
+    if not alive.all():
+      self._keep(alive)
+    # newest tracks first, as in the original per-tracker loop
+    return ret[::-1] if len(ret) else np.empty((0,5))
+
+  def predict(self):
+    """
+    Advances all trackers by one frame on which no detection was run.
+    Returns the predicted boxes of the tracks reported by the last update(), in the same format.
+    """
+    self.kf.predict()
+    ret = self._reported(self.kf.boxes())
+    return ret if len(ret) else np.empty((0,5))
+
+  def max_position_uncertainty(self):
+    """
+    Largest relative position uncertainty over live trackers (0 when there are none).
+    """
+    if not len(self):
+      return 0.
+    return float(self.kf.position_uncertainty().max())
 
 def parse_args():
     """Parse input arguments."""
@@ -265,6 +646,10 @@ def parse_args():
                         help="Minimum number of associated detections before track is initialised.", 
                         type=int, default=3)
     parser.add_argument("--iou_threshold", help="Minimum IOU for match.", type=float, default=0.3)
+    parser.add_argument("--association", help="Detection-tracker association: dense, sparse or auto.",
+                        choices=['dense', 'sparse', 'auto'], default='dense')
+    parser.add_argument("--solver", help="Assignment solver: exact, or greedy verified against a lower bound.",
+                        choices=['exact', 'greedy'], default='exact')
     args = parser.parse_args()
     return args
 
@@ -275,8 +660,15 @@ if __name__ == '__main__':
   phase = args.phase
   total_time = 0.0
   total_frames = 0
+  assignment_paths = Counter()
   colours = np.random.rand(32, 3) #used only for display
   if(display):
+    # display-only dependencies; the tracker itself must import on headless servers
+    import matplotlib
+    matplotlib.use('TkAgg')
+    import matplotlib.pyplot as plt
+    import matplotlib.patches as patches
+    from skimage import io
     if not os.path.exists('mot_benchmark'):
       print('\n\tERROR: mot_benchmark link not found!\n\n    Create a symbolic link to the MOT benchmark\n    (https://motchallenge.net/data/2D_MOT_2015/#download). E.g.:\n\n    $ ln -s /path/to/MOT2015_challenge/2DMOT2015 mot_benchmark\n\n')
       exit()
@@ -290,7 +682,9 @@ if __name__ == '__main__':
   for seq_dets_fn in glob.glob(pattern):
     mot_tracker = Sort(max_age=args.max_age, 
                        min_hits=args.min_hits,
-                       iou_threshold=args.iou_threshold) #create instance of the SORT tracker
+                       iou_threshold=args.iou_threshold,
+                       association=args.association,
+                       solver=args.solver) #create instance of the SORT tracker
     seq_dets = np.loadtxt(seq_dets_fn, delimiter=',')
     seq = seq_dets_fn[pattern.find('*'):].split(os.path.sep)[0]
     
@@ -312,6 +706,7 @@ if __name__ == '__main__':
         trackers = mot_tracker.update(dets)
         cycle_time = time.time() - start_time
         total_time += cycle_time
+        assignment_paths.update(mot_tracker.last_assignment_paths)
 
         for d in trackers:
           print('%d,%d,%.2f,%.2f,%.2f,%.2f,1,-1,-1,-1'%(frame,d[4],d[0],d[1],d[2]-d[0],d[3]-d[1]),file=out_file)
@@ -325,6 +720,7 @@ if __name__ == '__main__':
           ax1.cla()
 
   print("Total Tracking took: %.3f seconds for %d frames or %.1f FPS" % (total_time, total_frames, total_frames / total_time))
+  print("Assignment paths: %s" % dict(assignment_paths))
 
   if(display):
     print("Note: to get real runtime results run without the option: --display")
@@ -0,0 +1,99 @@
+# file tests/test_ocr.py
+"""CRNNBackend.read_batch на заглушке ONNX-сессии и выбор бэкенда в configure()"""
+
+import os
+import sys
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import ocr
+from ocr import CRNNBackend
+
+ALPHABET = '0123456789'
+
+
+class ModelInput:
+    name = 'image'
+    shape = ['batch', 1, 32, 128]
+
+
+class ModelMeta:
+    custom_metadata_map = {}
+
+
+class StubSession:
+    """Возвращает заранее заданные выходы CTC [N, T, классы] для каждого пакета"""
+
+    def __init__(self, outputs, time_major=False):
+        self.outputs = list(outputs)
+        self.time_major = time_major
+        self.batches = []
+
+    def get_inputs(self):
+        return [ModelInput()]
+
+    def get_modelmeta(self):
+        return ModelMeta()
+
+    def run(self, output_names, feeds):
+        batch = feeds[ModelInput.name]
+        self.batches.append(batch)
+        output = self.outputs.pop(0)
+        assert output.shape[0] == len(batch)
+        return [output.transpose(1, 0, 2) if self.time_major else output]
+
+
+def ctc_output(text, steps=8, confidence=0.9):
+    """Вероятности [T, классы]: символы текста через blank, хвост - blank"""
+    classes = len(ALPHABET) + 1
+    labels = []
+    for char in text:
+        labels += [ALPHABET.index(char) + 1, 0]
+    labels += [0] * (steps - len(labels))
+    probs = np.full((steps, classes), (1.0 - confidence) / (classes - 1), dtype=np.float32)
+    probs[np.arange(steps), labels] = confidence
+    return probs
+
+
+def crops(count):
+    return [np.full((20 + i, 90, 3), 40 * i, dtype=np.uint8) for i in range(count)]
+
+
+def test_read_batch_decodes_ctc_probabilities():
+    session = StubSession([np.stack([ctc_output('123'), ctc_output('77')])])
+    backend = CRNNBackend(alphabet=ALPHABET, session=session)
+
+    results = backend.read_batch(crops(2))
+
+    assert [candidates[0][0] for candidates in results] == ['123', '77']  # blank разделяет повтор символа
+    assert all(abs(candidates[0][1] - 0.9) < 1e-4 for candidates in results)
+    assert session.batches[0].shape == (2, 1, 32, 128)
+    assert session.batches[0].min() >= -1.0 and session.batches[0].max() <= 1.0
+
+
+def test_read_batch_handles_time_major_logits_and_batches():
+    logits = [np.log(np.stack([ctc_output('45'), ctc_output('9')])), np.log(ctc_output('0')[None])]
+    session = StubSession(logits, time_major=True)
+    backend = CRNNBackend(alphabet=ALPHABET, batch_size=2, session=session)
+
+    results = backend.read_batch(crops(3))
+
+    assert [candidates[0][0] for candidates in results] == ['45', '9', '0']
+    assert len(session.batches) == 2
+
+
+def test_configure_crnn_without_model_falls_back_to_easyocr(tmp_path):
+    try:
+        ocr.configure('crnn', model_path=str(tmp_path / 'missing.onnx'))
+        assert ocr.backend_spec() == {'name': 'easyocr'}
+        ocr.configure('crnn')
+        assert ocr.backend_spec() == {'name': 'easyocr'}
+
+        model_path = tmp_path / 'plate_crnn.onnx'
+        model_path.write_bytes(b'')
+        ocr.configure('crnn', model_path=str(model_path))
+        assert ocr.backend_spec() == {'name': 'crnn', 'model_path': str(model_path)}
+    finally:
+        ocr.configure()
@@ -0,0 +1,65 @@
+# file tests/test_ocr_cache.py
+"""Кэш OCR: разные номера не должны совпадать, тот же номер с шумом - должен"""
+
+import os
+import sys
+
+import cv2
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from ocr_cache import OCRCache
+
+LETTERS = 'ABEKMHOPCTYX'
+
+
+def render_plate(text, rng=None, shift=0):
+    """Синтетический кроп номера 60x240 с текстом; rng - шум сенсора, shift - сдвиг кропа по x"""
+    plate = np.full((60, 240 + abs(shift)), 235, dtype=np.uint8)
+    cv2.rectangle(plate, (1, 1), (plate.shape[1] - 2, 58), 20, 2)
+    cv2.putText(plate, text, (12, 45), cv2.FONT_HERSHEY_SIMPLEX, 1.3, 20, 3)
+    plate = plate[:, abs(shift):] if shift > 0 else plate[:, :240]
+    if rng is not None:
+        plate = np.clip(plate + rng.normal(0, 4, plate.shape), 0, 255).astype(np.uint8)
+    return cv2.cvtColor(plate, cv2.COLOR_GRAY2BGR)
+
+
+def random_plate(rng):
+    return (LETTERS[rng.integers(len(LETTERS))] + ''.join(str(d) for d in rng.integers(0, 10, 3)) +
+            ''.join(LETTERS[i] for i in rng.integers(0, len(LETTERS), 2)) +
+            ''.join(str(d) for d in rng.integers(0, 10, 2)))
+
+
+def test_different_plates_never_hit():
+    rng = np.random.default_rng(0)
+    texts = {random_plate(rng) for _ in range(300)}
+    texts.update(['H248YA15', 'K006CA21'])
+    cache = OCRCache(max_size=1000, ttl=60.0)
+    for text in sorted(texts):
+        key = cache.key(render_plate(text))
+        assert cache.get(key) in (None, (text, 0.9)), text
+        cache.put(key, (text, 0.9))
+    assert cache.hits == 0
+
+
+def test_same_plate_with_noise_and_shift_passes_thumbnail_check():
+    rng = np.random.default_rng(1)
+    cache = OCRCache()
+    key = cache.key(render_plate('H248YA15'))
+    cache.put(key, ('H248YA15', 0.9))
+    assert cache.get(key) == ('H248YA15', 0.9)
+    for crop in (render_plate('H248YA15', rng), render_plate('H248YA15', rng, shift=1)):
+        # Тот же хэш-ключ, миниатюра с шумом и сдвигом
+        assert cache.get((key[0], cache.key(crop)[1])) == ('H248YA15', 0.9)
+    assert cache.collisions == 0
+
+
+def test_hash_collision_is_rejected_by_thumbnail():
+    cache = OCRCache()
+    first, second = render_plate('H248YA15'), render_plate('K006CA21')
+    hash_key = cache.key(first)[0]
+    cache.put((hash_key, cache.key(first)[1]), ('H248YA15', 0.9))
+    # Другой номер с тем же хэш-ключом
+    assert cache.get((hash_key, cache.key(second)[1])) is None
+    assert cache.collisions == 1
@@ -0,0 +1,66 @@
+# file tests/test_ocr_pool.py
+"""Таймаут запросов OCRPool при медленном старте процессов OCR"""
+
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from ocr_pool import OCRPool, serve_requests
+
+STARTUP_DELAY = 2.0
+REQUEST_TIMEOUT = 0.5
+
+
+def read_plates(crops, mode):
+    return [('A123BC77', 0.9)] * len(crops)
+
+
+def hanging_read(crops, mode):
+    time.sleep(60)
+
+
+def slow_start_worker(task_queue, result_queue, torch_threads, backend_spec):
+    time.sleep(STARTUP_DELAY)  # как импорт torch и загрузка EasyOCR
+    serve_requests(task_queue, result_queue, read_plates)
+
+
+def hanging_worker(task_queue, result_queue, torch_threads, backend_spec):
+    serve_requests(task_queue, result_queue, hanging_read)
+
+
+def wait_for_results(pool, seconds):
+    deadline = time.time() + seconds
+    while time.time() < deadline:
+        ready = pool.poll()
+        if ready:
+            return ready
+        time.sleep(0.05)
+    return []
+
+
+def test_requests_queued_during_slow_startup_do_not_expire():
+    pool = OCRPool(processes=1, backend_spec={}, request_timeout=REQUEST_TIMEOUT,
+                   worker=slow_start_worker).start()
+    try:
+        assert pool.submit(['crop'], 'first', preprocess_steps=())
+        assert pool.submit(['crop', 'crop'], 'second', preprocess_steps=())
+        results = wait_for_results(pool, STARTUP_DELAY + 10.0)
+        results += wait_for_results(pool, 5.0) if len(results) < 2 else []
+        assert sorted(context for context, _ in results) == ['first', 'second']
+        assert all(reads is not None for _, reads in results)
+        assert pool.expired == 0
+    finally:
+        pool.stop()
+
+
+def test_request_expires_after_worker_picks_it_up():
+    pool = OCRPool(processes=1, backend_spec={}, request_timeout=REQUEST_TIMEOUT,
+                   worker=hanging_worker).start()
+    try:
+        assert pool.submit(['crop'], 'stuck', preprocess_steps=())
+        assert wait_for_results(pool, 15.0) == [('stuck', None)]
+        assert pool.expired == 1
+    finally:
+        pool.stop()
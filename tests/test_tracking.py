@@ -0,0 +1,42 @@
+# file tests/test_tracking.py
+"""Уникальность номеров треков при параллельном обновлении трекеров камер"""
+
+import os
+import sys
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from sort import sort
+from tracking import TrackerRegistry
+
+
+def test_update_many_with_workers_gives_unique_track_ids():
+    # Каждая камера видит много новых ТС на каждом кадре: номера выделяются из нескольких потоков сразу
+    cameras = list(range(8))
+    trackers = TrackerRegistry(max_age=1, min_hits=0, workers=4)
+    rng = np.random.default_rng(0)
+    switch_interval = sys.getswitchinterval()
+    sys.setswitchinterval(1e-6)  # частые переключения потоков, чтобы гонка проявлялась
+    try:
+        for _ in range(20):
+            detections = []
+            for camera_id in cameras:
+                corners = rng.random((30, 2)) * 1000
+                boxes = np.hstack([corners, corners + 20, np.ones((30, 1))])
+                detections.append((camera_id, boxes))
+            trackers.update_many(detections)
+    finally:
+        sys.setswitchinterval(switch_interval)
+        trackers.close()
+
+    ids = np.concatenate([trackers.get(camera_id).ids for camera_id in cameras])
+    assert len(ids) == len(np.unique(ids))
+
+
+def test_allocate_ids_is_consecutive_and_advances_counter():
+    start = sort.KalmanBoxTracker.count
+    ids = sort.allocate_ids(3)
+    assert list(ids) == [start, start + 1, start + 2]
+    assert sort.KalmanBoxTracker.count == start + 3
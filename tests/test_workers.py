@@ -0,0 +1,48 @@
+# file tests/test_workers.py
+"""Сброс состояния камеры в процессе-воркере после переподключения (run_multiprocess)"""
+
+import os
+import queue
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from pipeline import RecognitionPipeline
+from tracking import TrackerRegistry
+from workers import WorkerPool, apply_releases
+
+
+def make_pipeline():
+    pipeline = RecognitionPipeline(None, None, TrackerRegistry(), ocr_cache_size=0)
+    for camera_id in (1, 2):
+        pipeline.trackers.update(camera_id, [[0, 0, 100, 100, 0.9]])
+        track_id = float(pipeline.trackers.get(camera_id).ids[0] + 1)
+        pipeline.tracked_plates[track_id] = {'camera_id': camera_id}
+    return pipeline
+
+
+def test_apply_releases_drops_only_requested_camera():
+    pipeline = make_pipeline()
+    camera_2_track = float(pipeline.trackers.get(2).ids[0] + 1)
+    control_queue = queue.Queue()
+    control_queue.put(1)
+
+    assert apply_releases(control_queue, pipeline) == [1]
+    assert 1 not in pipeline.trackers
+    assert 2 in pipeline.trackers
+    assert [state['camera_id'] for state in pipeline.tracked_plates.values()] == [2]
+    assert camera_2_track in pipeline.tracked_plates
+    assert apply_releases(control_queue, pipeline) == []
+
+
+def test_release_camera_goes_to_owning_worker():
+    pool = WorkerPool([1, 2, 3], cameras_per_process=2)
+    first, second = queue.Queue(), queue.Queue()
+    pool.controls = {1: first, 2: first, 3: second}
+
+    pool.release_camera(3)
+    pool.release_camera(4)  # неизвестная камера игнорируется
+
+    assert first.empty()
+    assert second.get_nowait() == 3
+    assert second.empty()
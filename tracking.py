@@ -0,0 +1,129 @@
+# file tracking.py
+"""Трекеры SORT по камерам.
+
+Один общий Sort смешивает треки разных камер, а каждый его вызов старит треки
+всех остальных камер. TrackerRegistry держит отдельный Sort на каждую камеру со
+своим счётчиком кадров и своими max_age/min_hits; состояние камеры
+освобождается при её отключении. Номера треков остаются уникальными между
+камерами (общий счётчик KalmanBoxTracker.count), поэтому состояние номеров в
+RecognitionPipeline по-прежнему ключуется одним track_id.
+"""
+
+import logging
+import threading
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+from sort.sort import Sort
+
+logging.basicConfig(level=logging.DEBUG, format='%(asctime)s - %(levelname)s - %(message)s')
+
+EMPTY_TRACKS = np.empty((0, 5))
+
+
+class TrackerRegistry:
+    """Sort на каждую камеру; создаётся при первом кадре камеры.
+
+    max_age, min_hits, iou_threshold, association, solver - настройки Sort по умолчанию
+    (association='sparse' или 'auto' - сопоставление через пространственный индекс для сотен боксов,
+    solver='greedy' - жадное назначение с проверкой оптимальности вместо точного решателя),
+    camera_options - {camera_id: {'max_age': ..., 'min_hits': ..., 'association': ...}},
+    workers > 1 - update_many() обновляет трекеры разных камер параллельно в потоках.
+    """
+
+    def __init__(self, max_age=1, min_hits=3, iou_threshold=0.3, association='dense', solver='exact',
+                 camera_options=None, workers=0):
+        self.defaults = {'max_age': max_age, 'min_hits': min_hits, 'iou_threshold': iou_threshold,
+                         'association': association, 'solver': solver}
+        self.camera_options = dict(camera_options or {})
+        self.workers = workers
+        self._trackers = {}
+        self._lock = threading.Lock()
+        self._executor = None
+
+    def __len__(self):
+        return len(self._trackers)
+
+    def __contains__(self, camera_id):
+        return camera_id in self._trackers
+
+    def camera_ids(self):
+        with self._lock:
+            return list(self._trackers)
+
+    def options(self, camera_id):
+        return {**self.defaults, **self.camera_options.get(camera_id, {})}
+
+    def configure(self, camera_id, **options):
+        """Меняет настройки трекера камеры; текущие треки камеры сбрасываются"""
+        self.camera_options[camera_id] = {**self.camera_options.get(camera_id, {}), **options}
+        self.release(camera_id)
+
+    def get(self, camera_id):
+        with self._lock:
+            tracker = self._trackers.get(camera_id)
+            if tracker is None:
+                tracker = self._trackers[camera_id] = Sort(**self.options(camera_id))
+            return tracker
+
+    def release(self, camera_id):
+        """Забывает трекер отключённой камеры; возвращает его (или None), чтобы можно было очистить связанные данные"""
+        with self._lock:
+            tracker = self._trackers.pop(camera_id, None)
+        if tracker is not None:
+            logging.debug(f"Released tracker of camera {camera_id} with {len(tracker)} track(s)")
+        return tracker
+
+    def update(self, camera_id, vehicle_boxes):
+        """Кадр с детекцией: [[x1, y1, x2, y2, score], ...] -> [[x1, y1, x2, y2, track_id], ...].
+
+        Кадр без ТС тоже обновляет трекер: треки камеры стареют и удаляются по max_age.
+        """
+        dets = np.asarray(vehicle_boxes, dtype=float).reshape(-1, 5) if len(vehicle_boxes) else EMPTY_TRACKS
+        return self.get(camera_id).update(dets)
+
+    def update_many(self, detections):
+        """Обновляет трекеры нескольких камер: [(camera_id, vehicle_boxes), ...] -> треки в том же порядке"""
+        results = [None] * len(detections)
+        # Кадры одной камеры обновляют её трекер строго по очереди
+        by_camera = {}
+        for i, (camera_id, _) in enumerate(detections):
+            by_camera.setdefault(camera_id, []).append(i)
+
+        def update_camera(indices):
+            for i in indices:
+                results[i] = self.update(*detections[i])
+
+        if self.workers > 1 and len(by_camera) > 1:
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix='tracker')
+            list(self._executor.map(update_camera, by_camera.values()))
+        else:
+            for indices in by_camera.values():
+                update_camera(indices)
+        return results
+
+    def predict(self, camera_id):
+        """Кадр без детекции: предсказанные фильтром Калмана боксы треков камеры"""
+        tracker = self._trackers.get(camera_id)
+        return tracker.predict() if tracker is not None else EMPTY_TRACKS
+
+    def max_position_uncertainty(self, camera_id):
+        tracker = self._trackers.get(camera_id)
+        return tracker.max_position_uncertainty() if tracker is not None else 0.
+
+    def assignment_stats(self):
+        """Сколько раз каждый путь назначения (unique, closed_form, greedy, lap/scipy, ...) сработал на всех камерах"""
+        total = Counter()
+        with self._lock:
+            trackers = list(self._trackers.values())
+        for tracker in trackers:
+            total.update(tracker.assignment_paths)
+        return total
+
+    def close(self):
+        if self._executor is not None:
+            self._executor.shutdown(wait=False)
+            self._executor = None
@@ -6,9 +6,7 @@ from datetime import datetime
 import threading
 import time
 
-import mysql
 import numpy as np
-import torch
 from PyQt5.QtWidgets import (
     QWidget, QLabel, QSizePolicy, QTextEdit, QPushButton, QVBoxLayout, QApplication,
     QMenuBar, QMenu, QAction, QInputDialog, QLineEdit, QCheckBox, QDialog,
@@ -19,14 +17,14 @@ from PyQt5.QtCore import Qt, QTimer, pyqtSignal
 from PyQt5.QtGui import QImage, QPixmap, QColor, QPainter, QPen
 from PIL import ImageFont, ImageDraw, Image
 import cv2
-import requests
-from util import model_prediction, reader, draw_best_result, db_config, draw_tracked_plate, license_complies_format, \
-    read_license_plate, get_plate_center, get_car_center, is_plate_inside_car, draw_tracking_info
+import plate_grammar
+from util import model_prediction, db_config, OCR_MODE
 from queue import Queue
 import socket
 import os
 
-from util import draw_license_plate_text
+from capture import open_camera
+from engine import ProcessingEngine
 
 logging.basicConfig(level=logging.DEBUG, format='%(asctime)s - %(levelname)s - %(message)s')
 
@@ -126,6 +124,7 @@ class CameraSelectionDialog(QDialog):
         self.load_cameras()
 
     def load_cameras(self):
+        import mysql.connector
         try:
             conn = mysql.connector.connect(**db_config)
             cursor = conn.cursor(dictionary=True)
@@ -213,6 +212,7 @@ class CameraManagementDialog(QDialog):
 
     def load_cameras(self):
         """Загружает список камер из базы данных"""
+        import mysql.connector
         try:
             # Подключаемся к базе данных
             conn = mysql.connector.connect(**db_config)
@@ -262,6 +262,7 @@ class CameraManagementDialog(QDialog):
 
     def add_camera(self):
         """Добавляет новую камеру"""
+        import mysql.connector
         try:
             # Получаем данные из диалога
             ip, ok = QInputDialog.getText(self, "Добавить камеру", "Введите IP адрес камеры:")
@@ -293,6 +294,7 @@ class CameraManagementDialog(QDialog):
 
     def update_camera(self, row):
         """Обновляет данные камеры"""
+        import mysql.connector
         try:
             # Получаем данные из таблицы
             camera_id = int(self.table.item(row, 0).text())
@@ -319,6 +321,7 @@ class CameraManagementDialog(QDialog):
 
     def delete_camera(self, row):
         """Удаляет камеру"""
+        import mysql.connector
         try:
             camera_id = int(self.table.item(row, 0).text())
 
@@ -382,6 +385,7 @@ class ServerSettingsDialog(QDialog):
         self.main_layout.addLayout(self.buttons)
 
     def test_connection(self):
+        import requests
         ip = self.ip_input.text()
         port = self.port_input.text()
         try:
@@ -489,18 +493,20 @@ class VideoApp(QWidget):
     connection_status_changed = pyqtSignal(str)
     camera_connected_changed = pyqtSignal(bool)
 
-    def __init__(self, coco_model, license_plate_detector, mot_tracker, vehicles, get_car, read_license_plate,
-                 insert_car_data):
+    def __init__(self, coco_model, license_plate_detector, trackers, vehicles, get_car, read_license_plate,
+                 insert_car_data, pipeline_options=None, model_loader=None):
+        """model_loader - ModelLoader: модели ещё не загружены (coco_model и license_plate_detector - None),
+        окно показывается сразу в состоянии "Загрузка моделей" и подключает модели по сигналу models_loaded"""
         super().__init__()
-        self.coco_model = coco_model
-        self.license_plate_detector = license_plate_detector
-        self.mot_tracker = mot_tracker
         self.vehicles = vehicles
         self.get_car = get_car
-        self.read_license_plate = read_license_plate
         self.insert_car_data = insert_car_data
         self.usb_camera_index = 0
 
+        # Детекция, трекинг и OCR выполняются в отдельном потоке, GUI только отображает результат
+        self.engine = ProcessingEngine(coco_model, license_plate_detector, trackers, vehicles,
+                                       read_license_plate, insert_car_data, pipeline_options)
+
         # Добавляем переменную для хранения текущего изображения
         self.best_text = None
         self.best_score = 0.0
@@ -532,10 +538,7 @@ class VideoApp(QWidget):
         self.streaming_thread = threading.Thread(target=self.streaming_worker, daemon=True)
         self.streaming_thread.start()
 
-        self.cap1 = None
-        self.cap2 = None
         self.video_cap = None
-        self.usb_cap = None
         self.fps_limit = 30
         self.show_fps = True
         self.current_camera = None
@@ -560,8 +563,6 @@ class VideoApp(QWidget):
             'quality': 70
         }
 
-        self.tracked_plates = {}
-        self.tracked_plates = {}  # {track_id: {'plate_text': str, 'plate_score': float, 'last_seen': float}}
         self.plate_history = {}  # Для хранения истории номеров
 
         # Добавляем список для хранения названий камер
@@ -570,6 +571,17 @@ class VideoApp(QWidget):
         # Connect signals
         self.connection_status_changed.connect(self.update_connection_status)
         self.camera_connected_changed.connect(self.update_camera_button_status)
+        self.engine.frame_processed.connect(self.on_frame_processed)
+        self.engine.plate_recognized.connect(self.on_plate_recognized)
+        self.engine.processing_failed.connect(self.on_processing_failed)
+        self.engine.start()
+
+        self.model_loader = model_loader
+        if model_loader is not None:
+            model_loader.models_loaded.connect(self.on_models_loaded)
+            model_loader.loading_failed.connect(self.on_models_failed)
+            self.set_models_loading(True)
+            model_loader.start()
 
     def init_ui(self):
         self.setWindowTitle("Vehicle & License Plate Recognition")
@@ -648,6 +660,23 @@ class VideoApp(QWidget):
         self.template_processing_action.triggered.connect(self.toggle_template_processing)
         self.settings_menu.addAction(self.template_processing_action)
 
+        # Каскадный режим: детектор номеров запускается только на кропах найденных ТС
+        self.cascade_detection_action = QAction("Искать номера только на ТС", self, checkable=True)
+        self.cascade_detection_action.setChecked(self.engine.pipeline.plate_detection == 'cascade')
+        self.cascade_detection_action.triggered.connect(self.toggle_cascade_detection)
+        self.settings_menu.addAction(self.cascade_detection_action)
+
+        # Детекторы запускаются раз в N кадров, между ними треки предсказывает SORT
+        self.detection_stride_action = QAction("Шаг детекции", self)
+        self.detection_stride_action.triggered.connect(self.set_detection_stride)
+        self.settings_menu.addAction(self.detection_stride_action)
+
+        # OCR только распознавателем: номер уже локализован YOLO, детектор текста EasyOCR не нужен
+        self.recognition_only_ocr_action = QAction("OCR без детекции текста", self, checkable=True)
+        self.recognition_only_ocr_action.setChecked((self.engine.pipeline.ocr_mode or OCR_MODE) == 'recognize')
+        self.recognition_only_ocr_action.triggered.connect(self.toggle_recognition_only_ocr)
+        self.settings_menu.addAction(self.recognition_only_ocr_action)
+
         self.menu_bar.addMenu(self.settings_menu)
 
         # Добавил переменную для хранения текущего порога
@@ -711,6 +740,10 @@ class VideoApp(QWidget):
         self.status_bar.addWidget(self.connection_status_label)
         self.status_bar.addStretch()
 
+        # Состояние загрузки моделей
+        self.models_status_label = QLabel("", self)
+        self.status_bar.addWidget(self.models_status_label)
+
         layout.addLayout(self.status_bar)
 
     def prepare_frame_for_streaming(self, frame):
@@ -761,9 +794,36 @@ class VideoApp(QWidget):
     def toggle_template_processing(self):
         """Включает/выключает обработку текста под шаблоны номерных знаков"""
         self.template_processing_enabled = self.template_processing_action.isChecked()
+        plate_grammar.set_templates_enabled(self.template_processing_enabled)
         logging.info(
             f"Обработка под шаблоны номеров: {'включена' if self.template_processing_enabled else 'выключена'}")
 
+    def toggle_cascade_detection(self):
+        """Переключает поиск номеров между всем кадром и кропами транспортных средств"""
+        mode = 'cascade' if self.cascade_detection_action.isChecked() else 'full'
+        self.engine.pipeline.plate_detection = mode
+        logging.info(f"Режим детекции номеров: {mode}")
+
+    def toggle_recognition_only_ocr(self):
+        """Переключает OCR между одним распознавателем и полным readtext с детекцией текста"""
+        mode = 'recognize' if self.recognition_only_ocr_action.isChecked() else 'readtext'
+        self.engine.pipeline.ocr_mode = mode
+        logging.info(f"Режим OCR: {mode}")
+
+    def set_detection_stride(self):
+        """Устанавливает, на каждом каком кадре запускать детекторы"""
+        try:
+            stride, ok = QInputDialog.getInt(
+                self, "Шаг детекции", "Запускать детекцию каждые N кадров:",
+                self.engine.pipeline.detect_every, 1, 30, 1
+            )
+            if ok:
+                self.engine.pipeline.detect_every = stride
+                logging.info(f"Detection stride set to {stride}")
+        except Exception as e:
+            logging.error(f"Error setting detection stride: {e}")
+            QMessageBox.critical(self, "Ошибка", f"Ошибка при установке шага детекции: {str(e)}")
+
     def set_recognition_threshold(self):
         """Устанавливает порог вероятности для распознавания номеров"""
         try:
@@ -778,6 +838,7 @@ class VideoApp(QWidget):
             )
             if ok:
                 self.recognition_threshold = threshold
+                self.engine.pipeline.recognition_threshold = threshold
                 logging.info(f"Установлен новый порог распознавания: {threshold}")
         except Exception as e:
             logging.error(f"Ошибка при установке порога: {e}")
@@ -796,6 +857,7 @@ class VideoApp(QWidget):
             QMessageBox.critical(self, "Ошибка", f"Ошибка при выборе камер: {str(e)}")
 
     def connect_selected_cameras(self, selected_cameras):
+        import mysql.connector
         try:
             logging.info("Connecting to selected cameras")
             self.release_cameras()
@@ -812,8 +874,8 @@ class VideoApp(QWidget):
             conn.close()
 
             for row, camera in enumerate(cameras):
-                cap = cv2.VideoCapture(camera['ip_address'])
-                if not cap.isOpened():
+                cap = open_camera(camera['ip_address'], name=camera['name'])
+                if cap is None:
                     logging.error(f"Error opening video stream for camera: {camera['ip_address']}")
                     continue
 
@@ -878,9 +940,8 @@ class VideoApp(QWidget):
                 # Обрабатываем изображение
                 results = model_prediction(
                     self.current_image,
-                    self.coco_model,
-                    self.license_plate_detector,
-                    reader
+                    self.engine.pipeline.coco_model,
+                    self.engine.pipeline.license_plate_detector
                 )
 
                 if len(results) == 3:
@@ -957,6 +1018,7 @@ class VideoApp(QWidget):
 
     def test_server_connection(self):
         def connection_test():
+            import requests
             try:
                 self.connection_status_changed.emit("connecting")
                 logging.info("Testing server connection...")
@@ -1020,6 +1082,7 @@ class VideoApp(QWidget):
 
     def get_cameras_from_db(self):
         """Получает список камер из базы данных"""
+        import mysql.connector
         try:
             conn = mysql.connector.connect(**db_config)
             cursor = conn.cursor(dictionary=True)
@@ -1132,6 +1195,7 @@ class VideoApp(QWidget):
             QMessageBox.critical(self, "Ошибка", f"Ошибка при переключении камеры: {str(e)}")
 
     def connect_cameras(self):
+        import mysql.connector
         try:
             logging.info("Connecting/disconnecting cameras")
             if self.timer.isActive():
@@ -1199,8 +1263,8 @@ class VideoApp(QWidget):
 
             # Создаем временные камеры для отображения
             for i, url in enumerate(camera_urls):
-                cap = cv2.VideoCapture(url)
-                if cap.isOpened():
+                cap = open_camera(url, name=f"Ручная камера {i + 1}")
+                if cap is not None:
                     video_label = QLabel(self)
                     video_label.setSizePolicy(QSizePolicy.Expanding, QSizePolicy.Expanding)
                     video_label.setAlignment(Qt.AlignCenter)
@@ -1244,6 +1308,8 @@ class VideoApp(QWidget):
 
     def release_cameras(self):
         try:
+            self.engine.clear_pending()
+            self.engine.release_cameras()
             for cap, _ in self.video_labels:
                 if cap and cap.isOpened():
                     cap.release()
@@ -1260,62 +1326,57 @@ class VideoApp(QWidget):
         # Например, можно использовать coco_model для классификации
         return "Car"  # Временная заглушка
 
+    def current_source(self):
+        """Источник активной камеры для open_camera и её название: (URL, индекс USB или путь к видео, название)"""
+        if not self.current_camera:
+            return None, None
+        if self.current_camera.startswith("Камера из БД") and self.current_camera_url:
+            return self.current_camera_url, self.current_camera
+        if self.current_camera == "Камера 1" and self.camera_urls[0]:
+            return self.camera_urls[0], self.current_camera
+        if self.current_camera == "Камера 2" and self.camera_urls[1]:
+            return self.camera_urls[1], self.current_camera
+        if self.current_camera == "USB Камера" and self.usb_enabled:
+            return self.usb_camera_index, self.current_camera
+        if self.current_camera == "Видеофайл" and self.video_file:
+            return self.video_file, self.current_camera
+        return None, None
+
     def restart_video_streams(self):
+        """Переоткрывает активную камеру: кадры читает CameraReader в своём потоке, обработка - в ProcessingEngine"""
         self.release_cameras()
+        self.clear_video_streams()
 
+        source, name = self.current_source()
+        if source is None:
+            return False
         try:
-            if self.current_camera.startswith("Камера из БД") and hasattr(self, 'current_camera_url'):
-                # Обработка камеры из базы данных
-                self.cap1 = cv2.VideoCapture(self.current_camera_url)
-                if not self.cap1.isOpened():
-                    logging.error(f"Error opening video stream from DB: {self.current_camera_url}")
-                    self.cap1 = None
-                    return False
-                logging.info(f"Successfully connected to camera from DB: {self.current_camera_url}")
-                return True
-
-            elif self.current_camera == "Камера 1" and self.camera_urls[0]:
-                self.cap1 = cv2.VideoCapture(self.camera_urls[0])
-                if not self.cap1.isOpened():
-                    logging.error(f"Error opening video stream for camera 1: {self.camera_urls[0]}")
-                    self.cap1 = None
-                    return False
-                logging.info(f"Successfully connected to camera 1: {self.camera_urls[0]}")
-                return True
-
-            elif self.current_camera == "Камера 2" and self.camera_urls[1]:
-                self.cap2 = cv2.VideoCapture(self.camera_urls[1])
-                if not self.cap2.isOpened():
-                    logging.error(f"Error opening video stream for camera 2: {self.camera_urls[1]}")
-                    self.cap2 = None
-                    return False
-                logging.info(f"Successfully connected to camera 2: {self.camera_urls[1]}")
-                return True
+            cap = open_camera(source, name=name)
+            if cap is None:
+                logging.error(f"Error opening video stream for {name}: {source}")
+                return False
+            if self.current_camera == "Видеофайл":
+                self.video_cap = cap
 
-            elif self.current_camera == "USB Камера" and self.usb_enabled:
-                self.usb_cap = cv2.VideoCapture(self.usb_camera_index)
-                if not self.usb_cap.isOpened():
-                    logging.error(f"Error opening USB camera with index {self.usb_camera_index}")
-                    self.usb_cap = None
-                    return False
-                logging.info(f"Successfully connected to USB camera with index {self.usb_camera_index}")
-                return True
+            video_label = QLabel(self)
+            video_label.setSizePolicy(QSizePolicy.Expanding, QSizePolicy.Expanding)
+            video_label.setAlignment(Qt.AlignCenter)
+            self.video_labels.append((cap, video_label))
+            self.video_layout.addWidget(video_label, 0, 0)
+            self.camera_ids = [0]
+            self.camera_names = [name]
 
-            elif self.current_camera == "Видеофайл" and self.video_file:
-                self.video_cap = cv2.VideoCapture(self.video_file)
-                if not self.video_cap.isOpened():
-                    logging.error(f"Error opening video file: {self.video_file}")
-                    self.video_cap = None
-                    return False
-                logging.info(f"Successfully opened video file: {self.video_file}")
-                return True
+            self.timer.start(1000 // self.fps_limit)
+            self.connect_button.setText("Отключить")
+            self.pause_button.setEnabled(True)
+            self.camera_connected_changed.emit(True)
+            logging.info(f"Successfully connected to {name}: {source}")
+            return True
         except Exception as e:
             logging.error(f"Error connecting to camera: {str(e)}")
             QMessageBox.warning(self, "Ошибка", f"Ошибка подключения к камере: {str(e)}")
             return False
 
-        return False
-
     def load_video_file(self):
         try:
             logging.info("Loading video file")
@@ -1347,10 +1408,9 @@ class VideoApp(QWidget):
                 QMessageBox.critical(self, "Ошибка", f"Видеофайл не существует: {self.video_file}")
                 return
 
-            self.video_cap = cv2.VideoCapture(self.video_file)
-            if not self.video_cap.isOpened():
+            self.video_cap = open_camera(self.video_file, name="Видеофайл")
+            if self.video_cap is None:
                 logging.error(f"Error opening video file: {self.video_file}")
-                self.video_cap = None
                 QMessageBox.critical(self, "Ошибка", f"Ошибка открытия видеофайла: {self.video_file}")
                 return
 
@@ -1433,6 +1493,7 @@ class VideoApp(QWidget):
 
     def send_frame(self, frame, camera_id):
         """Отправляет кадр на сервер трансляции"""
+        import requests
         try:
             if not self.server_ip or not self.server_port:
                 logging.error("Server IP or port not set")
@@ -1488,6 +1549,7 @@ class VideoApp(QWidget):
 
     def toggle_show_fps(self):
         self.show_fps = self.show_fps_action.isChecked()
+        self.engine.show_fps = self.show_fps
         logging.info(f"Show FPS: {self.show_fps}")
 
     def toggle_pause(self):
@@ -1520,6 +1582,7 @@ class VideoApp(QWidget):
 
     def update_camera_list_from_db(self):
         """Обновляет список камер из базы данных"""
+        import mysql.connector
         try:
             conn = mysql.connector.connect(**db_config)
             cursor = conn.cursor(dictionary=True)
@@ -1537,20 +1600,12 @@ class VideoApp(QWidget):
             logging.error(f"Database error: {err}")
 
     def update_frame(self):
+        """Забирает свежие кадры камер и передаёт их в поток обработки"""
         try:
             if not self.video_labels:
                 return
 
-            try:
-                font = ImageFont.truetype("DejaVuSans.ttf", 24)
-                font_small = ImageFont.truetype("DejaVuSans.ttf", 18)
-            except:
-                font = ImageFont.load_default()
-                font_small = ImageFont.load_default()
-                logging.warning("DejaVuSans.ttf not found, using default font")
-
             for idx, (cap, video_label) in enumerate(self.video_labels):
-                start_time = time.time()
                 ret, frame = cap.read()
                 if not ret or frame is None:
                     continue
@@ -1559,182 +1614,57 @@ class VideoApp(QWidget):
                 camera_id = self.camera_ids[idx] if idx < len(self.camera_ids) else idx
                 camera_name = self.camera_names[idx] if idx < len(self.camera_names) else f"Камера {idx + 1}"
 
-                # Конвертируем в PIL изображение для работы со шрифтами
-                pil_img = Image.fromarray(cv2.cvtColor(frame, cv2.COLOR_BGR2RGB))
-                draw = ImageDraw.Draw(pil_img)
-
-                # Детекция транспортных средств
-                vehicle_detections = self.coco_model(frame)[0]
-                vehicle_boxes = []
-                for detection in vehicle_detections.boxes.data.tolist():
-                    x1, y1, x2, y2, score, class_id = detection
-                    if int(class_id) in [2, 3, 5, 7]:  # Только автомобили
-                        vehicle_boxes.append([x1, y1, x2, y2, score])
-                        # Рисуем bounding box автомобиля
-                        draw.rectangle([x1, y1, x2, y2], outline=(0, 255, 0), width=2)
-
-                # Трекинг транспортных средств
-                track_ids = self.mot_tracker.update(np.asarray(vehicle_boxes)) if vehicle_boxes else []
-                current_time = time.time()
-
-                # Детекция номерных знаков
-                license_detections = self.license_plate_detector(frame)[0]
-
-                # 1. Обновляем существующие треки
-                updated_vehicles = set()
-                for track in track_ids:
-                    xcar1, ycar1, xcar2, ycar2, track_id = track
-                    car_bbox = (xcar1, ycar1, xcar2, ycar2)
-
-                    if track_id in self.tracked_plates:
-                        # Проверяем, есть ли новый номер для этого авто
-                        new_plate = None
-                        for lp in license_detections.boxes.data.tolist():
-                            x1, y1, x2, y2, score, _ = lp
-                            if is_plate_inside_car((x1, y1, x2, y2), car_bbox):
-                                plate_crop = frame[int(y1):int(y2), int(x1):int(x2)]
-                                plate_text, plate_score = read_license_plate(plate_crop)
-
-                                if plate_text and plate_score >= self.recognition_threshold:
-                                    new_plate = (plate_text, plate_score)
-                                    break
-
-                        # Обновляем или сохраняем существующий номер
-                        if new_plate:
-                            self.tracked_plates[track_id] = {
-                                'plate_text': new_plate[0],
-                                'plate_score': new_plate[1],
-                                'last_seen': current_time
-                            }
-                        else:
-                            self.tracked_plates[track_id]['last_seen'] = current_time
-
-                        updated_vehicles.add(track_id)
-
-                # 2. Обрабатываем новые номера для необновленных авто
-                for lp in license_detections.boxes.data.tolist():
-                    x1, y1, x2, y2, score, _ = lp
-                    plate_bbox = (x1, y1, x2, y2)
-                    plate_crop = frame[int(y1):int(y2), int(x1):int(x2)]
-                    plate_text, plate_score = read_license_plate(plate_crop)
-
-                    if not plate_text or plate_score < self.recognition_threshold:
-                        continue
-
-                    # Ищем ближайший автомобиль без номера
-                    best_match = None
-                    min_distance = float('inf')
-
-                    for track in track_ids:
-                        xcar1, ycar1, xcar2, ycar2, track_id = track
-                        if track_id in updated_vehicles:
-                            continue
-
-                        car_bbox = (xcar1, ycar1, xcar2, ycar2)
-                        if is_plate_inside_car(plate_bbox, car_bbox):
-                            distance = np.linalg.norm(
-                                np.array(get_plate_center(plate_bbox)) -
-                                np.array(get_car_center(car_bbox)))
-
-                            if distance < min_distance:
-                                min_distance = distance
-                            best_match = track_id
-
-                            if best_match:
-                                self.tracked_plates[best_match] = {
-                                    'plate_text': plate_text,
-                                    'plate_score': plate_score,
-                                    'last_seen': current_time
-                                }
-                            updated_vehicles.add(best_match)
-
-                            # Сохранение в базу данных
-                            if plate_text != getattr(self, f'last_saved_plate_{camera_id}', None):
-                                try:
-                                    _, buffer = cv2.imencode('.jpg', cv2.cvtColor(np.array(pil_img), cv2.COLOR_RGB2BGR))
-                                    self.insert_car_data(
-                                        plate_text,
-                                        buffer.tobytes(),
-                                        "Car",
-                                        datetime.now().strftime('%Y-%m-%d %H:%M:%S'),
-                                        camera_id
-                                    )
-                                    setattr(self, f'last_saved_plate_{camera_id}', plate_text)
-                                except Exception as e:
-                                    logging.error(f"Ошибка сохранения в БД: {e}")
-
-                # 3. Визуализация номеров на автомобилях
-                for track in track_ids:
-                    x1, y1, x2, y2, track_id = track
-                    plate_info = self.tracked_plates.get(track_id)
-
-                    if plate_info:
-                        text = f"{plate_info['plate_text']} ({plate_info['plate_score']:.2f})"
-                        text_bbox = draw.textbbox((0, 0), text, font=font)
-
-                        # Рисуем подложку
-                        draw.rectangle(
-                            [x1, y1 - (text_bbox[3] - text_bbox[1]) - 10,
-                             x1 + (text_bbox[2] - text_bbox[0]) + 10, y1],
-                            fill=(0, 0, 255))
-
-                        # Рисуем текст номера
-                        draw.text(
-                            (x1 + 5, y1 - (text_bbox[3] - text_bbox[1]) - 5),
-                            text,
-                            font=font,
-                            fill=(255, 255, 255))
-
-                # 4. Очистка старых треков (>5 секунд без обновления)
-                to_delete = [tid for tid, plate in self.tracked_plates.items()
-                             if current_time - plate['last_seen'] > 5.0]
-                for tid in to_delete:
-                    del self.tracked_plates[tid]
-
-                # Отображение FPS
-                if self.show_fps:
-                    fps = 1.0 / (time.time() - start_time)
-                    fps_text = f"FPS: {fps:.2f}"
-                    fps_bbox = draw.textbbox((0, 0), fps_text, font=font_small)
-                    draw.rectangle(
-                        [10, 10, 10 + (fps_bbox[2] - fps_bbox[0]) + 10, 10 + (fps_bbox[3] - fps_bbox[1]) + 10],
-                        fill=(0, 0, 0, 128))
-                    draw.text((15, 15), fps_text, font=font_small, fill=(0, 255, 0))
-
-                # Отображение названия камеры
-                name_bbox = draw.textbbox((0, 0), camera_name, font=font_small)
-                draw.rectangle(
-                    [10, 40, 10 + (name_bbox[2] - name_bbox[0]) + 10, 40 + (name_bbox[3] - name_bbox[1]) + 10],
-                    fill=(0, 0, 0, 128))
-                draw.text((15, 45), camera_name, font=font_small, fill=(255, 255, 255))
-
-                # Конвертируем обратно в OpenCV формат
-                processed_frame = cv2.cvtColor(np.array(pil_img), cv2.COLOR_RGB2BGR)
-                self.display_processed_frame(processed_frame, video_label)
-
-                # Отправка на сервер при необходимости
-                if self.is_streaming:
-                    self.send_frame_to_stream(processed_frame, idx)
+                self.engine.submit_frame(idx, frame, camera_id, camera_name)
 
-        except RuntimeError as e:
-            if "CUDA out of memory" in str(e):
-                logging.error("CUDA memory error - trying to recover")
-                torch.cuda.empty_cache()
-                self.restart_video_streams()
-            else:
-                logging.error(f"Runtime error in update_frame: {e}")
         except Exception as e:
             logging.error(f"Unexpected error in update_frame: {e}")
             self.release_cameras()
             self.timer.stop()
 
-    def clean_old_tracks(self):
-        """Очищает треки, которые не обновлялись более 5 секунд"""
-        current_time = time.time()
-        to_delete = [tid for tid, plate in self.tracked_plates.items()
-                     if current_time - plate['last_seen'] > 5.0]
-        for tid in to_delete:
-            del self.tracked_plates[tid]
+    def on_frame_processed(self, idx, processed_frame):
+        """Отображает кадр, обработанный в потоке ProcessingEngine"""
+        if idx >= len(self.video_labels):
+            return  # Камеры уже отключены
+        _, video_label = self.video_labels[idx]
+        self.display_processed_frame(processed_frame, video_label)
+
+        # Отправка на сервер при необходимости
+        if self.is_streaming:
+            self.send_frame_to_stream(processed_frame, idx)
+
+    def on_plate_recognized(self, camera_id, plate_text, plate_score):
+        """Запоминает последний номер, распознанный потоком обработки"""
+        self.last_recognized_plate = plate_text
+        self.last_recognized_score = plate_score
+        if plate_text not in self.recognized_plates:
+            self.recognized_plates.add(plate_text)
+            logging.info(f"Plate recognized on camera {camera_id}: {plate_text} ({plate_score:.2f})")
+
+    def set_models_loading(self, loading):
+        """Пока модели загружаются, источники кадров недоступны"""
+        for widget in (self.connect_button, self.load_video_action, self.load_image_action, self.select_camera_action):
+            widget.setEnabled(not loading)
+        if loading:
+            self.models_status_label.setText("Загрузка моделей...")
+
+    def on_models_loaded(self, coco_model, license_plate_detector, timings):
+        self.engine.set_models(coco_model, license_plate_detector)
+        self.set_models_loading(False)
+        details = ", ".join(f"{name} {timing['load_s'] + timing['warmup_s']:.1f} с"
+                            for name, timing in timings.items() if isinstance(timing, dict))
+        self.models_status_label.setText(f"Модели загружены за {timings.get('total_s', 0.0):.1f} с")
+        self.models_status_label.setToolTip(details)
+        logging.info("Models loaded successfully.")
+
+    def on_models_failed(self, message):
+        self.models_status_label.setText("Ошибка загрузки моделей")
+        QMessageBox.critical(self, "Ошибка", f"Не удалось загрузить модели: {message}")
+        QApplication.exit(1)
+
+    def on_processing_failed(self, message):
+        logging.error(f"Processing engine error, stopping cameras: {message}")
+        self.release_cameras()
+        self.timer.stop()
 
     def save_to_database(self, plate_text, frame, car_type, camera_id=None):
         """Сохраняет данные в базу данных"""
@@ -1753,18 +1683,6 @@ class VideoApp(QWidget):
         except Exception as e:
             logging.error(f"Ошибка при сохранении в БД: {e}")
 
-    def get_current_frame(self):
-        """Получает текущий кадр из активного источника"""
-        if self.current_camera == "Камера 1" and self.cap1 and self.cap1.isOpened():
-            return self.cap1.read()
-        elif self.current_camera == "Камера 2" and self.cap2 and self.cap2.isOpened():
-            return self.cap2.read()
-        elif self.current_camera == "USB Камера" and hasattr(self, 'usb_cap') and self.usb_cap.isOpened():
-            return self.usb_cap.read()
-        elif self.current_camera == "Видеофайл" and self.video_cap and self.video_cap.isOpened():
-            return self.video_cap.read()
-        return False, None
-
     def process_recognized_texts(self, texts):
         """Обрабатывает распознанные тексты номеров"""
         for text in texts:
@@ -1912,7 +1830,10 @@ class VideoApp(QWidget):
     def closeEvent(self, event):
         try:
             logging.info("Closing application")
+            if self.model_loader is not None and self.model_loader.isRunning():
+                self.model_loader.wait()
             self.stop_streaming()
+            self.engine.stop()
             self.frame_queue.put(None)
             if self.streaming_thread.is_alive():
                 self.streaming_thread.join()
@@ -1,18 +1,20 @@
 # file util.py
 
-import easyocr
 import logging
 import numpy as np
 import cv2
-import re
-import mysql.connector
 from PIL import ImageFont, ImageDraw, Image
-from PyQt5.QtWidgets import QApplication
+
+import ocr
+import plate_grammar
+from plate_preprocess import preprocess_image
+from sort.sort import linear_assignment
 
 logging.basicConfig(level=logging.DEBUG, format='%(asctime)s - %(levelname)s - %(message)s')
 
-# Initialize the OCR reader
-reader = easyocr.Reader(['ru'], gpu=False)
+# Режим OCR по умолчанию: 'recognize' (без детектора текста) или 'readtext'
+OCR_MODES = ('recognize', 'readtext')
+OCR_MODE = 'recognize'
 
 # Database configuration
 db_config = {
@@ -24,78 +26,8 @@ db_config = {
     'connect_timeout': 5
 }
 
-dict_char_to_int = {
-    'О': '0', 'о': '0', 'Ы': 'М', 'Ч': 'У',
-    'А': 'A', 'а': 'a', 'В': 'B', 'в': 'b',
-    'Е': 'E', 'е': 'e', 'К': 'K', 'к': 'k',
-    'М': 'M', 'м': 'm', 'Н': 'H', 'н': 'h',
-    'Р': 'P', 'р': 'p', 'С': 'C', 'с': 'c',
-    'Т': 'T', 'т': 't', 'У': 'Y', 'у': 'y',
-    'Х': 'X', 'х': 'x'
-}
-
-dict_int_to_char = {v: k for k, v in dict_char_to_int.items()}
-
-
-def four_point_transform(image, pts):
-    """Перспективное преобразование для выравнивания номера"""
-    rect = order_points(pts)
-    (tl, tr, br, bl) = rect
-
-    widthA = np.sqrt(((br[0] - bl[0]) ** 2) + ((br[1] - bl[1]) ** 2))
-    widthB = np.sqrt(((tr[0] - tl[0]) ** 2) + ((tr[1] - tl[1]) ** 2))
-    maxWidth = max(int(widthA), int(widthB))
-
-    heightA = np.sqrt(((tr[0] - br[0]) ** 2) + ((tr[1] - br[1]) ** 2))
-    heightB = np.sqrt(((tl[0] - bl[0]) ** 2) + ((tl[1] - bl[1]) ** 2))
-    maxHeight = max(int(heightA), int(heightB))
-
-    dst = np.array([
-        [0, 0],
-        [maxWidth - 1, 0],
-        [maxWidth - 1, maxHeight - 1],
-        [0, maxHeight - 1]], dtype="float32")
-
-    M = cv2.getPerspectiveTransform(rect, dst)
-    warped = cv2.warpPerspective(image, M, (maxWidth, maxHeight))
-
-    # cv2.imshow('warped_image', warped)
-    # cv2.waitKey(1500)
-    # cv2.destroyAllWindows()
-
-    return warped
-
-
-def order_points(pts):
-    """Упорядочивание точек для перспективного преобразования"""
-    rect = np.zeros((4, 2), dtype="float32")
-    s = pts.sum(axis=1)
-    rect[0] = pts[np.argmin(s)]
-    rect[2] = pts[np.argmax(s)]
+MAX_PLATE_TO_VEHICLE_RATIO = 0.3  # Номер не должен занимать >30% площади авто
 
-    diff = np.diff(pts, axis=1)
-    rect[1] = pts[np.argmin(diff)]
-    rect[3] = pts[np.argmax(diff)]
-    return rect
-
-
-def detect_license_plate_contour(license_plate_crop):
-    """Обнаружение контура номерного знака для выравнивания"""
-    gray = cv2.cvtColor(license_plate_crop, cv2.COLOR_BGR2GRAY)
-    blurred = cv2.GaussianBlur(gray, (5, 5), 0)
-    edged = cv2.Canny(blurred, 50, 200)
-
-    contours, _ = cv2.findContours(edged.copy(), cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)
-    contours = sorted(contours, key=cv2.contourArea, reverse=True)[:5]
-
-    for contour in contours:
-        peri = cv2.arcLength(contour, True)
-        approx = cv2.approxPolyDP(contour, 0.02 * peri, True)
-
-        if len(approx) == 4:
-            return approx.reshape(4, 2)
-
-    return None
 
 def get_plate_center(bbox):
     """Вычисляет центр bbox номерного знака"""
@@ -109,12 +41,127 @@ def get_car_center(bbox):
 
 def is_plate_inside_car(plate_bbox, car_bbox):
     """Проверяет, находится ли номер внутри bbox автомобиля"""
-    plate_center = get_plate_center(plate_bbox)
-    xcar1, ycar1, xcar2, ycar2 = car_bbox
-    return (xcar1 < plate_center[0] < xcar2 and
-            ycar1 < plate_center[1] < ycar2)
+    return bool(plates_inside_vehicles([plate_bbox], [car_bbox])[0, 0])
+
+def _boxes_array(boxes):
+    """[[x1, y1, x2, y2, ...], ...] -> массив [N, 4]; лишние столбцы (score, class_id, track_id) отбрасываются"""
+    if len(boxes) == 0:
+        return np.empty((0, 4))
+    return np.asarray([box[:4] for box in boxes], dtype=float)
+
+def plates_inside_vehicles(plate_boxes, vehicle_boxes, containment='center'):
+    """Матрица [номера x ТС]: лежит ли номер внутри bbox ТС.
+
+    containment='center' - центр номера строго внутри bbox ТС, 'full' - весь bbox номера строго внутри.
+    """
+    plates = _boxes_array(plate_boxes)[:, None, :]
+    vehicles = _boxes_array(vehicle_boxes)[None, :, :]
+    if containment == 'full':
+        return ((plates[..., 0] > vehicles[..., 0]) & (plates[..., 1] > vehicles[..., 1]) &
+                (plates[..., 2] < vehicles[..., 2]) & (plates[..., 3] < vehicles[..., 3]))
+    center_x = (plates[..., 0] + plates[..., 2]) / 2
+    center_y = (plates[..., 1] + plates[..., 3]) / 2
+    return ((vehicles[..., 0] < center_x) & (center_x < vehicles[..., 2]) &
+            (vehicles[..., 1] < center_y) & (center_y < vehicles[..., 3]))
+
+def plate_vehicle_scores(plate_boxes, vehicle_boxes, vehicle_scores=None, max_size_ratio=MAX_PLATE_TO_VEHICLE_RATIO,
+                         containment='center'):
+    """Матрица соответствия [номера x ТС]: (1 / (расстояние между центрами + 1)) * (1 - доля площади) * score ТС.
+
+    0 - номер не внутри ТС или занимает больше max_size_ratio его площади.
+    """
+    plates = _boxes_array(plate_boxes)
+    vehicles = _boxes_array(vehicle_boxes)
+    plate_centers = (plates[:, :2] + plates[:, 2:]) / 2
+    vehicle_centers = (vehicles[:, :2] + vehicles[:, 2:]) / 2
+    distance = np.linalg.norm(plate_centers[:, None, :] - vehicle_centers[None, :, :], axis=2)
+
+    plate_area = np.prod(plates[:, 2:] - plates[:, :2], axis=1)
+    vehicle_area = np.maximum(np.prod(vehicles[:, 2:] - vehicles[:, :2], axis=1), 1e-9)
+    size_ratio = plate_area[:, None] / vehicle_area[None, :]
+
+    scores = (1 / (distance + 1)) * (1 - size_ratio)
+    if vehicle_scores is not None:
+        scores *= np.asarray(vehicle_scores, dtype=float)[None, :]
+    valid = plates_inside_vehicles(plates, vehicles, containment) & (size_ratio <= max_size_ratio)
+    return np.where(valid, scores, 0.)
+
+def associate_plates_to_vehicles(plate_boxes, vehicle_boxes, vehicle_scores=None,
+                                 max_size_ratio=MAX_PLATE_TO_VEHICLE_RATIO, containment='center'):
+    """Оптимальное сопоставление номеров и ТС один к одному по plate_vehicle_scores.
+
+    Возвращает для каждого номера индекс ТС в vehicle_boxes или -1.
+    """
+    matches = np.full(len(plate_boxes), -1, dtype=int)
+    if len(plate_boxes) == 0 or len(vehicle_boxes) == 0:
+        return matches
+    scores = plate_vehicle_scores(plate_boxes, vehicle_boxes, vehicle_scores, max_size_ratio, containment)
+    # Назначение решается только для номеров и ТС, у которых есть хотя бы одна допустимая пара
+    rows = np.flatnonzero(scores.any(axis=1))
+    cols = np.flatnonzero(scores.any(axis=0))
+    if len(rows) == 0:
+        return matches
+    candidate_scores = scores[np.ix_(rows, cols)]
+    for r, c in linear_assignment(-candidate_scores):
+        if candidate_scores[r, c] > 0:
+            matches[rows[r]] = cols[c]
+    return matches
+
+def suppress_duplicate_plates(plates, iou_threshold=0.5):
+    """Убирает повторные детекции одного номера (например, из пересекающихся кропов ТС)"""
+    if len(plates) < 2:
+        return plates
+    boxes = np.asarray(plates, dtype=np.float32)
+    order = np.argsort(-boxes[:, 4])
+    areas = (boxes[:, 2] - boxes[:, 0]) * (boxes[:, 3] - boxes[:, 1])
+    keep = []
+    while order.size:
+        i = order[0]
+        keep.append(i)
+        rest = order[1:]
+        w = np.maximum(0, np.minimum(boxes[i, 2], boxes[rest, 2]) - np.maximum(boxes[i, 0], boxes[rest, 0]))
+        h = np.maximum(0, np.minimum(boxes[i, 3], boxes[rest, 3]) - np.maximum(boxes[i, 1], boxes[rest, 1]))
+        iou = w * h / (areas[i] + areas[rest] - w * h + 1e-9)
+        order = rest[iou <= iou_threshold]
+    return [plates[i] for i in sorted(keep)]
+
+
+def detect_plates_in_vehicles(license_plate_detector, images, vehicle_boxes_per_image, imgsz=320, padding=0.1,
+                              batch_size=16):
+    """Каскадная детекция: ищет номера только внутри рамок ТС.
+
+    Кропы всех ТС со всех изображений прогоняются через детектор номеров пакетами
+    с небольшим входным размером imgsz. Если ТС нет, детектор не вызывается вовсе.
+    Возвращает для каждого изображения список [x1, y1, x2, y2, score, class_id]
+    в координатах исходного изображения.
+    """
+    crops = []
+    owners = []  # (индекс изображения, смещение кропа по x, по y)
+    for i, (image, boxes) in enumerate(zip(images, vehicle_boxes_per_image)):
+        height, width = image.shape[:2]
+        for box in boxes:
+            x1, y1, x2, y2 = box[:4]
+            pad_x = (x2 - x1) * padding
+            pad_y = (y2 - y1) * padding
+            cx1, cy1 = max(0, int(x1 - pad_x)), max(0, int(y1 - pad_y))
+            cx2, cy2 = min(width, int(x2 + pad_x)), min(height, int(y2 + pad_y))
+            if cx2 - cx1 < 8 or cy2 - cy1 < 8:
+                continue
+            crops.append(image[cy1:cy2, cx1:cx2])
+            owners.append((i, cx1, cy1))
+
+    plates = [[] for _ in images]
+    for start in range(0, len(crops), batch_size):
+        results = license_plate_detector(crops[start:start + batch_size], imgsz=imgsz)
+        for (i, offset_x, offset_y), result in zip(owners[start:start + batch_size], results):
+            for x1, y1, x2, y2, score, class_id in result.boxes.data.tolist():
+                plates[i].append([x1 + offset_x, y1 + offset_y, x2 + offset_x, y2 + offset_y, score, class_id])
+
+    return [suppress_duplicate_plates(image_plates) for image_plates in plates]
 
-def model_prediction(img, coco_model, license_plate_detector, ocr_reader, recognition_threshold=0.85):
+
+def model_prediction(img, coco_model, license_plate_detector, ocr_reader=None, recognition_threshold=0.85,
+                     plate_detection='full'):
     """Обработка изображения для обнаружения автомобилей и номерных знаков с улучшенным сопоставлением"""
     img = cv2.cvtColor(img, cv2.COLOR_RGB2BGR) if len(img.shape) == 3 else img
     licenses_texts = []
@@ -143,17 +190,15 @@ def model_prediction(img, coco_model, license_plate_detector, ocr_reader, recogn
     if {2, 3, 5, 7}.intersection(vehicle_classes):
         direction = "forward"  # или другая логика определения направления
 
-    # Детекция номерных знаков
-    license_detections = license_plate_detector(img)[0]
-    plate_to_car_mapping = {}
+    # Детекция номерных знаков: по всему кадру или только внутри найденных ТС
+    if plate_detection == 'cascade':
+        license_plates = detect_plates_in_vehicles(license_plate_detector, [img], [vehicle_boxes])[0]
+    else:
+        license_plates = license_plate_detector(img)[0].boxes.data.tolist()
+    recognized_boxes = []
 
-    for license_plate in license_detections.boxes.data.tolist():
+    for license_plate in license_plates:
         x1, y1, x2, y2, score, class_id = license_plate
-        plate_width = x2 - x1
-        plate_height = y2 - y1
-        plate_area = plate_width * plate_height
-        plate_center_x = (x1 + x2) / 2
-        plate_center_y = (y1 + y2) / 2
 
         # Рисуем прямоугольник вокруг номера
         cv2.rectangle(img, (int(x1), int(y1)), (int(x2), int(y2)), (0, 255, 0), 2)
@@ -166,53 +211,16 @@ def model_prediction(img, coco_model, license_plate_detector, ocr_reader, recogn
         if plate_text and plate_score > recognition_threshold:
             licenses_texts.append((plate_text, plate_score))
             license_plate_crops.append(license_plate_crop)
-
-            # Ищем лучший matching автомобиль для этого номера
-            best_match = None
-            best_score = 0
-            min_distance = float('inf')
-
-            for vehicle_box in vehicle_boxes:
-                xcar1, ycar1, xcar2, ycar2, class_id, car_score, area, car_center_x, car_center_y = vehicle_box
-
-                # Проверяем геометрическое соответствие (центр номера внутри bbox автомобиля)
-                center_inside = (xcar1 < plate_center_x < xcar2 and
-                                ycar1 < plate_center_y < ycar2)
-
-                if not center_inside:
-                    continue
-
-                # Проверяем размерное соответствие (номер не должен быть слишком большим)
-                size_ratio = plate_area / area
-                if size_ratio > 0.3:  # Номер не должен занимать >30% площади авто
-                    continue
-
-                # Вычисляем расстояние между центрами
-                distance = ((plate_center_x - car_center_x)**2 +
-                           (plate_center_y - car_center_y)**2)**0.5
-
-                # Score соответствия (чем меньше расстояние и size_ratio, тем лучше)
-                match_score = (1 / (distance + 1)) * (1 - size_ratio) * car_score
-
-                if match_score > best_score:
-                    best_score = match_score
-                    best_match = vehicle_box
-                    min_distance = distance
-
-            if best_match:
-                xcar1, ycar1, xcar2, ycar2, _, _, _, _, _ = best_match
-                plate_to_car_mapping[(plate_text, plate_score)] = (xcar1, ycar1, xcar2, ycar2)
-
-    # Рисуем номера только над лучшими соответствиями
-    used_vehicles = set()
-    for (plate_text, plate_score), car_box in sorted(
-            plate_to_car_mapping.items(),
-            key=lambda x: -x[0][1]  # Сортируем по убыванию confidence номера
-    ):
-        if car_box in used_vehicles:
-            continue  # Не рисуем несколько номеров на одном автомобиле
-
-        xcar1, ycar1, xcar2, ycar2 = car_box
+            recognized_boxes.append((x1, y1, x2, y2))
+
+    # Каждому распознанному номеру - не больше одного автомобиля и наоборот (оптимальное назначение),
+    # текст рисуется только над сопоставленными автомобилями
+    vehicle_scores = [vehicle_box[5] for vehicle_box in vehicle_boxes]
+    matches = associate_plates_to_vehicles(recognized_boxes, vehicle_boxes, vehicle_scores)
+    for (plate_text, plate_score), vehicle_index in zip(licenses_texts, matches):
+        if vehicle_index < 0:
+            continue
+        xcar1, ycar1 = vehicle_boxes[vehicle_index][:2]
         text_position = (int(xcar1), int(ycar1) - 10)
 
         img = draw_license_plate_text(
@@ -220,13 +228,12 @@ def model_prediction(img, coco_model, license_plate_detector, ocr_reader, recogn
             f"{plate_text} ({plate_score:.2f})",
             text_position
         )
-        used_vehicles.add(car_box)
 
     img_wth_box = cv2.cvtColor(img, cv2.COLOR_BGR2RGB)
 
     if licenses_texts:
         return [img_wth_box, licenses_texts, license_plate_crops, direction]
-    elif license_detections.boxes.cls.tolist():
+    elif license_plates:
         return [img_wth_box, [], None, direction]
     else:
         return [img_wth_box, [], None, direction]
@@ -307,82 +314,56 @@ def draw_license_plate_text(image, text, position, font_size=30, bg_color=(255,
 
 
 def license_complies_format(text, recognition_threshold=0.85):
-    """Проверка формата номера (Российский стандарт)"""
-    # Если обработка под шаблоны отключена, всегда возвращаем True
-    if not getattr(QApplication.instance(), 'template_processing_enabled', True):
-        return True
-
-    # car
-    if len(text) == 9 and text[0].isalpha() and text[1:4].isdigit() and text[4:6].isalpha() and text[6:].isdigit():
-        return True
-    # car
-    elif len(text) == 8 and text[0].isalpha() and text[1:4].isdigit() and text[4:6].isalpha() and text[6:].isdigit():
-        return True
-    # trailer
-    elif len(text) == 8 and text[0:2].isalpha() and text[2:6].isdigit() and text[6:].isdigit():
-        return True
-    # trailer
-    elif len(text) == 9 and text[0:2].isalpha() and text[2:6].isdigit() and text[6:].isdigit():
-        return True
-    return False
+    """Проверка формата номера (Российский стандарт), см. plate_grammar"""
+    return plate_grammar.is_valid_plate(text)
 
 
 def format_license(text):
     """Format the license plate text by converting characters."""
-    license_plate_ = ''
-    for char in text:
-        if char in dict_char_to_int:
-            license_plate_ += dict_char_to_int[char]
-        elif char in dict_int_to_char:
-            license_plate_ += dict_int_to_char[char]
-        else:
-            license_plate_ += char
-    return license_plate_
-
-
-def read_license_plate(license_plate_crop):
-    """Улучшенное распознавание номера с проверкой формата"""
-    try:
-        # Предварительная обработка изображения
-        processed_img = preprocess_image(license_plate_crop)
-
-        # Распознавание текста
-        detections = reader.readtext(
-            processed_img,
-            decoder='greedy',
-            batch_size=1,
-            detail=1,
-            # allowlist='АВЕКМНОРСТУХ0123456789',
-            paragraph=False
-        )
+    return plate_grammar.normalize(text)
 
-        best_text = None
-        best_score = 0
 
-        for detection in detections:
-            bbox, text, score = detection
-            text = text.upper().replace(' ', '').replace('-', '')
+def read_license_plate(license_plate_crop, mode=None):
+    """Улучшенное распознавание номера с проверкой формата.
 
-            # Удаляем лишние символы
-            text = ''.join(c for c in text if c.isalnum())
+    mode: 'recognize' - только распознаватель EasyOCR на всём кропе (кроп уже
+    локализован YOLO, текстовый детектор CRAFT не нужен), 'readtext' - полный
+    конвейер EasyOCR с детекцией текста. По умолчанию - OCR_MODE.
+    """
+    return read_license_plates([license_plate_crop], mode)[0]
 
-            if len(text) < 5:  # Минимальная длина номера
-                continue
 
-            # Проверка формата номера
-            formatted_text = format_license(text)
-            if not license_complies_format(formatted_text):
-                continue
+def read_license_plates(license_plate_crops, mode=None):
+    """Пакетное распознавание номеров: [(plate_text, plate_score), ...] в порядке кропов.
 
-            if score > best_score:
-                best_text = formatted_text
-                best_score = score
+    Кропы распознаются одним вызовом текущего бэкенда OCR (ocr.get_backend()),
+    номер выбирается из кандидатов по грамматике формата.
+    """
+    results = [(None, 0.0)] * len(license_plate_crops)
+    prepared = []
+    indices = []
+    for i, crop in enumerate(license_plate_crops):
+        if crop is None or not crop.size:
+            continue
+        try:
+            # Предварительная обработка изображения
+            prepared.append(preprocess_image(crop))
+            indices.append(i)
+        except Exception as e:
+            logging.error(f"Error preparing plate crop for OCR: {e}")
 
-        return best_text, best_score if best_text else (None, 0.0)
+    if not prepared:
+        return results
 
+    try:
+        candidates = ocr.get_backend().read_batch(prepared, mode or OCR_MODE)
     except Exception as e:
-        logging.error(f"Error in read_license_plate: {e}")
-        return None, 0.0
+        logging.error(f"Error in read_license_plates: {e}")
+        return results
+
+    for i, crop_candidates in zip(indices, candidates):
+        results[i] = plate_grammar.best_plate(crop_candidates)
+    return results
 
 
 def draw_tracking_info(image, car_bbox, plate_text=None, plate_score=None):
@@ -460,51 +441,33 @@ def draw_tracked_plate(image, text, car_bbox, score=0.0):
         logging.error(f"Error drawing tracked plate: {e}")
         return image
 
-def preprocess_image(img):
-    """Улучшенная предобработка изображения"""
-    try:
-        return img
-    except Exception as e:
-        logging.error(f"Error in preprocess_image: {e}")
-        return img
+_POST_PROCESS_TABLE = str.maketrans({
+    'И': 'Н', 'П': 'Н', 'Л': 'Е', 'Ц': '7',
+    'Ч': '9', 'Я': '9', 'З': '3', 'Ш': 'Н',
+    'Ъ': 'Ь', 'Ы': 'М', 'Д': '0',
+    ' ': None, '-': None, '_': None
+})
 
 
 def post_process_license(text):
     """Исправление частых ошибок распознавания"""
-    corrections = {
-        'И': 'Н', 'П': 'Н', 'Л': 'Е', 'Ц': '7',
-        'Ч': '9', 'Я': '9', 'З': '3', 'Ш': 'Н',
-        'Ъ': 'Ь', 'Ы': 'М', 'В': 'В', 'Д': '0',
-        ' ': '', '-': '', '_': ''
-    }
-
-    # Применяем замену символов
-    corrected_text = []
-    for char in text.upper():
-        corrected_text.append(corrections.get(char, char))
-
-    return ''.join(corrected_text)
+    return text.upper().translate(_POST_PROCESS_TABLE)
 
 
 def get_car(license_plate, vehicle_track_ids):
     """Match a license plate to a vehicle in the tracked vehicles list."""
-    x1, y1, x2, y2, score, class_id = license_plate
-    foundIt = False
-
-    for j in range(len(vehicle_track_ids)):
-        xcar1, ycar1, xcar2, ycar2, car_id = vehicle_track_ids[j]
-        if x1 > xcar1 and y1 > ycar1 and x2 < xcar2 and y2 < ycar2:
-            car_indx = j
-            foundIt = True
-            break
-
-    if foundIt:
+    # Как и раньше, номер должен целиком лежать внутри ТС, без ограничения на долю площади
+    car_indx = associate_plates_to_vehicles([license_plate], vehicle_track_ids, max_size_ratio=np.inf,
+                                            containment='full')[0]
+    if car_indx >= 0:
         return vehicle_track_ids[car_indx]
     return -1, -1, -1, -1, -1
 
 
 def insert_car_data(license_plate_text, photo, car_type, date, camera_id):
     """Insert car data into the database with duplicate check."""
+    import mysql.connector
+
     conn = None
     try:
         conn = mysql.connector.connect(**db_config)
@@ -0,0 +1,289 @@
+# file workers.py
+"""Многопроцессный режим: отдельный процесс распознавания на камеру (или группу камер).
+
+Декодированные кадры передаются в процессы через кольцевые буферы в
+multiprocessing.shared_memory без pickle, а обратно приходят компактные записи
+с треками и номерами.
+"""
+
+import logging
+import multiprocessing as mp
+import os
+import queue
+import sys
+import threading
+import time
+from multiprocessing import shared_memory
+
+import cv2
+import numpy as np
+
+logging.basicConfig(level=logging.DEBUG, format='%(asctime)s - %(levelname)s - %(message)s')
+
+# Метаданные слота: seq, время захвата (в микросекундах), высота, ширина, каналы
+_META_FIELDS = 5
+
+
+class FrameRing:
+    """Кольцевой буфер кадров в разделяемой памяти с одним писателем и одним читателем.
+
+    Слот записывается по схеме seqlock: на время копирования seq слота равен -1,
+    после записи - номеру кадра. Читатель проверяет seq до и после копирования.
+    """
+
+    def __init__(self, shm, slots, capacity, owner):
+        self.shm = shm
+        self.slots = slots
+        self.capacity = capacity
+        self.owner = owner
+        meta_bytes = slots * _META_FIELDS * 8
+        self.meta = np.ndarray((slots, _META_FIELDS), dtype=np.int64, buffer=shm.buf[:meta_bytes])
+        self.data = np.ndarray((slots, capacity), dtype=np.uint8, buffer=shm.buf[meta_bytes:])
+        self.seq = 0
+        self._downscale_warned = False
+
+    @classmethod
+    def create(cls, max_frame_shape=(1080, 1920, 3), slots=3):
+        capacity = int(np.prod(max_frame_shape))
+        size = slots * _META_FIELDS * 8 + slots * capacity
+        shm = shared_memory.SharedMemory(create=True, size=size)
+        ring = cls(shm, slots, capacity, owner=True)
+        ring.meta[:] = 0
+        return ring
+
+    @classmethod
+    def attach(cls, spec):
+        name, slots, capacity = spec
+        if sys.version_info >= (3, 13):
+            shm = shared_memory.SharedMemory(name=name, track=False)
+        else:
+            # Процессы spawn делят resource_tracker родителя: регистрация остаётся, сегмент удаляет владелец
+            shm = shared_memory.SharedMemory(name=name)
+        return cls(shm, slots, capacity, owner=False)
+
+    @property
+    def spec(self):
+        return self.shm.name, self.slots, self.capacity
+
+    def write(self, frame, timestamp=None):
+        """Копирует кадр в следующий слот; возвращает номер кадра"""
+        if frame.nbytes > self.capacity:
+            if not self._downscale_warned:
+                logging.warning(f"Frame {frame.shape} exceeds shared memory slot, downscaling")
+                self._downscale_warned = True
+            scale = (self.capacity / frame.nbytes) ** 0.5
+            frame = cv2.resize(frame, (int(frame.shape[1] * scale), int(frame.shape[0] * scale)))
+
+        frame = np.ascontiguousarray(frame, dtype=np.uint8)
+        height, width = frame.shape[:2]
+        channels = frame.shape[2] if frame.ndim == 3 else 1
+
+        self.seq += 1
+        slot = self.seq % self.slots
+        meta = self.meta[slot]
+        meta[0] = -1
+        self.data[slot, :frame.nbytes] = frame.reshape(-1)
+        meta[1] = int((timestamp if timestamp is not None else time.time()) * 1e6)
+        meta[2:] = (height, width, channels)
+        meta[0] = self.seq
+        return self.seq
+
+    def read_latest(self, last_seq=0):
+        """Возвращает (seq, timestamp, кадр) самого свежего кадра новее last_seq или None"""
+        for _ in range(3):
+            seqs = self.meta[:, 0]
+            slot = int(np.argmax(seqs))
+            seq = int(seqs[slot])
+            if seq <= last_seq:
+                return None
+
+            timestamp, height, width, channels = (int(v) for v in self.meta[slot, 1:])
+            nbytes = height * width * channels
+            frame = self.data[slot, :nbytes].copy()
+            if int(self.meta[slot, 0]) != seq:
+                continue  # Писатель перезаписал слот во время копирования
+            shape = (height, width, channels) if channels > 1 else (height, width)
+            return seq, timestamp / 1e6, frame.reshape(shape)
+        return None
+
+    def close(self):
+        self.meta = None
+        self.data = None
+        self.shm.close()
+        if self.owner:
+            self.shm.unlink()
+
+
+def make_record(camera_id, seq, timestamp, result, tracked_plates):
+    """Компактная запись результата для передачи из процесса-воркера"""
+    tracks = np.asarray(result['tracks'], dtype=np.float32).reshape(-1, 5)
+    return {
+        'camera_id': camera_id,
+        'seq': seq,
+        'timestamp': timestamp,
+        'vehicle_boxes': np.asarray(result['vehicle_boxes'], dtype=np.float32).reshape(-1, 5),
+        'tracks': tracks,
+        'plates': result['plates'],
+        'labels': {int(tid): (tracked_plates[tid]['plate_text'], tracked_plates[tid]['plate_score'])
+                   for tid in tracks[:, 4] if tid in tracked_plates},
+    }
+
+
+def apply_releases(control_queue, pipeline):
+    """Освобождает состояние камер, переподключившихся в главном процессе; возвращает их id"""
+    released = []
+    while True:
+        try:
+            camera_id = control_queue.get_nowait()
+        except queue.Empty:
+            return released
+        pipeline.release_camera(camera_id)
+        released.append(camera_id)
+        logging.info(f"Worker {os.getpid()} released state of camera {camera_id}")
+
+
+def camera_worker(ring_specs, result_queue, stop_event, pipeline_options, save_to_db, model_options,
+                  torch_threads, tracker_options=None, control_queue=None):
+    """Точка входа процесса-воркера: свои модели, свой трекер, кадры из разделяемой памяти.
+
+    control_queue - id камер, чьё состояние (трекер, голоса за номера) нужно сбросить после переподключения.
+    """
+    import torch
+    from models import load_models
+    from pipeline import RecognitionPipeline
+    from tracking import TrackerRegistry
+    from util import insert_car_data
+
+    torch.set_num_threads(torch_threads)
+    rings = {camera_id: FrameRing.attach(spec) for camera_id, spec in ring_specs.items()}
+    last_seq = {camera_id: 0 for camera_id in rings}
+
+    pipeline_options = dict(pipeline_options or {})
+    if pipeline_options.pop('ocr_processes', 0):
+        # Демон-процесс не может запускать свои процессы; воркер и так не блокирует главный цикл
+        logging.warning("ocr_processes is ignored in worker processes, OCR runs inline")
+
+    pipeline = None
+    try:
+        coco_model, license_plate_detector = load_models(**(model_options or {}))
+        pipeline = RecognitionPipeline(
+            coco_model, license_plate_detector, TrackerRegistry(**(tracker_options or {})),
+            insert_car_data=insert_car_data if save_to_db else None,
+            **pipeline_options)
+        logging.info(f"Worker {os.getpid()} ready for cameras {list(rings)}")
+
+        while not stop_event.is_set():
+            if control_queue is not None:
+                apply_releases(control_queue, pipeline)
+            # Камеры группы обрабатываются одним пакетом
+            batch = []
+            for camera_id, ring in rings.items():
+                item = ring.read_latest(last_seq[camera_id])
+                if item is None:
+                    continue
+                seq, timestamp, frame = item
+                last_seq[camera_id] = seq
+                batch.append((camera_id, seq, timestamp, frame))
+
+            if not batch:
+                time.sleep(0.002)
+                continue
+
+            try:
+                results = pipeline.process_batch([(camera_id, frame) for camera_id, _, _, frame in batch])
+            except Exception as e:
+                logging.error(f"Worker {os.getpid()} failed on cameras {[item[0] for item in batch]}: {e}")
+                continue
+            for (camera_id, seq, timestamp, _), result in zip(batch, results):
+                result_queue.put(make_record(camera_id, seq, timestamp, result, pipeline.tracked_plates))
+    finally:
+        if pipeline is not None:
+            pipeline.close()
+        for ring in rings.values():
+            ring.close()
+
+
+class WorkerPool:
+    """Процессы распознавания для набора камер, по cameras_per_process камер на процесс"""
+
+    def __init__(self, camera_ids, cameras_per_process=1, pipeline_options=None, save_to_db=True,
+                 model_options=None, max_frame_shape=(1080, 1920, 3), slots=3, tracker_options=None):
+        self.camera_ids = list(camera_ids)
+        self.cameras_per_process = max(1, cameras_per_process)
+        self.pipeline_options = pipeline_options
+        self.save_to_db = save_to_db
+        self.model_options = model_options
+        self.tracker_options = tracker_options
+        self.max_frame_shape = max_frame_shape
+        self.slots = slots
+
+        self._ctx = mp.get_context('spawn')  # fork небезопасен после инициализации torch/OpenCV
+        self.rings = {}
+        self.processes = []
+        self.controls = {}  # {camera_id: очередь управления процесса, который обрабатывает камеру}
+        self.results = None
+        self.stop_event = None
+        self._lock = threading.Lock()
+
+    def start(self):
+        self.results = self._ctx.Queue()
+        self.stop_event = self._ctx.Event()
+        self.rings = {camera_id: FrameRing.create(self.max_frame_shape, self.slots)
+                      for camera_id in self.camera_ids}
+
+        groups = [self.camera_ids[i:i + self.cameras_per_process]
+                  for i in range(0, len(self.camera_ids), self.cameras_per_process)]
+        # Делим ядра между процессами, чтобы пулы потоков torch не конкурировали друг с другом
+        torch_threads = max(1, (os.cpu_count() or 1) // max(1, len(groups)))
+
+        for group in groups:
+            specs = {camera_id: self.rings[camera_id].spec for camera_id in group}
+            control_queue = self._ctx.Queue()
+            self.controls.update((camera_id, control_queue) for camera_id in group)
+            process = self._ctx.Process(
+                target=camera_worker,
+                args=(specs, self.results, self.stop_event, self.pipeline_options, self.save_to_db,
+                      self.model_options, torch_threads, self.tracker_options, control_queue),
+                daemon=True)
+            process.start()
+            self.processes.append(process)
+        logging.info(f"Started {len(self.processes)} worker process(es) for {len(self.camera_ids)} camera(s)")
+        return self
+
+    def submit(self, camera_id, frame, timestamp=None):
+        """Кладёт кадр камеры в её кольцевой буфер; возвращает номер кадра"""
+        with self._lock:
+            return self.rings[camera_id].write(frame, timestamp)
+
+    def release_camera(self, camera_id):
+        """Просит процесс камеры сбросить её трекер и состояние номеров (например, после переподключения)"""
+        control_queue = self.controls.get(camera_id)
+        if control_queue is not None:
+            control_queue.put(camera_id)
+
+    def poll(self, timeout=0.0):
+        """Забирает все готовые записи результатов; ждёт первую не дольше timeout секунд"""
+        records = []
+        try:
+            records.append(self.results.get(timeout=timeout) if timeout else self.results.get_nowait())
+            while True:
+                records.append(self.results.get_nowait())
+        except queue.Empty:
+            pass
+        return records
+
+    def is_alive(self):
+        return any(process.is_alive() for process in self.processes)
+
+    def stop(self):
+        if self.stop_event is not None:
+            self.stop_event.set()
+        for process in self.processes:
+            process.join(timeout=5.0)
+            if process.is_alive():
+                process.terminate()
+        self.processes = []
+        self.controls = {}
+        for ring in self.rings.values():
+            ring.close()
+        self.rings = {}